@@ -1,11 +1,231 @@
 # from https://github.com/latinos/LatinoAnalysis/blob/master/NanoGardener/python/modules/JetSFMaker.py
 
 import os
+import json
+import mmap
+import hashlib
+import struct
+import numpy as np
 import ROOT
 
 from PhysicsTools.NanoAODTools.postprocessing.framework.eventloop import Module
 from PhysicsTools.NanoAODTools.postprocessing.framework.datamodel import Collection 
 
+from treeArrays import readCollection, closeDrawTree
+from collectionCache import cachedCollection
+
+PUIDSF_TABLE_MAGIC = b'PUIDSF02'
+
+
+def load_puid_sf_config(puid_sf_config):
+    #execute data/JetPUID_cfg.py (path relative to $CMSSW_BASE/src) and return its jet_puid_sf dict
+    namespace = {}
+    with open(os.getenv('CMSSW_BASE') + '/src/' + puid_sf_config) as src:
+        exec(src.read(), namespace)
+    return namespace['jet_puid_sf']
+
+
+def default_puid_sf_table(source):
+    #the precompiled table lives next to the ROOT file it was converted from
+    return os.path.splitext(source)[0] + '.puidsf'
+
+
+def file_sha1(filename):
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as src:
+        for chunk in iter(lambda: src.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def failed_puid_weight(sf, eff):
+    #weight of a jet failing the PUID, (1 - sf*eff)/(1 - eff); 1 where the MC
+    #efficiency is 1, since no jet should fail there (as get_weights)
+    return (1.-sf*eff)/(1.-eff) if eff < 1. else 1.
+
+
+class PUIDSFMap(object):
+    #----------------------------------------------------------------------------
+    #NumPy copy of a TH2 scale factor / efficiency map. Bin lookups reproduce
+    #TAxis::FindFixBin, so the values are identical to GetBinContent/GetBinError.
+    #----------------------------------------------------------------------------
+
+    def __init__(self, xaxis, yaxis, contents, errors):
+        #axis = (nbins, xmin, xmax, edges); edges is None for fixed binning
+        self.xaxis = xaxis
+        self.yaxis = yaxis
+        self.contents = contents
+        self.errors = errors
+
+    @staticmethod
+    def axisFromTAxis(axis):
+        nbins = axis.GetNbins()
+        edges = None
+        if axis.GetXbins().GetSize() > 0:
+            edges = np.array([axis.GetBinLowEdge(i) for i in range(1, nbins + 2)], dtype=np.float64)
+        return (nbins, axis.GetXmin(), axis.GetXmax(), edges)
+
+    @classmethod
+    def fromTH2(cls, hist):
+        nx, ny = hist.GetNbinsX(), hist.GetNbinsY()
+        contents = np.zeros((nx + 2, ny + 2), dtype=np.float64)
+        errors = np.zeros((nx + 2, ny + 2), dtype=np.float64)
+        for ix in range(nx + 2):
+            for iy in range(ny + 2):
+                contents[ix, iy] = hist.GetBinContent(ix, iy)
+                errors[ix, iy] = hist.GetBinError(ix, iy)
+        return cls(cls.axisFromTAxis(hist.GetXaxis()), cls.axisFromTAxis(hist.GetYaxis()), contents, errors)
+
+    @staticmethod
+    def findBins(axis, x):
+        """Vectorised TAxis::FindFixBin clamped to [1, nbins], as in get_sf_and_eff."""
+        nbins, xmin, xmax, edges = axis
+        if edges is None:
+            with np.errstate(invalid='ignore'):
+                bins = 1 + np.floor(nbins * (x - xmin) / (xmax - xmin)).astype(np.int64)
+            bins[x < xmin] = 0
+            bins[~(x < xmax)] = nbins + 1
+        else:
+            bins = np.searchsorted(edges, x, side='right')
+            bins[x < xmin] = 0
+            bins[~(x < xmax)] = nbins + 1
+        return np.clip(bins, 1, nbins)
+
+    def lookup(self, pt, eta):
+        ix = self.findBins(self.xaxis, pt)
+        iy = self.findBins(self.yaxis, eta)
+        return self.contents[ix, iy], self.errors[ix, iy]
+
+    #the subset of the TH2 interface used by JetSFMaker.get_sf_and_eff
+    def GetXaxis(self):
+        return PUIDSFAxis(self.xaxis)
+
+    def GetYaxis(self):
+        return PUIDSFAxis(self.yaxis)
+
+    def GetNbinsX(self):
+        return self.xaxis[0]
+
+    def GetNbinsY(self):
+        return self.yaxis[0]
+
+    def GetBinContent(self, ix, iy):
+        return float(self.contents[ix, iy])
+
+    def GetBinError(self, ix, iy):
+        return float(self.errors[ix, iy])
+
+
+class PUIDSFAxis(object):
+    def __init__(self, axis):
+        self.axis = axis
+
+    def FindFixBin(self, x):
+        nbins, xmin, xmax, edges = self.axis
+        if x < xmin:
+            return 0
+        if not x < xmax:
+            return nbins + 1
+        if edges is None:
+            return 1 + int(nbins * (x - xmin) / (xmax - xmin))
+        return int(np.searchsorted(edges, x, side='right'))
+
+
+def write_puid_sf_table(filename, maps, source_sha1):
+    #----------------------------------------------------------------------------
+    #Write {histogram name: PUIDSFMap} as a flat binary table:
+    #  magic (8 bytes) | header length (uint64) | JSON header | float64 data
+    #The header gives the sha1 of the ROOT file the maps were converted from
+    #and, per histogram, the axes and the offsets (in doubles) of the bin
+    #edges, contents and errors inside the data block. Contents and errors are
+    #stored row-major with shape (nbinsx+2, nbinsy+2).
+    #----------------------------------------------------------------------------
+    header = {}
+    blocks = []
+    offset = [0]
+
+    def add(array):
+        array = np.ascontiguousarray(array, dtype='<f8').ravel()
+        blocks.append(array)
+        offset[0] += len(array)
+        return offset[0] - len(array)
+
+    def axis_header(axis):
+        nbins, xmin, xmax, edges = axis
+        return [nbins, xmin, xmax, -1 if edges is None else add(edges)]
+
+    for name in sorted(maps):
+        sfmap = maps[name]
+        header[name] = {'x': axis_header(sfmap.xaxis),
+                        'y': axis_header(sfmap.yaxis),
+                        'contents': add(sfmap.contents),
+                        'errors': add(sfmap.errors)}
+
+    header = json.dumps({'source_sha1': source_sha1, 'maps': header}, sort_keys=True).encode('ascii')
+    #pad so that the data block is 8-byte aligned for np.frombuffer
+    header += b' ' * (-(len(PUIDSF_TABLE_MAGIC) + 8 + len(header)) % 8)
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as out:
+        out.write(PUIDSF_TABLE_MAGIC)
+        out.write(struct.pack('<Q', len(header)))
+        out.write(header)
+        for block in blocks:
+            out.write(block.tobytes())
+    os.rename(tmp, filename)
+
+
+def read_puid_sf_table(filename):
+    #----------------------------------------------------------------------------
+    #Memory-map a table written by write_puid_sf_table and return its maps and
+    #the sha1 of their source file. The arrays of the maps are read-only views
+    #of the mapping, so forked workers share the same pages.
+    #----------------------------------------------------------------------------
+    with open(filename, 'rb') as src:
+        buf = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+    if buf[:len(PUIDSF_TABLE_MAGIC)] != PUIDSF_TABLE_MAGIC:
+        raise IOError('%s is not a PUID scale factor table' % filename)
+    start = len(PUIDSF_TABLE_MAGIC) + 8
+    header_len = struct.unpack('<Q', buf[len(PUIDSF_TABLE_MAGIC):start])[0]
+    header = json.loads(buf[start:start + header_len].decode('ascii'))
+    data = np.frombuffer(buf, dtype='<f8', offset=start + header_len)
+
+    def axis_from_header(axis):
+        nbins, xmin, xmax, edges = axis
+        return (nbins, xmin, xmax, None if edges < 0 else data[edges:edges + nbins + 1])
+
+    maps = {}
+    for name, entry in header['maps'].items():
+        xaxis = axis_from_header(entry['x'])
+        yaxis = axis_from_header(entry['y'])
+        shape = (xaxis[0] + 2, yaxis[0] + 2)
+        size = shape[0] * shape[1]
+        maps[name] = PUIDSFMap(xaxis, yaxis,
+                               data[entry['contents']:entry['contents'] + size].reshape(shape),
+                               data[entry['errors']:entry['errors'] + size].reshape(shape))
+    return maps, header['source_sha1']
+
+
+def usable_puid_sf_table(table, source, names):
+    #the maps of the table, or None if it is missing, was converted from another
+    #version of the source file or lacks some of `names` (the maps are then read
+    #from the ROOT file)
+    if not os.path.isfile(table):
+        return None
+    try:
+        maps, source_sha1 = read_puid_sf_table(table)
+    except IOError as err:
+        print('JetSFMaker: %s, reading the maps from %s' % (err, source))
+        return None
+    if source_sha1 != file_sha1(source):
+        print('JetSFMaker: %s was not converted from the current %s, rerun make_puid_sf_table.py' % (table, source))
+        return None
+    missing = sorted(set(names) - set(maps))
+    if missing:
+        print('JetSFMaker: %s lacks %s, reading the maps from %s' % (table, ', '.join(missing), source))
+        return None
+    return maps
+
+
 class JetSFMaker(Module):
     #----------------------------------------------------------------------------
     #Add branches for Jet PUID scale factors and up/down SF variations (per jet).
@@ -13,14 +233,33 @@ class JetSFMaker(Module):
     #weight. Same for up/down variations (weights).
     #----------------------------------------------------------------------------
 
-    def __init__(self, cmssw, puid_sf_config='PhysicsTools/NanoAODTools/python/postprocessing/analysis/nanoAOD_vvVBS/data/JetPUID_cfg.py'):
+    def __init__(self, cmssw, puid_sf_config='PhysicsTools/NanoAODTools/python/postprocessing/analysis/nanoAOD_vvVBS/data/JetPUID_cfg.py', batchSize=0, puid_sf_table=None):
+        #batchSize > 0: compute the weights of all jets in blocks of batchSize
+        #entries with NumPy instead of per jet through the TH2 objects
+        #puid_sf_table: table written by make_puid_sf_table.py (path relative to
+        #$CMSSW_BASE/src); by default the one next to the configured ROOT file.
+        #It is used if it was converted from the current ROOT file and holds all
+        #the maps of this year, otherwise the maps are read from the ROOT file
+        self.batchSize = batchSize
         cmssw_base = os.getenv('CMSSW_BASE')
-        with open(cmssw_base + '/src/' + puid_sf_config) as src:
-            exec(src)
+        jet_puid_sf = load_puid_sf_config(puid_sf_config)
             
         puid_sf_cfg = jet_puid_sf[cmssw]
 
-        source = ROOT.TFile.Open(cmssw_base + '/src/' + puid_sf_cfg['source'])
+        if puid_sf_table is None:
+            puid_sf_table = default_puid_sf_table(puid_sf_cfg['source'])
+        table = usable_puid_sf_table(cmssw_base + '/src/' + puid_sf_table, cmssw_base + '/src/' + puid_sf_cfg['source'],
+                                     [value for key, value in puid_sf_cfg.items() if key != 'source'])
+        if table is not None:
+            get = lambda name: table[name]
+            source = None
+        else:
+            source = ROOT.TFile.Open(cmssw_base + '/src/' + puid_sf_cfg['source'])
+            def get(name):
+                hist = source.Get(name)
+                hist.SetDirectory(0)
+                return hist
+
         self.sf_maps = {}
         self.sf_uncty_maps = {}
         self.eff_maps = {}
@@ -29,25 +268,49 @@ class JetSFMaker(Module):
                 key = '%s_%s' % (jtype, wp)
                 key_uncty = '%s_%s_uncty' % (jtype, wp)
                 key_eff = '%s_mc_%s' % (jtype, wp)
-                self.sf_maps[key] = source.Get(puid_sf_cfg[key])
-                self.sf_maps[key].SetDirectory(0)
-                self.sf_uncty_maps[key_uncty] = source.Get(puid_sf_cfg[key_uncty])
-                self.sf_uncty_maps[key_uncty].SetDirectory(0)
-                self.eff_maps[key_eff] = source.Get(puid_sf_cfg[key_eff])
-                self.eff_maps[key_eff].SetDirectory(0)
+                self.sf_maps[key] = get(puid_sf_cfg[key])
+                self.sf_uncty_maps[key_uncty] = get(puid_sf_cfg[key_uncty])
+                self.eff_maps[key_eff] = get(puid_sf_cfg[key_eff])
 
-        source.Close()
+        if source:
+            source.Close()
+
+        if self.batchSize > 0:
+            #maps read from the table are already PUIDSFMap objects
+            to_arrays = lambda hist: hist if isinstance(hist, PUIDSFMap) else PUIDSFMap.fromTH2(hist)
+            self.sf_arrays = {}
+            self.sf_uncty_arrays = {}
+            self.eff_arrays = {}
+            for key, hist in self.sf_maps.items():
+                self.sf_arrays[key] = to_arrays(hist)
+            for key, hist in self.sf_uncty_maps.items():
+                self.sf_uncty_arrays[key] = to_arrays(hist)
+            for key, hist in self.eff_maps.items():
+                self.eff_arrays[key] = to_arrays(hist)
 
     def beginFile(self, inputFile, outputFile, inputTree, wrappedOutputTree):
         self.out = wrappedOutputTree
+        self.inputTree = inputTree
+        self._blockFirst = 0
+        self._blockOffsets = np.zeros(1, dtype=np.int64)
+        self._blockWeights = {}
 
         for wp in ['loose', 'medium', 'tight']:
             self.out.branch('Jet_PUIDSF_%s' % wp, 'F', lenVar='nJet')
             self.out.branch('Jet_PUIDSF_%s_up' % wp, 'F', lenVar='nJet')
             self.out.branch('Jet_PUIDSF_%s_down' % wp, 'F', lenVar='nJet')
 
+    def endFile(self, inputFile, outputFile, inputTree, wrappedOutputTree):
+        self.inputTree = None
+        self._blockWeights = {}
+        closeDrawTree()
+
     def analyze(self, event):
-        jets = Collection(event, 'Jet')
+        if self.batchSize > 0:
+            return self.analyzeBatch(event)
+
+        # shared with the other modules of the chain, jet attributes are read once per event
+        jets = cachedCollection(event, 'Jet')
 
         sfs = {'loose': [], 'medium': [], 'tight': []}
         sfs_up = {'loose': [], 'medium': [], 'tight': []}
@@ -79,15 +342,15 @@ class JetSFMaker(Module):
                     puid_upjw   = up
                     puid_downjw = down  
                 else:
-                    puid_jw = (1.-sf*eff)/(1.-eff)
+                    puid_jw = failed_puid_weight(sf, eff)
                     if (jtype == 'real') or (jtype == 'pu' and abs(jet.eta)>=2.5):
                         up   = sf + syst_err + stat_err
                         down = sf - syst_err - stat_err
                     else:
                         up   = 1 + abs(sf-1)
                         down = 1 - abs(sf-1)
-                    puid_upjw   = (1.-up*eff)/(1.-eff)
-                    puid_downjw = (1.-down*eff)/(1.-eff) 
+                    puid_upjw   = failed_puid_weight(up, eff)
+                    puid_downjw = failed_puid_weight(down, eff)
 
                 #store per jet weights and variations
                 sfs[wp].append(puid_jw)
@@ -101,6 +364,54 @@ class JetSFMaker(Module):
 
         return True
 
+    def analyzeBatch(self, event):
+        #the tree entry, independent of any preselection entry list
+        entry = event._tree.GetReadEntry()
+        nBlock = len(self._blockOffsets) - 1
+        if not (self._blockFirst <= entry < self._blockFirst + nBlock):
+            nEntries = min(self.batchSize, self.inputTree.GetEntries() - entry)
+            counts, jets = readCollection(self.inputTree, 'Jet', ['pt', 'eta', 'genJetIdx', 'puId'], entry, nEntries,
+                                          [np.float64, np.float64, np.int64, np.int64])
+            self._blockFirst = entry
+            self._blockOffsets = np.concatenate(([0], np.cumsum(counts)))
+            self._blockWeights = self.get_weights(jets['pt'], jets['eta'], jets['genJetIdx'], jets['puId'])
+
+        i = entry - self._blockFirst
+        begin, end = self._blockOffsets[i], self._blockOffsets[i + 1]
+        for name, weights in self._blockWeights.items():
+            self.out.fillBranch(name, weights[begin:end].tolist())
+
+        return True
+
+    def get_weights(self, pt, eta, genJetIdx, puId):
+        #vectorised version of the loop in analyze, for flat arrays of jets
+        is_pu = (genJetIdx == -1)
+        in_window = ~((pt < 30.) | (pt > 50.) | (np.abs(eta) > 4.7))
+        full_uncty = ~is_pu | (np.abs(eta) >= 2.5)
+
+        weights = {}
+        for iwp, wp in [(2,'loose'), (1,'medium'), (0,'tight')]:
+            sf = np.ones(len(pt))
+            stat_err = np.zeros(len(pt))
+            syst_err = np.zeros(len(pt))
+            eff = np.zeros(len(pt))
+            for jtype, sel in [('real', ~is_pu), ('pu', is_pu)]:
+                sel = sel & in_window
+                sf[sel], stat_err[sel] = self.sf_arrays['%s_%s' % (jtype, wp)].lookup(pt[sel], eta[sel])
+                syst_err[sel] = self.sf_uncty_arrays['%s_%s_uncty' % (jtype, wp)].lookup(pt[sel], eta[sel])[0]
+                eff[sel] = self.eff_arrays['%s_mc_%s' % (jtype, wp)].lookup(pt[sel], eta[sel])[0]
+
+            passed_puid = (puId & (1 << iwp)) != 0
+            up = np.where(full_uncty, sf + syst_err + stat_err, 1 + np.abs(sf-1))
+            down = np.where(full_uncty, sf - syst_err - stat_err, 1 - np.abs(sf-1))
+            #as failed_puid_weight: 1 where the MC efficiency is 1
+            defined = eff < 1.
+            with np.errstate(divide='ignore', invalid='ignore'):
+                weights['Jet_PUIDSF_%s' % wp] = np.where(passed_puid, sf, np.where(defined, (1.-sf*eff)/(1.-eff), 1.))
+                weights['Jet_PUIDSF_%s_up' % wp] = np.where(passed_puid, up, np.where(defined, (1.-up*eff)/(1.-eff), 1.))
+                weights['Jet_PUIDSF_%s_down' % wp] = np.where(passed_puid, down, np.where(defined, (1.-down*eff)/(1.-eff), 1.))
+        return weights
+
     def get_sf_and_eff(self, jtype, wp, jet):
         sf_map = self.sf_maps['%s_%s' % (jtype, wp)]
         sf_uncty_map = self.sf_uncty_maps['%s_%s_uncty' % (jtype, wp)] 
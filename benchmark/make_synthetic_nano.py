@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""Write a local NanoAOD-like file for benchmarking the skim and scale factor modules.
+
+The Events tree has the branches read by wvAnalysisProducer, JetSFMaker and
+the muon scale/resolution and pileup weight producers, with multiplicities
+and kinematics roughly following Run 2 MC: Poisson lepton and jet counts,
+exponentially falling pt spectra, |eta| < 2.4 (leptons) / 4.7 (jets), about
+20% pileup jets (genJetIdx = -1) with a correspondingly lower puId. The Runs
+and LuminosityBlocks trees are filled as in real NanoAOD. A fixed seed makes
+the file reproducible, so benchmark numbers are comparable between runs.
+
+    python benchmark/make_synthetic_nano.py -n 200000 -o synthetic_UL18_nano.root
+"""
+import argparse
+from array import array
+
+import numpy as np
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+MAX_OBJECTS = 64
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--nEvents", default=100000, type=int, help="Number of events")
+    parser.add_argument("-o", "--output", default="synthetic_UL18_nano.root", type=str, help="Output file")
+    parser.add_argument("-s", "--seed", default=12345, type=int, help="Random seed")
+    return parser.parse_args()
+
+
+class BranchBuffers(object):
+    """Fixed-size buffers for scalar and jagged (counter-indexed) branches."""
+    def __init__(self, tree):
+        self.tree = tree
+        self.buffers = {}
+
+    def scalar(self, name, typecode, rootType):
+        self.buffers[name] = array(typecode, [0])
+        self.tree.Branch(name, self.buffers[name], "%s/%s" % (name, rootType))
+
+    def jagged(self, counter, name, typecode, rootType):
+        self.buffers[name] = array(typecode, [0] * MAX_OBJECTS)
+        self.tree.Branch(name, self.buffers[name], "%s[%s]/%s" % (name, counter, rootType))
+
+    def fill(self, name, values):
+        buf = self.buffers[name]
+        for i, value in enumerate(values):
+            buf[i] = value
+
+
+def generateCollection(rng, mean, nEvents):
+    return np.minimum(rng.poisson(mean, nEvents), MAX_OBJECTS)
+
+
+def main():
+    args = parse_arguments()
+    rng = np.random.RandomState(args.seed)
+    n = args.nEvents
+
+    outFile = ROOT.TFile.Open(args.output, "RECREATE", "", 209)
+    events = ROOT.TTree("Events", "Events")
+    b = BranchBuffers(events)
+    b.scalar("run", "I", "i")
+    b.scalar("luminosityBlock", "I", "i")
+    b.scalar("event", "L", "l")
+    b.scalar("Pileup_nTrueInt", "f", "F")
+    b.scalar("Pileup_nPU", "i", "I")
+    for counter, fields in [("nMuon", [("Muon_pt", "f", "F"), ("Muon_eta", "f", "F"), ("Muon_phi", "f", "F"),
+                                       ("Muon_charge", "i", "I"), ("Muon_tightId", "b", "O"),
+                                       ("Muon_nTrackerLayers", "i", "I"), ("Muon_genPartIdx", "i", "I")]),
+                            ("nElectron", [("Electron_pt", "f", "F"), ("Electron_eta", "f", "F"), ("Electron_phi", "f", "F"),
+                                           ("Electron_cutBased", "i", "I")]),
+                            ("nJet", [("Jet_pt", "f", "F"), ("Jet_eta", "f", "F"), ("Jet_phi", "f", "F"), ("Jet_mass", "f", "F"),
+                                      ("Jet_genJetIdx", "i", "I"), ("Jet_puId", "i", "I")]),
+                            ("nFatJet", [("FatJet_pt", "f", "F"), ("FatJet_eta", "f", "F"), ("FatJet_phi", "f", "F")]),
+                            ("nGenPart", [("GenPart_pt", "f", "F"), ("GenPart_eta", "f", "F"), ("GenPart_phi", "f", "F")])]:
+        b.scalar(counter, "I", "i")
+        for name, typecode, rootType in fields:
+            b.jagged(counter, name, typecode, rootType)
+
+    nMuon = generateCollection(rng, 0.8, n)
+    nElectron = generateCollection(rng, 0.7, n)
+    nJet = generateCollection(rng, 4.5, n)
+    nFatJet = generateCollection(rng, 0.6, n)
+    nGenPart = generateCollection(rng, 12., n)
+    lumisPerRun = 200
+    eventsPerLumi = 500
+
+    for i in range(n):
+        b.buffers["run"][0] = 1 + i // (lumisPerRun * eventsPerLumi)
+        b.buffers["luminosityBlock"][0] = 1 + (i // eventsPerLumi) % lumisPerRun
+        b.buffers["event"][0] = i + 1
+        b.buffers["Pileup_nTrueInt"][0] = rng.gamma(8., 4.)
+        b.buffers["Pileup_nPU"][0] = int(b.buffers["Pileup_nTrueInt"][0])
+
+        k = nMuon[i]
+        b.buffers["nMuon"][0] = k
+        b.fill("Muon_pt", np.sort(rng.exponential(20., k) + 3.)[::-1])
+        b.fill("Muon_eta", rng.uniform(-2.4, 2.4, k))
+        b.fill("Muon_phi", rng.uniform(-np.pi, np.pi, k))
+        b.fill("Muon_charge", rng.choice([-1, 1], k))
+        b.fill("Muon_tightId", rng.uniform(size=k) < 0.7)
+        b.fill("Muon_nTrackerLayers", rng.randint(6, 18, k))
+        b.fill("Muon_genPartIdx", np.where(rng.uniform(size=k) < 0.9, rng.randint(0, max(nGenPart[i], 1), k), -1) if nGenPart[i] else [-1] * k)
+
+        k = nElectron[i]
+        b.buffers["nElectron"][0] = k
+        b.fill("Electron_pt", np.sort(rng.exponential(20., k) + 5.)[::-1])
+        b.fill("Electron_eta", rng.uniform(-2.5, 2.5, k))
+        b.fill("Electron_phi", rng.uniform(-np.pi, np.pi, k))
+        b.fill("Electron_cutBased", rng.randint(0, 5, k))
+
+        k = nJet[i]
+        b.buffers["nJet"][0] = k
+        isPU = rng.uniform(size=k) < 0.2
+        b.fill("Jet_pt", np.sort(rng.exponential(30., k) + 15.)[::-1])
+        b.fill("Jet_eta", rng.uniform(-4.7, 4.7, k))
+        b.fill("Jet_phi", rng.uniform(-np.pi, np.pi, k))
+        b.fill("Jet_mass", rng.exponential(8., k))
+        b.fill("Jet_genJetIdx", np.where(isPU, -1, np.arange(k)))
+        b.fill("Jet_puId", np.where(isPU, rng.choice([0, 4, 6], k), rng.choice([4, 6, 7, 7, 7], k)))
+
+        k = nFatJet[i]
+        b.buffers["nFatJet"][0] = k
+        b.fill("FatJet_pt", np.sort(rng.exponential(80., k) + 170.)[::-1])
+        b.fill("FatJet_eta", rng.uniform(-2.4, 2.4, k))
+        b.fill("FatJet_phi", rng.uniform(-np.pi, np.pi, k))
+
+        k = nGenPart[i]
+        b.buffers["nGenPart"][0] = k
+        b.fill("GenPart_pt", rng.exponential(20., k))
+        b.fill("GenPart_eta", rng.uniform(-5., 5., k))
+        b.fill("GenPart_phi", rng.uniform(-np.pi, np.pi, k))
+
+        events.Fill()
+    events.Write()
+
+    runs = ROOT.TTree("Runs", "Runs")
+    r = BranchBuffers(runs)
+    r.scalar("run", "I", "i")
+    r.scalar("genEventCount", "L", "L")
+    r.scalar("genEventSumw", "d", "D")
+    lumis = ROOT.TTree("LuminosityBlocks", "LuminosityBlocks")
+    l = BranchBuffers(lumis)
+    l.scalar("run", "I", "i")
+    l.scalar("luminosityBlock", "I", "i")
+    nLumis = (n + eventsPerLumi - 1) // eventsPerLumi
+    for i in range(nLumis):
+        l.buffers["run"][0] = 1 + i // lumisPerRun
+        l.buffers["luminosityBlock"][0] = 1 + i % lumisPerRun
+        lumis.Fill()
+    for run in range(1, 1 + (nLumis + lumisPerRun - 1) // lumisPerRun):
+        r.buffers["run"][0] = run
+        r.buffers["genEventCount"][0] = min(n - (run - 1) * lumisPerRun * eventsPerLumi, lumisPerRun * eventsPerLumi)
+        r.buffers["genEventSumw"][0] = float(r.buffers["genEventCount"][0])
+        runs.Fill()
+    runs.Write()
+    lumis.Write()
+    outFile.Close()
+    print("Wrote %d events to %s" % (n, args.output))
+
+
+if __name__ == "__main__":
+    main()
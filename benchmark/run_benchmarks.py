@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+"""Throughput benchmarks of the skim and scale factor modules on a synthetic file.
+
+Every case runs in its own process through the PostProcessor, like in
+production, over a file written by make_synthetic_nano.py:
+
+    wv_loop / wv_batch         wvAnalysisProducer, per-event and columnar
+    puid_loop / puid_batch     JetSFMaker, per-jet and batched
+    chain                      post_proc.py module chain (buildModules), no remote input
+
+For each case the total and the module-only (analyze) event rate, the peak
+RSS of the process and, on a shorter tracemalloc run (python3 only), the
+peak of the traced Python memory and the memory blocks (and bytes) allocated
+per event: the blocks allocated during the run and not freed at its end, from
+the difference of the snapshots taken before and after it, divided by the
+number of events. A case that crashes or runs longer than --timeout is
+reported as an error. Results are compared with
+benchmark/baseline.json: a case that is slower than the baseline by more than
+--tolerance, or uses that much more memory, makes the script exit non-zero.
+
+    python benchmark/make_synthetic_nano.py -n 100000 -o synthetic_UL18_nano.root
+    python benchmark/run_benchmarks.py -i synthetic_UL18_nano.root --save-baseline   # once
+    python benchmark/run_benchmarks.py -i synthetic_UL18_nano.root
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import multiprocessing
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+CASES = ["wv_loop", "wv_batch", "puid_loop", "puid_batch", "chain"]
+# seconds between two checks that the process of a case is still alive
+POLL_SECONDS = 10.
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--inputFile", default="synthetic_UL18_nano.root", type=str, help="Synthetic input file")
+    parser.add_argument("-n", "--entries", default=0, type=int, help="Entries per case, 0 for all")
+    parser.add_argument("-c", "--cases", nargs="+", default=CASES, choices=CASES, help="Cases to run")
+    parser.add_argument("--year", default="2018", type=str, help="Year of the PUID scale factors")
+    parser.add_argument("--allocEntries", default=2000, type=int, help="Entries of the tracemalloc run, 0 to skip it")
+    parser.add_argument("--timeout", default=3600., type=float, help="Seconds a case may run")
+    parser.add_argument("--tolerance", default=0.15, type=float, help="Allowed relative slowdown / memory growth")
+    parser.add_argument("--baseline", default=BASELINE, type=str, help="Baseline file")
+    parser.add_argument("--save-baseline", dest="saveBaseline", default=False, action="store_true", help="Store the results as the new baseline")
+    return parser.parse_args()
+
+
+def makeModules(case, args):
+    year = args.year
+    if case == "wv_loop":
+        from wvAnalysisModule import wvAnalysisProducer
+        return [wvAnalysisProducer()]
+    if case == "wv_batch":
+        from wvAnalysisModule import wvAnalysisProducer
+        return [wvAnalysisProducer(batchSize=10000)]
+    if case == "puid_loop":
+        from JetSFMaker import JetSFMaker
+        return [JetSFMaker(year)]
+    if case == "puid_batch":
+        from JetSFMaker import JetSFMaker
+        return [JetSFMaker(year, batchSize=10000)]
+    if case == "chain":
+        import post_proc
+        # jobSettings() takes the year and MC/data from the file name
+        chainArgs = argparse.Namespace(NOsyst=False, friend=False, timing=False, shareCollections=False,
+                                       basketSize=0, autoFlush=0)
+        return post_proc.buildModules(post_proc.jobSettings(args.inputFile), chainArgs)
+    raise ValueError(case)
+
+
+def runCase(case, args, entries, traceAllocations, results):
+    """Run one case in the current (child) process and put its numbers in `results`."""
+    from PhysicsTools.NanoAODTools.postprocessing.framework.postprocessor import PostProcessor
+    from moduleTiming import TimedModule, timingReport
+
+    if traceAllocations:
+        import tracemalloc
+    outputDir = tempfile.mkdtemp(prefix="bench_%s_" % case)
+    try:
+        modules = [TimedModule(m, sampleEvery=1) for m in makeModules(case, args)]
+        if traceAllocations:
+            tracemalloc.start()
+        t0 = time.time()
+        p = PostProcessor(outputDir, [args.inputFile], None, None, modules=modules, provenance=False,
+                          fwkJobReport=False, maxEntries=entries if entries > 0 else None, prefetch=False)
+        if traceAllocations:
+            before = tracemalloc.take_snapshot()
+        p.run()
+        wall = time.time() - t0
+        if traceAllocations:
+            differences = tracemalloc.take_snapshot().compare_to(before, "filename")
+        report = timingReport(modules)
+        nEvents = report[0]["analyze"]["calls"]
+        result = {"events": nEvents, "wall": wall}
+        if traceAllocations:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result["peakTracedBytes"] = peak
+            result["allocBlocksPerEvent"] = float(sum(d.count_diff for d in differences if d.count_diff > 0)) / max(nEvents, 1)
+            result["allocBytesPerEvent"] = float(sum(d.size_diff for d in differences if d.size_diff > 0)) / max(nEvents, 1)
+        else:
+            result["eventsPerSecond"] = nEvents / wall if wall > 0 else 0.
+            moduleWall = sum(entry["analyze"]["wall"] for entry in report)
+            result["moduleEventsPerSecond"] = nEvents / moduleWall if moduleWall > 0 else 0.
+            # ru_maxrss is in kB on Linux
+            result["peakRSSMB"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+        results.put(result)
+    except Exception as err:
+        results.put({"error": "%s: %s" % (err.__class__.__name__, err)})
+    finally:
+        shutil.rmtree(outputDir, ignore_errors=True)
+
+
+def runIsolated(case, args, entries, traceAllocations):
+    # a fresh process per case, so that peak RSS and ROOT state are per case
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=runCase, args=(case, args, entries, traceAllocations, results))
+    process.start()
+    t0 = time.time()
+    while True:
+        try:
+            result = results.get(timeout=POLL_SECONDS)
+            break
+        except Empty:
+            if process.is_alive() and time.time() - t0 < args.timeout:
+                continue
+        if process.is_alive():
+            process.terminate()
+            result = {"error": "no result after %.0f s" % args.timeout}
+        else:
+            try:
+                result = results.get(timeout=1.)
+            except Empty:
+                result = {"error": "process died (exit code %s)" % process.exitcode}
+        break
+    process.join()
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """List of regressions with respect to the baseline."""
+    failures = []
+    for case, result in sorted(results.items()):
+        reference = baseline.get(case)
+        if not reference or "error" in result:
+            continue
+        for key in ("eventsPerSecond", "moduleEventsPerSecond"):
+            if key in reference and result[key] < reference[key] * (1. - tolerance):
+                failures.append("%s: %s %.0f < baseline %.0f" % (case, key, result[key], reference[key]))
+        for key in ("peakRSSMB", "peakTracedBytes", "allocBlocksPerEvent", "allocBytesPerEvent"):
+            if key in reference and key in result and result[key] > reference[key] * (1. + tolerance):
+                failures.append("%s: %s %.1f > baseline %.1f" % (case, key, result[key], reference[key]))
+    return failures
+
+
+def main():
+    args = parse_arguments()
+    if not os.path.isfile(args.inputFile):
+        print("ERROR: %s not found, create it with benchmark/make_synthetic_nano.py" % args.inputFile)
+        exit(1)
+
+    results = {}
+    for case in args.cases:
+        result = runIsolated(case, args, args.entries, False)
+        if "error" not in result and args.allocEntries > 0 and sys.version_info[0] >= 3:
+            allocResult = runIsolated(case, args, args.allocEntries, True)
+            if "error" not in allocResult:
+                for key in ("peakTracedBytes", "allocBlocksPerEvent", "allocBytesPerEvent"):
+                    result[key] = allocResult[key]
+        results[case] = result
+        if "error" in result:
+            print("%-12s ERROR %s" % (case, result["error"]))
+        else:
+            print("%-12s %8d events %10.0f ev/s  module %10.0f ev/s  peak RSS %7.1f MB  traced peak %7.1f MB  "
+                  "alloc %6.1f blocks %8.0f B/event" % (
+                      case, result["events"], result["eventsPerSecond"], result["moduleEventsPerSecond"],
+                      result["peakRSSMB"], result.get("peakTracedBytes", float("nan")) / 1048576.,
+                      result.get("allocBlocksPerEvent", float("nan")), result.get("allocBytesPerEvent", float("nan"))))
+
+    if args.saveBaseline:
+        with open(args.baseline, "w") as out:
+            json.dump(dict((case, r) for case, r in results.items() if "error" not in r), out, indent=2, sort_keys=True)
+        print("Baseline written to %s" % args.baseline)
+        return
+
+    if not os.path.isfile(args.baseline):
+        print("No baseline in %s; run with --save-baseline to store one." % args.baseline)
+        return
+    with open(args.baseline) as src:
+        baseline = json.load(src)
+    failures = compare(results, baseline, args.tolerance)
+    for failure in failures:
+        print("REGRESSION: %s" % failure)
+    if failures or any("error" in r for r in results.values()):
+        exit(1)
+    print("No regression with respect to %s (tolerance %.0f%%)" % (args.baseline, 100 * args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
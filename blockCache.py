@@ -0,0 +1,363 @@
+"""Node-local, size-bounded block cache for remote (xrootd) input files.
+
+Files are read in blocks of `blockSize` bytes. Each block is stored under the
+sha256 of its content (blocks/ab/abcd...), and a per-file index maps block
+numbers to content hashes. The index is keyed by the file identity (LFN and
+size; CMS files never change under the same LFN), so it is shared by every
+redirector serving the file and by all jobs on the node that use the same
+cache directory.
+
+- concurrent readers: index updates and eviction hold an exclusive lock on the
+  cache, and the fetch of a block holds a lock on that block (removed after
+  the fetch), so several jobs that miss the same block download it only once;
+  block files are written to a temporary name and renamed.
+- LRU: a block's mtime is refreshed on every hit. The bytes stored are kept in
+  a usage file updated with every new block, and once they exceed `maxBytes`
+  the least recently used blocks are deleted down to `EVICT_TO` of it; the
+  block directory is only walked then.
+- integrity: a block is checked against its hash on every read (a corrupted
+  block is dropped and fetched again), and a materialized file is checked
+  against the adler32 checksum of the server when it provides one.
+- partial reads: `read(url, offset, length)` fetches only the blocks needed.
+
+`materialize(url, localPath)` writes a whole file for ROOT to open (`copy` is
+the same as a Prefetcher copy function), `stats` counts hits and misses and
+`report()` formats them for the job log.
+`LocalSource` serves root:// URLs from a local directory, standing in for the
+remote server in tests.
+"""
+import os
+import re
+import json
+import time
+import zlib
+import fcntl
+import shutil
+import hashlib
+
+from lumiMask import lfnOf
+
+DEFAULT_BLOCK_SIZE = 16 * 1024 * 1024
+# fraction of maxBytes left after an eviction, so that the next ones are not at every store
+EVICT_TO = 0.9
+
+
+class LocalSource(object):
+    """Serves root://host//path URLs from `rootDir`/path (plain paths as they are)."""
+    def __init__(self, rootDir):
+        self.rootDir = rootDir
+
+    def _path(self, url):
+        match = re.match(r"root://[^/]+/+(.*)", url)
+        return os.path.join(self.rootDir, match.group(1)) if match else url
+
+    def size(self, url):
+        return os.path.getsize(self._path(url))
+
+    def read(self, url, offset, length):
+        with open(self._path(url), "rb") as src:
+            src.seek(offset)
+            return src.read(length)
+
+    def checksum(self, url):
+        return None
+
+
+class XRootDSource(object):
+    """Reads through the XRootD python bindings, one open file per URL."""
+    def __init__(self):
+        from XRootD import client
+        self._client = client
+        self._files = {}
+
+    def _open(self, url):
+        if url not in self._files:
+            f = self._client.File()
+            status, _ = f.open(url)
+            if not status.ok:
+                raise IOError("xrootd open of %s failed: %s" % (url, status.message))
+            self._files[url] = f
+        return self._files[url]
+
+    def size(self, url):
+        status, info = self._open(url).stat()
+        if not status.ok:
+            raise IOError("xrootd stat of %s failed: %s" % (url, status.message))
+        return info.size
+
+    def read(self, url, offset, length):
+        status, data = self._open(url).read(offset, length)
+        if not status.ok:
+            raise IOError("xrootd read of %s failed: %s" % (url, status.message))
+        return data
+
+    def checksum(self, url):
+        """adler32 of the file as reported by the server, None if not available."""
+        match = re.match(r"(root://[^/]+)/(/.*)", url)
+        if not match:
+            return None
+        status, response = self._client.FileSystem(match.group(1)).query(
+            self._client.flags.QueryCode.CHECKSUM, match.group(2))
+        if not status.ok or not response:
+            return None
+        fields = response.decode("utf-8", "replace").split()
+        if len(fields) == 2 and fields[0] == "adler32":
+            return int(fields[1].strip("\x00"), 16)
+        return None
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+
+class _Lock(object):
+    def __init__(self, fileName, remove=False):
+        """`remove`: delete the lock file on release (for locks used only once)."""
+        self.fileName = fileName
+        self.remove = remove
+
+    def __enter__(self):
+        while True:
+            self._fd = os.open(self.fileName, os.O_CREAT | os.O_RDWR, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                # still the lock file: not removed by the holder we waited for
+                if os.stat(self.fileName).st_ino == os.fstat(self._fd).st_ino:
+                    return self
+            except OSError:
+                pass
+            os.close(self._fd)
+
+    def __exit__(self, *exc):
+        if self.remove:
+            os.remove(self.fileName)
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+
+
+class BlockCache(object):
+    def __init__(self, cacheDir, maxBytes, source=None, blockSize=DEFAULT_BLOCK_SIZE):
+        """
+        Arguments:
+            cacheDir {str} -- cache directory, shared by the jobs of a node
+            maxBytes {int} -- size limit of the stored blocks
+            source -- object with size(url), read(url, offset, length) and
+                      checksum(url); XRootDSource by default
+            blockSize {int} -- bytes per block; part of the index key, so caches
+                               with different block sizes do not mix
+        """
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.blockSize = blockSize
+        self.source = source if source is not None else XRootDSource()
+        self.stats = {"hits": 0, "misses": 0, "bytesFromCache": 0, "bytesFromSource": 0,
+                      "evictedBlocks": 0, "corruptBlocks": 0, "fetchTime": 0.}
+        for sub in ("blocks", "index", "locks"):
+            if not os.path.isdir(os.path.join(cacheDir, sub)):
+                try:
+                    os.makedirs(os.path.join(cacheDir, sub))
+                except OSError:
+                    # created by a concurrent job
+                    pass
+        self._sizes = {}
+
+    def _fileKey(self, url):
+        if url not in self._sizes:
+            self._sizes[url] = self.source.size(url)
+        identity = "%s:%d:%d" % (lfnOf(url), self._sizes[url], self.blockSize)
+        return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+    def _blockPath(self, digest):
+        return os.path.join(self.cacheDir, "blocks", digest[:2], digest)
+
+    def _indexPath(self, fileKey):
+        return os.path.join(self.cacheDir, "index", fileKey + ".json")
+
+    def _cacheLock(self):
+        return _Lock(os.path.join(self.cacheDir, "locks", "cache.lock"))
+
+    def _usagePath(self):
+        return os.path.join(self.cacheDir, "usage.json")
+
+    def _addUsage(self, size):
+        """Add `size` bytes to the stored total and return it; called with the cache lock held."""
+        try:
+            with open(self._usagePath()) as src:
+                total = json.load(src)["bytes"]
+        except (IOError, ValueError, KeyError):
+            total = None
+        # no usage file yet (or unreadable): counted from the blocks
+        total = self._blockBytes() if total is None else max(total + size, 0)
+        self._writeUsage(total)
+        return total
+
+    def _writeUsage(self, total):
+        tmpName = "%s.tmp%d" % (self._usagePath(), os.getpid())
+        with open(tmpName, "w") as out:
+            json.dump({"bytes": total}, out)
+        os.rename(tmpName, self._usagePath())
+
+    def _blocks(self):
+        """[(mtime, size, path)] of the stored blocks."""
+        blocks = []
+        blockDir = os.path.join(self.cacheDir, "blocks")
+        for sub in os.listdir(blockDir):
+            for name in os.listdir(os.path.join(blockDir, sub)):
+                if ".tmp" in name:
+                    continue
+                path = os.path.join(blockDir, sub, name)
+                try:
+                    info = os.stat(path)
+                except OSError:
+                    continue
+                blocks.append((info.st_mtime, info.st_size, path))
+        return blocks
+
+    def _blockBytes(self):
+        return sum(size for mtime, size, path in self._blocks())
+
+    def _loadIndex(self, fileKey):
+        try:
+            with open(self._indexPath(fileKey)) as src:
+                return json.load(src)
+        except (IOError, ValueError):
+            return {}
+
+    def _lookup(self, fileKey, block):
+        """Content of a cached block, None if it is missing or corrupted."""
+        digest = self._loadIndex(fileKey).get(str(block))
+        if digest is None:
+            return None
+        path = self._blockPath(digest)
+        try:
+            with open(path, "rb") as src:
+                data = src.read()
+        except IOError:
+            return None
+        if hashlib.sha256(data).hexdigest() != digest:
+            self.stats["corruptBlocks"] += 1
+            with self._cacheLock():
+                if os.path.isfile(path):
+                    os.remove(path)
+                    self._addUsage(-len(data))
+            return None
+        try:
+            # LRU: the mtime is the last use
+            os.utime(path, None)
+        except OSError:
+            pass
+        return data
+
+    def _store(self, fileKey, block, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blockPath(digest)
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                pass
+        tmpName = "%s.tmp%d" % (path, os.getpid())
+        with open(tmpName, "wb") as out:
+            out.write(data)
+        with self._cacheLock():
+            # the same content may be stored already for another file
+            added = 0 if os.path.isfile(path) else len(data)
+            os.rename(tmpName, path)
+            index = self._loadIndex(fileKey)
+            index[str(block)] = digest
+            tmpName = "%s.tmp%d" % (self._indexPath(fileKey), os.getpid())
+            with open(tmpName, "w") as out:
+                json.dump(index, out)
+            os.rename(tmpName, self._indexPath(fileKey))
+            if self._addUsage(added) > self.maxBytes:
+                self._evict()
+
+    def _evict(self):
+        # called with the cache lock held
+        blocks = self._blocks()
+        total = sum(size for mtime, size, path in blocks)
+        # index entries of evicted blocks become misses, they are not rewritten
+        for mtime, size, path in sorted(blocks):
+            if total <= self.maxBytes * EVICT_TO:
+                break
+            os.remove(path)
+            total -= size
+            self.stats["evictedBlocks"] += 1
+        self._writeUsage(total)
+
+    def _block(self, url, fileKey, block):
+        data = self._lookup(fileKey, block)
+        if data is not None:
+            self.stats["hits"] += 1
+            self.stats["bytesFromCache"] += len(data)
+            return data
+        # one fetch per block on the node: the others wait and find it cached
+        with _Lock(os.path.join(self.cacheDir, "locks", "%s-%d.lock" % (fileKey, block)), remove=True):
+            data = self._lookup(fileKey, block)
+            if data is not None:
+                self.stats["hits"] += 1
+                self.stats["bytesFromCache"] += len(data)
+                return data
+            t0 = time.time()
+            offset = block * self.blockSize
+            length = min(self.blockSize, self._sizes[url] - offset)
+            data = self.source.read(url, offset, length)
+            if len(data) != length:
+                raise IOError("short read of %s at %d: %d of %d bytes" % (url, offset, len(data), length))
+            self.stats["fetchTime"] += time.time() - t0
+            self.stats["misses"] += 1
+            self.stats["bytesFromSource"] += len(data)
+            self._store(fileKey, block, data)
+        return data
+
+    def size(self, url):
+        self._fileKey(url)
+        return self._sizes[url]
+
+    def read(self, url, offset, length):
+        """Bytes [offset, offset + length) of the file, through the cache."""
+        fileKey = self._fileKey(url)
+        end = min(offset + length, self._sizes[url])
+        chunks = []
+        for block in range(offset // self.blockSize, (end - 1) // self.blockSize + 1 if end > offset else 0):
+            data = self._block(url, fileKey, block)
+            blockStart = block * self.blockSize
+            chunks.append(data[max(offset - blockStart, 0):end - blockStart])
+        return b"".join(chunks)
+
+    def materialize(self, url, localPath):
+        """Write the whole file to `localPath`, verifying the server checksum if any."""
+        fileKey = self._fileKey(url)
+        size = self._sizes[url]
+        checksum = 1
+        with open(localPath, "wb") as out:
+            for block in range((size + self.blockSize - 1) // self.blockSize):
+                data = self._block(url, fileKey, block)
+                checksum = zlib.adler32(data, checksum)
+                out.write(data)
+        expected = self.source.checksum(url)
+        if expected is not None and (checksum & 0xffffffff) != expected:
+            os.remove(localPath)
+            # some cached block does not match the file on the server
+            with self._cacheLock():
+                if os.path.isfile(self._indexPath(fileKey)):
+                    os.remove(self._indexPath(fileKey))
+            raise IOError("adler32 mismatch for %s: %08x, server %08x" % (url, checksum & 0xffffffff, expected))
+
+    def copy(self, fname, localPath):
+        """Copy function for Prefetcher: remote files through the cache, local ones directly."""
+        if fname.startswith("root://"):
+            self.materialize(fname, localPath)
+        else:
+            shutil.copyfile(fname, localPath)
+
+    def report(self):
+        MB = 1024. * 1024.
+        stats = self.stats
+        requests = stats["hits"] + stats["misses"]
+        return ("BLOCKCACHE: {} block(s) read, {} hit(s) ({:.0f}%), {} miss(es); {:.1f} MB from cache, "
+                "{:.1f} MB from source in {:.1f} s; {} evicted, {} corrupt").format(
+                    requests, stats["hits"], 100. * stats["hits"] / requests if requests else 0., stats["misses"],
+                    stats["bytesFromCache"] / MB, stats["bytesFromSource"] / MB, stats["fetchTime"],
+                    stats["evictedBlocks"], stats["corruptBlocks"])
@@ -0,0 +1,192 @@
+"""Input branch selection derived from the branches the module chain actually reads.
+
+The keep/drop files only select what is written; every input branch stays
+active and its baskets may be read and decompressed. `inputBranchSelection`
+runs the chain over the first entries of a file while recording the branches
+requested through the InputTree (`readBranch`, `arrayReader`, `valueReader`),
+and writes a keep/drop file with those branches, their counters, the branches
+of the cut and the output keep list. Passed as the PostProcessor `branchsel`,
+it disables all other input branches.
+
+During the calibration every module sees every event (rejections are
+ignored), so that branches read only after a selection are recorded too.
+Branches that a module reads outside the InputTree (its own TTreeReader or
+SetBranchAddress) cannot be traced: add them with `extraKeep`.
+
+The selection is cached in BRANCH_CACHE_DIR under a hash of the chain
+configuration, the output keep list, the cut and the input branch names.
+"""
+import os
+import re
+import json
+import shutil
+import hashlib
+import tempfile
+
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+from PhysicsTools.NanoAODTools.postprocessing.framework.postprocessor import PostProcessor
+from PhysicsTools.NanoAODTools.postprocessing.framework.treeReaderArrayTools import InputTree
+
+BRANCH_CACHE_DIR = ".branch_pruning_cache"
+ALWAYS_KEEP = ["run", "luminosityBlock", "event"]
+
+
+class _AcceptAll(object):
+    """Calibration wrapper: run the module, ignore its decision (and failures)."""
+    def __init__(self, module):
+        self.__dict__["_module"] = module
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._module, name, value)
+
+    def analyze(self, event):
+        try:
+            self._module.analyze(event)
+        except Exception:
+            pass
+        return True
+
+
+def _traced(method, branches):
+    def traced(self, branchName, *args, **kwargs):
+        branches.add(branchName)
+        return method(self, branchName, *args, **kwargs)
+    return traced
+
+
+def _traceReads(branches):
+    """Patch InputTree so that requested branch names go into `branches`.
+
+    Returns:
+        function -- restores the original methods
+    """
+    originals = {}
+    for name in ("readBranch", "arrayReader", "valueReader"):
+        method = getattr(InputTree, name, None)
+        if method is None:
+            continue
+        originals[name] = method
+        setattr(InputTree, name, _traced(method, branches))
+
+    def restore():
+        for name, method in originals.items():
+            setattr(InputTree, name, method)
+    return restore
+
+
+def branchNames(tree):
+    return [b.GetName() for b in tree.GetListOfBranches()]
+
+
+def counterBranches(tree, names):
+    """Counter branches (e.g. nJet) of the array branches in `names`."""
+    counters = set()
+    for name in names:
+        leaf = tree.GetLeaf(name)
+        if leaf and leaf.GetLeafCount():
+            counters.add(leaf.GetLeafCount().GetName())
+    return counters
+
+
+def formulaBranches(formula, available):
+    """Branch names appearing in a TTreeFormula expression."""
+    if not formula:
+        return set()
+    return set(token for token in re.findall(r"[A-Za-z_][A-Za-z0-9_]*", formula) if token in available)
+
+
+def keepStatements(keepDropFile):
+    """`keep` lines of an output keep/drop file, comments removed."""
+    if not keepDropFile:
+        return []
+    statements = []
+    with open(keepDropFile) as src:
+        for line in src:
+            line = line.split("#")[0].strip()
+            if line.startswith("keep"):
+                statements.append(line)
+    return statements
+
+
+def selectionKey(configuration, outputKeepFile, cut, inputBranches, extraKeep):
+    digest = hashlib.sha1()
+    digest.update(json.dumps([configuration, keepStatements(outputKeepFile), cut or "",
+                              sorted(inputBranches), sorted(extraKeep)], sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def traceChainReads(inputFile, makeModules, nEntries, options):
+    """Branches read by the module chain over the first `nEntries` entries of `inputFile`."""
+    branches = set()
+    outputDir = tempfile.mkdtemp(prefix="branch_calibration_")
+    restore = _traceReads(branches)
+    try:
+        modules = [_AcceptAll(m) for m in makeModules()]
+        calibrationOptions = dict((key, value) for key, value in options.items()
+                                  if key in ("friend", "jsonInput", "postfix", "compression"))
+        p = PostProcessor(outputDir, [inputFile], modules=modules, maxEntries=nEntries, provenance=False,
+                          fwkJobReport=False, haddFileName=None, prefetch=False, **calibrationOptions)
+        p.run()
+    finally:
+        restore()
+        shutil.rmtree(outputDir, ignore_errors=True)
+    return branches
+
+
+def inputBranchSelection(inputFile, makeModules, configuration, options, nEntries=2000, extraKeep=(),
+                         cacheDir=BRANCH_CACHE_DIR):
+    """Keep/drop file activating only the input branches the job needs.
+
+    Arguments:
+        inputFile {str} -- a file of the job, used for the calibration pass
+        makeModules {callable} -- builds a fresh module chain
+        configuration -- JSON-serialisable description of the chain (cache key)
+        options {dict} -- PostProcessor options of the job (cut, outputbranchsel, ...)
+        nEntries {int} -- entries of the calibration pass
+        extraKeep {list} -- additional keep patterns, for reads that cannot be traced
+
+    Returns:
+        str -- path of the keep/drop file, for PostProcessor(branchsel=...)
+    """
+    inFile = ROOT.TFile.Open(inputFile)
+    if not inFile or inFile.IsZombie():
+        raise IOError("Cannot open %s" % inputFile)
+    tree = inFile.Get("Events")
+    available = set(branchNames(tree))
+
+    outputKeepFile = options.get("outputbranchsel")
+    cut = options.get("cut")
+    key = selectionKey(configuration, outputKeepFile, cut, available, list(extraKeep))
+    selectionFile = os.path.join(cacheDir, "input_branches_%s.txt" % key)
+    if os.path.isfile(selectionFile):
+        inFile.Close()
+        print("Input branch selection from cache: %s" % selectionFile)
+        return selectionFile
+
+    read = traceChainReads(inputFile, makeModules, nEntries, options) & available
+    read |= formulaBranches(cut, available)
+    read |= set(name for name in ALWAYS_KEEP if name in available)
+    read |= counterBranches(tree, read)
+    inFile.Close()
+
+    if not os.path.isdir(cacheDir):
+        os.makedirs(cacheDir)
+    tmpName = selectionFile + ".tmp%d" % os.getpid()
+    with open(tmpName, "w") as out:
+        out.write("# input branches of the module chain, generated by branchPruning.py\n")
+        out.write("drop *\n")
+        for statement in keepStatements(outputKeepFile):
+            out.write("%s\n" % statement)
+        for pattern in extraKeep:
+            out.write("keep %s\n" % pattern)
+        for name in sorted(read):
+            out.write("keep %s\n" % name)
+    os.rename(tmpName, selectionFile)
+    print("Input branch selection: %d of %d branches read by the modules, written to %s" % (
+        len(read), len(available), selectionFile))
+    return selectionFile
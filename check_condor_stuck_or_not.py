@@ -1,44 +1,189 @@
+"""Monitor the running condor jobs and kill the stuck ones.
+
+Every sweep lists the running jobs with condor_q and runs condor_tail on all
+of them concurrently (a bounded pool of `--workers`). condor_tail always
+returns the end of the stdout, so the end of what was seen at the previous
+sweep (kept per job in the state file, with the number of bytes seen) is
+looked up in it, and only the output after it is scanned. For each job:
+
+- error: a known error string (XRootD read errors, ...) in the new output;
+  the job is killed
+- stalled: no new processed entries for `--stallMinutes`; the job is killed
+  only with --killStalled
+- the event throughput is the increase of the processed entries between two
+  sweeps; the eventloop prints "Processed N/M entries" counting from 0 again
+  for each input file, so the entries of the finished files are added up
+
+The states are keyed on the GlobalJobId (schedd, cluster.proc and submission
+time): cluster.proc alone repeats between schedds.
+
+    python check_condor_stuck_or_not.py -u rasharma
+    python check_condor_stuck_or_not.py -u rasharma --every 10 --stallMinutes 30 --killStalled
+
+condor_q, condor_tail and condor_rm can be replaced (--condorQ, ...), e.g. by
+stub scripts in tests.
+"""
 import os
+import re
 import sys
+import json
+import time
+import argparse
+import subprocess
+from multiprocessing.pool import ThreadPool
 
 sys.path.append("Utils/python_utils/.")
 from color_style import style
 
-output = os.popen('condor_q -submitter rasharma').read()
-
 error_check_string = [ 'Server responded with an error',
                        'The remote file is not open',
                        'Error in <TNetXNGFile::ReadBuffer>']
 
-#Oprint output.split("\t")
-lpcschedd = ""
-print type(output)
-for outputs in output.split('\n'):
-  #print outputs
-  if outputs.find('Submitter') != -1:
-    lpcschedd = outputs.split()[2].split('.')[0]
-  if outputs.find('rasharma') != -1 and outputs.split()[5] == 'R':
-    """This if condition checks the username and if the job is in
-    Running (R) condition.
-    """
-    condor_tail = "condor_tail "+outputs.split()[0]+" -name "+lpcschedd
-
-    print "\n","-"*51,"\n\n"
-    print(style.GREEN + outputs+style.RESET+"\n\n")
-    print "COMMAND: ",condor_tail
-    print "\n"
-    # os.system(condor_tail)
-    output = os.popen(condor_tail).read()
-
-    foundOrNot = any(match in output for match in error_check_string)
-
-    if foundOrNot:
-        print output
-        print(style.RED + "ERROR: Going to kill this job" + style.RESET)
-        killCommand = "condor_rm "+outputs.split()[0]+" -name "+lpcschedd
-        print(style.RED + "Running Command: " + killCommand + style.RESET)
-        os.system(killCommand)
-        print(style.RED + "Successfully killed." + style.RESET)
-    else:
-        print output
-print "\n\n"
+PROGRESS = re.compile(r"Processed\s+(\d+)\s*/\s*(\d+) entries")
+ANCHOR_BYTES = 256
+
+
+def runningJobs(condorQ, user):
+    """[(GlobalJobId, job id, schedd)] of the running jobs of `user`."""
+    output = subprocess.check_output([condorQ, "-submitter", user, "-constraint", "JobStatus == 2",
+                                      "-af", "GlobalJobId"]).decode("utf-8", "replace")
+    jobs = []
+    for line in output.split():
+        # lpcschedd3.fnal.gov#1234567.0#1596000000
+        fields = line.split("#")
+        if len(fields) == 3:
+            jobs.append((line, fields[1], fields[0]))
+    return jobs
+
+
+def newOutput(tail, state):
+    """Part of `tail` after what was seen before, and whether some output was skipped."""
+    anchor = state.get("anchor", "")
+    if not anchor:
+        return tail, False
+    position = tail.rfind(anchor)
+    if position < 0:
+        # more new output than one condor_tail window
+        return tail, True
+    return tail[position + len(anchor):], False
+
+
+def updateProgress(state, progress):
+    """Entries processed in all the input files so far, from the (N, M) of the
+    new "Processed N/M entries" lines: a lower N or another M starts a new file."""
+    for processed, total in progress:
+        processed, total = int(processed), int(total)
+        if "fileEvents" in state and (processed < state["fileEvents"] or total != state["fileTotal"]):
+            state["doneEvents"] = state.get("doneEvents", 0) + state["fileTotal"]
+            state["files"] = state.get("files", 1) + 1
+        state["fileEvents"], state["fileTotal"] = processed, total
+    return state.get("doneEvents", 0) + state["fileEvents"]
+
+
+def checkJob(tail, state, now, stallSeconds):
+    """Update the state of one job from its tail, and return its status."""
+    new, gap = newOutput(tail, state)
+    state["bytes"] = state.get("bytes", 0) + len(new)
+    if new:
+        state["anchor"] = tail[-ANCHOR_BYTES:]
+    progress = PROGRESS.findall(new)
+    if progress:
+        events = updateProgress(state, progress)
+        if events != state.get("events"):
+            if state.get("events") is not None and now > state["progressTime"]:
+                state["rate"] = (events - state["events"]) / (now - state["progressTime"])
+            state["events"] = events
+            state["progressTime"] = now
+    state.setdefault("progressTime", now)
+    state.setdefault("firstSeen", now)
+    errors = [match for match in error_check_string if match in new]
+    if errors:
+        return "error", errors
+    if now - state["progressTime"] > stallSeconds:
+        return "stalled", ["no progress for %.0f min" % ((now - state["progressTime"]) / 60.)]
+    return "ok", ["output skipped"] if gap else []
+
+
+def sweep(args, states):
+    now = time.time()
+    jobs = runningJobs(args.condorQ, args.user)
+
+    def tail(job):
+        globalId, jobId, schedd = job
+        try:
+            output = subprocess.check_output([args.condorTail, "-maxbytes", str(args.maxBytes), jobId, "-name", schedd])
+            return output.decode("utf-8", "replace"), None
+        except (OSError, subprocess.CalledProcessError) as err:
+            return None, str(err)
+    pool = ThreadPool(max(1, min(args.workers, len(jobs))))
+    try:
+        tails = pool.map(tail, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+    running = set(globalId for globalId, jobId, schedd in jobs)
+    for globalId in list(states):
+        if globalId not in running:
+            del states[globalId]
+    counts = {"ok": 0, "error": 0, "stalled": 0, "failed": 0}
+    for (globalId, jobId, schedd), (output, error) in zip(jobs, tails):
+        if output is None:
+            counts["failed"] += 1
+            print(style.RED + "condor_tail failed for %s: %s" % (globalId, error) + style.RESET)
+            continue
+        state = states.setdefault(globalId, {})
+        status, reasons = checkJob(output, state, now, args.stallMinutes * 60.)
+        counts[status] += 1
+        line = "%-14s %-24s %10s entries (file %d: %s/%s) %8.1f ev/s  %s" % (
+            jobId, schedd, state.get("events", "-"), state.get("files", 1), state.get("fileEvents", "-"),
+            state.get("fileTotal", "-"), state.get("rate", 0.), ", ".join(reasons))
+        if status == "ok":
+            if args.verbose:
+                print(line)
+            continue
+        print(style.RED + status.upper() + ": " + line + style.RESET)
+        if status == "error" or args.killStalled:
+            killCommand = [args.condorRm, jobId, "-name", schedd]
+            print(style.RED + "Running Command: " + " ".join(killCommand) + style.RESET)
+            if subprocess.call(killCommand) == 0:
+                print(style.RED + "Successfully killed." + style.RESET)
+                del states[globalId]
+    rates = [state["rate"] for state in states.values() if "rate" in state]
+    print(style.GREEN + "%s: %d running job(s): %d ok, %d error, %d stalled, %d tail failed; %.0f events/s in total (%.2f s)" % (
+        time.strftime("%H:%M:%S"), len(jobs), counts["ok"], counts["error"], counts["stalled"], counts["failed"],
+        sum(rates), time.time() - now) + style.RESET)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kill the condor jobs stuck on read errors, report the stalled ones")
+    parser.add_argument("-u", "--user", default="rasharma", type=str, help="Submitter")
+    parser.add_argument("--workers", default=16, type=int, help="condor_tail run at the same time")
+    parser.add_argument("--maxBytes", default=65536, type=int, help="Bytes of stdout read by condor_tail")
+    parser.add_argument("--stallMinutes", default=30., type=float, help="Minutes without progress for a stalled job")
+    parser.add_argument("--killStalled", default=False, action="store_true", help="Also kill the stalled jobs")
+    parser.add_argument("--every", default=0., type=float, help="Minutes between sweeps, 0 for a single sweep")
+    parser.add_argument("--stateFile", default="condor_monitor_state.json", type=str, help="Per-job state kept between sweeps")
+    parser.add_argument("--condorQ", default="condor_q", type=str)
+    parser.add_argument("--condorTail", default="condor_tail", type=str)
+    parser.add_argument("--condorRm", default="condor_rm", type=str)
+    parser.add_argument("-v", "--verbose", default=False, action="store_true", help="Print the jobs without problems too")
+    args = parser.parse_args()
+
+    states = {}
+    if os.path.isfile(args.stateFile):
+        with open(args.stateFile) as src:
+            states = json.load(src)
+    while True:
+        sweep(args, states)
+        tmpName = args.stateFile + ".tmp"
+        with open(tmpName, "w") as out:
+            json.dump(states, out)
+        os.rename(tmpName, args.stateFile)
+        if args.every <= 0:
+            break
+        time.sleep(args.every * 60.)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 import os,sys
 
+import fileListing
+
 year_campaign_dict = {
 "v5_2016_campaign" : ["RunIISummer16NanoAODv5-*_Nano1June2019_102X_mcRun2_asymptotic_v7-v*", "Run2016*-Nano25Oct2019*-v*"],
 "v6_2016_campaign" : ["RunIISummer16NanoAODv6-*","Run2016*-Nano25Oct2019*-v*"],
@@ -23,36 +25,52 @@ print CommandToRun
 os.system(CommandToRun)
 print "="*51
 with open('samples.dat') as in_file:
-  count = 0
-  outjdl_file = open("sample_list_"+campaign_to_run+".dat","w")
-  #outjdl_file = open("input_data_Files/sample_list_"+campaign_to_run+".dat","w")
-  for lines in in_file:
-     if lines[0] == "#":
-       outjdl_file.write(lines)
-       continue
-     #if count > 27: break
-     count = count +1
-     print "="*51,"\n"
-     print "==>  Sample : ",count
-     print "==> line : ",lines
-     sample_name = lines.split('/')[1]
-     campaign = lines.split('/')[2]
-     tier = lines.split('/')[3]
-     #campaign = lines.split('/')[2].split('-')[0]
-     print "==> DAS = ",lines
-     print "==> sample_name = ",sample_name
-     print "==> campaign = ",campaign
-     print "==> campaign = ",tier
-     if sample_name.find("SingleMuon") != -1 or sample_name.find("EGamma") != -1 or sample_name.find("SingleElectron") !=-1 or sample_name.find("DoubleEG") != -1 or sample_name.find("DoubleMuon") != -1 or sample_name.find("MuonEG") != -1:
-       v6_ntuples = "/"+sample_name+"/"+year_campaign_dict[campaign_to_run][1]+"/"+tier
-     else:
-       v6_ntuples = "/"+sample_name+"/"+year_campaign_dict[campaign_to_run][0]+"/"+tier
-     #output = os.popen('dasgoclient --query="dataset='+lines.strip()+'"').read()
-     print 'dasgoclient --query="dataset='+v6_ntuples.strip()+'"'
-     output = os.popen('dasgoclient --query="dataset='+v6_ntuples.strip()+'"').read()
-     print "output : ",output,"\n",type(output)," : ",len(output)
-     if len(output.strip()) == 0:
-        outjdl_file.write("# NOT FOUND: "+v6_ntuples.strip()+"\n")
-     else:
-        outjdl_file.write(output.strip()+"\n")
-  outjdl_file.close()
+  sample_lines = in_file.readlines()
+
+# One DAS query per sample, run concurrently and cached in .das_cache/
+queries = []
+for lines in sample_lines:
+   if lines[0] == "#": continue
+   sample_name = lines.split('/')[1]
+   tier = lines.split('/')[3]
+   if sample_name.find("SingleMuon") != -1 or sample_name.find("EGamma") != -1 or sample_name.find("SingleElectron") !=-1 or sample_name.find("DoubleEG") != -1 or sample_name.find("DoubleMuon") != -1 or sample_name.find("MuonEG") != -1:
+     v6_ntuples = "/"+sample_name+"/"+year_campaign_dict[campaign_to_run][1]+"/"+tier
+   else:
+     v6_ntuples = "/"+sample_name+"/"+year_campaign_dict[campaign_to_run][0]+"/"+tier
+   queries.append("dataset="+v6_ntuples.strip())
+lister = fileListing.FileLister()
+answers = iter(lister.queryMany(queries))
+print lister.report()
+
+count = 0
+outjdl_file = open("sample_list_"+campaign_to_run+".dat","w")
+#outjdl_file = open("input_data_Files/sample_list_"+campaign_to_run+".dat","w")
+for lines in sample_lines:
+   if lines[0] == "#":
+     outjdl_file.write(lines)
+     continue
+   #if count > 27: break
+   query = queries[count]
+   datasets, error = next(answers)
+   count = count +1
+   print "="*51,"\n"
+   print "==>  Sample : ",count
+   print "==> line : ",lines
+   sample_name = lines.split('/')[1]
+   campaign = lines.split('/')[2]
+   tier = lines.split('/')[3]
+   #campaign = lines.split('/')[2].split('-')[0]
+   print "==> DAS = ",lines
+   print "==> sample_name = ",sample_name
+   print "==> campaign = ",campaign
+   print "==> campaign = ",tier
+   print 'dasgoclient --query="'+query+'"'
+   if error:
+      print "ERROR: ",error
+      outjdl_file.write("# QUERY FAILED: "+query.replace("dataset=","")+"\n")
+   elif len(datasets) == 0:
+      outjdl_file.write("# NOT FOUND: "+query.replace("dataset=","")+"\n")
+   else:
+      print "output : ",datasets
+      outjdl_file.write("\n".join(datasets)+"\n")
+outjdl_file.close()
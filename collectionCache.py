@@ -0,0 +1,79 @@
+"""Per-event cache of materialized collections, shared by all modules of a chain.
+
+The eventloop passes the same Event object to every module, so collections
+stored on it are built once per event instead of once per module:
+
+    jets = cachedCollection(event, "Jet")          # drop-in for Collection(event, "Jet")
+
+A cached collection is rebuilt when an upstream module overrides one of its
+branches through the input tree's extra branches (e.g. a corrected Jet_pt).
+Modules that assign attributes on the shared objects must call
+`invalidateCollection(event, prefix)` afterwards, or work on their own
+`Collection`.
+
+`shareCollections()` makes framework modules (JME correctors, btag SF) use the
+cache as well, by replacing the `Collection` they imported.
+"""
+import importlib
+
+from PhysicsTools.NanoAODTools.postprocessing.framework.datamodel import Collection
+
+# framework modules that build collections with a module-level `Collection`
+SHARED_FRAMEWORK_MODULES = [
+    "PhysicsTools.NanoAODTools.postprocessing.modules.jme.jetmetUncertainties",
+    "PhysicsTools.NanoAODTools.postprocessing.modules.jme.fatJetUncertainties",
+    "PhysicsTools.NanoAODTools.postprocessing.modules.btv.btagSFProducer",
+]
+
+
+def _overrideSignature(event, prefix):
+    # identity of the extra (override) branches belonging to this collection
+    extra = getattr(event._tree, "_extrabranches", None)
+    if not extra:
+        return ()
+    counter = "n" + prefix
+    return tuple(sorted((name, id(value)) for name, value in extra.items()
+                        if name == counter or name.startswith(prefix + "_")))
+
+
+def _cacheEntry(event, prefix, lenVar):
+    cache = event.__dict__.setdefault("_collectionCache", {})
+    signature = _overrideSignature(event, prefix)
+    entry = cache.get((prefix, lenVar))
+    if entry is None or entry["signature"] != signature:
+        entry = {"signature": signature, "collection": Collection(event, prefix, lenVar)}
+        cache[(prefix, lenVar)] = entry
+    return entry
+
+
+def cachedCollection(event, prefix, lenVar=None):
+    """Same as Collection(event, prefix, lenVar), built once per event."""
+    return _cacheEntry(event, prefix, lenVar)["collection"]
+
+
+def invalidateCollection(event, prefix=None):
+    """Drop the cached collection `prefix` (all collections if None) of this event."""
+    cache = event.__dict__.get("_collectionCache")
+    if not cache:
+        return
+    for key in list(cache):
+        if prefix is None or key[0] == prefix:
+            del cache[key]
+
+
+def shareCollections(moduleNames=SHARED_FRAMEWORK_MODULES):
+    """Make the given python modules build their collections through the cache.
+
+    Returns:
+        list -- names of the modules that were patched
+    """
+    patched = []
+    for name in moduleNames:
+        try:
+            module = importlib.import_module(name)
+        except ImportError:
+            continue
+        if getattr(module, "Collection", None) is Collection:
+            module.Collection = cachedCollection
+            patched.append(name)
+    return patched
@@ -0,0 +1,165 @@
+"""DAG mode of condor_setup.py: one DAGMan workflow for a whole campaign.
+
+Each sample is one DAG node: a compact submit file (the common settings once,
+then `queue JobList,OutputDir from <items>`, one line per job) with
+`max_materialize` capping the jobs of the sample in the queue at the same
+time, to protect EOS. After the node, the POST script (`python condorDag.py
+post ...`) classifies the jobs from their logs (see condor_resubmit.classify):
+
+- all ok: exit 0
+- only transient failures (`TRANSIENT_CLASSES`: XRootD errors, stage-out
+  failures, aborted or vanished jobs): exit 1, DAGMan retries the node
+- any other failure: exit `PERMANENT_FAILURE`, not retried (RETRY ... UNLESS-EXIT)
+
+A retried node submits all the jobs of the sample again; the jobs of a retry
+($(RETRY) > 0) whose output is already stored exit at once. With a merge
+script, a merge node per sample merges the outputs of the current jobs of the
+sample (`mergeInputs`, listed in a file transferred with the merge job) once
+all its jobs succeeded; other files of the output directory are never merged.
+
+    condor_submit_dag submit_condor_jobs_lnujj_X.dag
+"""
+import os
+import sys
+
+from condor_resubmit import classify, ALREADY_DONE_SIGNATURE
+
+TRANSIENT_EXIT_CODE = 85
+TRANSIENT_CLASSES = ("xrootd", "aborted", "no-log", "no-output", "exit-%d" % TRANSIENT_EXIT_CODE)
+PERMANENT_FAILURE = 2
+
+HEADER = ["Universe = vanilla",
+          "Notification = ERROR",
+          "Should_Transfer_Files = YES",
+          "WhenToTransferOutput = ON_EXIT",
+          "x509userproxy = $ENV(X509_USER_PROXY)"]
+
+
+def logFiles(logDir, node, jobList):
+    """(stdout, condor log) of the job of `jobList` in the node."""
+    name = "%s_%s" % (node, os.path.splitext(os.path.basename(jobList))[0])
+    return os.path.join(logDir, name + ".stdout"), os.path.join(logDir, name + ".log")
+
+
+class CondorDag(object):
+    def __init__(self, fileName, executable, transferInputFiles, logDir, initialPath, submitDir,
+                 maxJobsPerSample=0, maxSamples=0, retries=3, mergeExecutable=None, maxMerges=2):
+        """
+        Arguments:
+            fileName {str} -- .dag file
+            executable {str} -- job script, called with the job list, output
+                                directory, initial path and retry number
+            transferInputFiles {str} -- files transferred with every job
+            logDir {str} -- directory of the job logs
+            initialPath {str} -- EOS area of the tarball
+            submitDir {str} -- directory of the submit and items files
+            maxJobsPerSample {int} -- max_materialize of each sample, 0 for no cap
+            maxSamples {int} -- sample nodes running at the same time, 0 for no cap
+            retries {int} -- retries of a sample with transient failures
+            mergeExecutable {str} -- merge script, called with the output directory,
+                                     the sample and the list of outputs to merge;
+                                     None for no merge nodes
+            maxMerges {int} -- merge nodes running at the same time
+        """
+        self.fileName = fileName
+        self.executable = executable
+        self.transferInputFiles = transferInputFiles
+        self.logDir = logDir
+        self.initialPath = initialPath
+        self.submitDir = submitDir
+        self.maxJobsPerSample = maxJobsPerSample
+        self.maxSamples = maxSamples
+        self.retries = retries
+        self.mergeExecutable = mergeExecutable
+        self.maxMerges = maxMerges
+        self.lines = []
+        if not os.path.isdir(submitDir):
+            os.makedirs(submitDir)
+
+    def addSample(self, node, jobLists, outputDir, mergeInputs=()):
+        """Add the node of a sample (`node` unique in the DAG) running `jobLists`;
+        `mergeInputs` are the URLs of the outputs its merge node merges."""
+        itemsFile = os.path.join(self.submitDir, node + ".items")
+        with open(itemsFile, "w") as out:
+            for jobList in jobLists:
+                out.write("%s,%s\n" % (jobList, outputDir))
+        stdout, condorLog = logFiles(self.logDir, node, "$Fn(JobList)")
+        submitFile = os.path.join(self.submitDir, node + ".sub")
+        with open(submitFile, "w") as out:
+            out.write("Executable = %s\n" % self.executable)
+            out.write("\n".join(HEADER) + "\n")
+            out.write("Output = %s\nError  = %s\nLog  = %s\n" % (stdout, stdout, condorLog))
+            out.write("Transfer_Input_Files = %s, $(JobList)\n" % self.transferInputFiles)
+            out.write("Arguments = $Fnx(JobList) $(OutputDir) %s $(retry)\n" % self.initialPath)
+            if self.maxJobsPerSample > 0:
+                out.write("max_materialize = %d\n" % self.maxJobsPerSample)
+            out.write("queue JobList,OutputDir from %s\n" % itemsFile)
+
+        self.lines += ["",
+                       "JOB %s %s" % (node, submitFile),
+                       'VARS %s retry="$(RETRY)"' % node,
+                       "CATEGORY %s samples" % node,
+                       "SCRIPT POST %s /usr/bin/env python condorDag.py post %s %s %s $RETURN" % (
+                           node, itemsFile, self.logDir, node),
+                       "RETRY %s %d UNLESS-EXIT %d" % (node, self.retries, PERMANENT_FAILURE)]
+        if self.mergeExecutable:
+            mergeNode = node + "_merge"
+            mergeList = os.path.join(self.submitDir, mergeNode + ".txt")
+            with open(mergeList, "w") as out:
+                out.writelines(url + "\n" for url in mergeInputs)
+            mergeFile = os.path.join(self.submitDir, mergeNode + ".sub")
+            with open(mergeFile, "w") as out:
+                out.write("Executable = %s\n" % self.mergeExecutable)
+                out.write("\n".join(HEADER) + "\n")
+                out.write("Output = %s\nError  = %s\nLog  = %s\n" % (
+                    os.path.join(self.logDir, mergeNode + ".stdout"), os.path.join(self.logDir, mergeNode + ".stdout"),
+                    os.path.join(self.logDir, mergeNode + ".log")))
+                out.write("Transfer_Input_Files = %s\n" % mergeList)
+                out.write("Arguments = %s %s %s %s\n" % (outputDir, node, self.initialPath, os.path.basename(mergeList)))
+                out.write("queue\n")
+            self.lines += ["JOB %s %s" % (mergeNode, mergeFile),
+                           "CATEGORY %s merge" % mergeNode,
+                           "RETRY %s %d" % (mergeNode, self.retries),
+                           "PARENT %s CHILD %s" % (node, mergeNode)]
+
+    def write(self):
+        with open(self.fileName, "w") as out:
+            out.write("# written by condor_setup.py; submit with condor_submit_dag %s\n" % self.fileName)
+            out.write("\n".join(self.lines) + "\n\n")
+            if self.maxSamples > 0:
+                out.write("MAXJOBS samples %d\n" % self.maxSamples)
+            if self.mergeExecutable and self.maxMerges > 0:
+                out.write("MAXJOBS merge %d\n" % self.maxMerges)
+        return self.fileName
+
+
+def postScript(itemsFile, logDir, node, returnCode):
+    """Exit code of the POST script of a sample node."""
+    classes = {}
+    with open(itemsFile) as src:
+        for line in src:
+            jobList = line.strip().split(",")[0]
+            if jobList:
+                jobClass = classify(logFiles(logDir, node, jobList))
+                classes.setdefault(jobClass, []).append(jobList)
+    summary = ", ".join("%s %d" % (name, len(jobs)) for name, jobs in sorted(classes.items()))
+    failed = [name for name in classes if name != "ok"]
+    if not failed:
+        exitCode = 0
+    elif all(name in TRANSIENT_CLASSES for name in failed):
+        exitCode = 1
+    else:
+        exitCode = PERMANENT_FAILURE
+    with open(os.path.join(logDir, node + "_post.txt"), "a") as out:
+        out.write("node return value %s: %s -> exit %d\n" % (returnCode, summary, exitCode))
+        for name in sorted(failed):
+            out.write("  %s: %s\n" % (name, " ".join(classes[name])))
+    print("%s: %s -> exit %d" % (node, summary, exitCode))
+    return exitCode
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 6 and sys.argv[1] == "post":
+        sys.exit(postScript(*sys.argv[2:]))
+    print("usage: python condorDag.py post <items file> <log directory> <node> <return value>")
+    sys.exit(1)
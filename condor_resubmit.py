@@ -1,39 +1,43 @@
-import os
-
 """Condor resubmit script.
 
-# Three steps to submit condor script
-
-1. Set input information
-2. `grep` the **search string** ("preselected entries from root:") from the log files.
-  1. If it is not present it means jobs failed.
-  2. \todo check any other signature of the failed jobs and add it.
-  3. Make list of failed jobs log file.
-3. Get the initial 7 lines from the main jdl file on which original jobs was submitted.
-  1. \todo number 7 in the previous statement is hard-coded. Make it flexible.
-4. Add the above 7 lines into new jdl file.
-5. To add the failed jobs information in the new jdl file, do following:
-  1. From the log files check the name of root files that failed.
-  2. Search the same root file from the main jdl file and grep the corresponding
-    necessary lines from the main jdl file and add it to the new jdl file.
+1. The jdl on which the jobs were submitted is parsed once into an index
+   ProcId -> job (its own settings, input file list, output directory and
+   log files). $(Process) is expanded as condor does, counting the Queue
+   statements, so the log file of every job is known without any grep.
+2. The logs of all jobs are scanned in parallel and each job is classified
+   (from the events of its last submission in the appended condor log):
+   - ok: the search string ("preselected entries from root:") is present and
+     there is no failure signature
+   - aborted: the condor log reports the job as aborted
+   - xrootd: XRootD open/read/copy errors in the stdout
+   - exit-<code>: the condor log reports a non-zero return value
+   - no-output: the job finished without an output file to copy
+   - no-marker: the search string is missing for another reason
+   - no-log: no stdout (yet), not resubmitted unless asked for
+3. The new jdl is written in one pass: the settings common to all jobs (what
+   was copied as the first 7 lines before), then the own settings of each
+   failed job, with $(Process) in the log names replaced by
+   <ProcId>_$(Process)_resubmit_<Resubmit_no>.
+
+    python condor_resubmit.py -j submit_condor_jobs_lnujj_X.jdl -r 2
+    python condor_resubmit.py -j submit_condor_jobs_lnujj_X.jdl -r 2 -l condor_logs/X/200805_032620/ --classes xrootd
 """
+import os
+import re
+import time
+import argparse
+from multiprocessing import Pool
 
-"""path of log file directory"""
+"""path of log file directory; empty: the directories written in the jdl"""
 #path = "condor_logs/Run2017_v6_DataReDoJEC/200726_173958/"
-#path = "condor_logs/Run2016_v6_DataReDoJEC/200727_064518/"
-#path = "condor_logs/Run2018_v6_DataReDoJEC/200730_103313/"
-path = "condor_logs/Run2017_v7_5Aug20200/200805_032620/"
+path = ""
 
 """Name of main condor jdl/sh file name"""
 #condor_file_name = "submit_condor_jobs_lnujj_Run2017_v6_DataReDoJEC"
-#condor_file_name = "submit_condor_jobs_lnujj_Run2016_v6_DataReDoJEC"
-#condor_file_name = "submit_condor_jobs_lnujj_Run2018_v6_DataReDoJEC"
 condor_file_name = "submit_condor_jobs_lnujj_Run2017_v7_5Aug20200"
 
 """This variable `Resubmit_no` is going to append in the new jdl file.
 New jdl file name is the main jdl file + _resubmit_ + Resubmit_no
-
-New JDL FILE name : condor_file_name + "_resubmit_" + Resubmit_no
 """
 Resubmit_no = "2"
 
@@ -43,36 +47,172 @@ If this string is not present in the log file this means the jobs are failed.
 """
 string_to_search = "preselected entries from root:"
 
-grepCommand = 'grep -L  "'+string_to_search+'" '+ path + os.sep +'*_1.stdout'
-grepCommand = grepCommand.replace('//','/')
-print 'grep command: ',grepCommand
-output = os.popen(grepCommand).read()
-print('output:')
-
-outjdl_file = open(condor_file_name+'_resubmit_'+Resubmit_no+".jdl","w")
-with open(condor_file_name+".jdl") as myfile:
-    head = [next(myfile) for x in xrange(7)]
-
-for lines in head:
-  outjdl_file.write(lines)
-
-for lines in output.split():
-  print "==> ",lines.strip()
-  # print "==> ",lines.strip().split('/')[-1].replace('.stdout','')
-  if lines.strip().split('/')[-1].replace('.stdout','').split('_')[-2] == "resubmit":
-    OldRefFile = lines.strip().split('/')[-1].replace('.stdout','').split('_')[-4]
-  else:
-    OldRefFile = lines.strip().split('/')[-1].replace('.stdout','').split('_')[-1]
-  # print "====> ",OldRefFile
-  grep_output = os.popen('grep -E "Running.*root" '+lines.strip()).read()
-  # print grep_output
-  root_file = grep_output.split()[5].split('/')[-1]
-  grepCommand_GetJdlInfo = 'grep -A1 -B3 "'+root_file+'" '+condor_file_name+'.jdl'
-  # print grepCommand_GetJdlInfo
-  grep_condor_jdl_part = os.popen(grepCommand_GetJdlInfo).read()
-  updateString = grep_condor_jdl_part.replace('$(Process)',OldRefFile+'_$(Process)'+ '_resubmit_' +Resubmit_no)
-  # print updateString
-  outjdl_file.write(updateString)
-outjdl_file.close()
-
-print "===> ",outjdl_file
+XROOTD_SIGNATURES = ("Error in <TNetXNGFile::Open>", "Error in <TNetXNGFile::ReadBuffer",
+                     "[FATAL]", "[ERROR] Server responded with an error", "[ERROR] Operation expired")
+NO_OUTPUT_SIGNATURE = "No output file found."
+# printed by a retried job (DAG mode) whose output was stored by an earlier try
+ALREADY_DONE_SIGNATURE = "Output already stored, nothing to do."
+LOG_SETTINGS = ("output", "error", "log")
+# always job settings, even when the jdl has a single job
+JOB_SETTINGS = LOG_SETTINGS + ("arguments", "transfer_input_files")
+
+
+def parseJdl(fileName):
+    """Header lines and the jobs of a jdl.
+
+    Returns:
+        tuple -- (header lines, jobs); each job is a dict with "procId" and
+                 "settings", the [(line, key, value)] set for it after the
+                 header (JOB_SETTINGS and the settings set again between
+                 Queue statements)
+    """
+    statements = []
+    with open(fileName) as src:
+        for line in src:
+            stripped = line.strip()
+            if not stripped or stripped.startswith("#"):
+                statements.append((line, None, None))
+                continue
+            queue = re.match(r"queue\b\s*(\d*)\s*$", stripped, re.IGNORECASE)
+            if queue:
+                statements.append((line, "queue", int(queue.group(1) or 1)))
+                continue
+            key, _, value = stripped.partition("=")
+            statements.append((line, key.strip().lower(), value.strip()))
+
+    firstQueue = next((i for i, s in enumerate(statements) if s[1] == "queue"), len(statements))
+    # settings set again after the first Queue differ between jobs
+    perJob = set(s[1] for s in statements[firstQueue:] if s[1] not in (None, "queue")) | set(JOB_SETTINGS)
+    header = [s[0] for s in statements[:firstQueue] if s[1] is None or s[1] not in perJob]
+    header = [line for line in header if line.strip()]
+
+    jobs = []
+    current = {}
+    for line, key, value in statements:
+        if key == "queue":
+            settings = [current[k] for k in sorted(current, key=lambda k: current[k][3])]
+            for i in range(value):
+                jobs.append({"procId": len(jobs), "settings": [s[:3] for s in settings]})
+        elif key in perJob:
+            current[key] = (line, key, value, len(current) if key not in current else current[key][3])
+    return header, jobs
+
+
+def expand(value, procId):
+    return value.replace("$(Process)", str(procId)).replace("$(ProcId)", str(procId))
+
+
+def jobFiles(job, logDir=""):
+    """stdout and condor log file of a job, in `logDir` if given."""
+    settings = dict((key, value) for line, key, value in job["settings"])
+    files = []
+    for key in ("output", "log"):
+        fileName = expand(settings[key], job["procId"]) if key in settings else ""
+        if fileName and logDir:
+            fileName = os.path.join(logDir, os.path.basename(fileName))
+        files.append(fileName)
+    return files
+
+
+def _read(fileName):
+    try:
+        with open(fileName, "rb") as src:
+            return src.read().decode("utf-8", "replace")
+    except IOError:
+        return None
+
+
+def lastSubmission(condorLog):
+    """Events of a condor log from the last submit event on: the log is appended
+    to by every submission of the same job (resubmissions, DAG retries)."""
+    submits = [match.start() for match in re.finditer(r"^000 \(", condorLog, re.MULTILINE)]
+    return condorLog[submits[-1]:] if submits else condorLog
+
+
+def classify(files):
+    """Failure class of a job from its (stdout, condor log)."""
+    stdout, condorLog = _read(files[0]), _read(files[1]) if files[1] else None
+    if condorLog is not None:
+        condorLog = lastSubmission(condorLog)
+    if stdout is None:
+        return "no-log"
+    if ALREADY_DONE_SIGNATURE in stdout:
+        return "ok"
+    if condorLog is not None and "Job was aborted" in condorLog:
+        return "aborted"
+    # the cause before the exit code it leads to
+    if any(signature in stdout for signature in XROOTD_SIGNATURES):
+        return "xrootd"
+    if condorLog is not None:
+        returnValues = re.findall(r"\(return value (\d+)\)", condorLog)
+        if returnValues and returnValues[-1] != "0":
+            return "exit-" + returnValues[-1]
+    if NO_OUTPUT_SIGNATURE in stdout:
+        return "no-output"
+    if string_to_search not in stdout:
+        return "no-marker"
+    return "ok"
+
+
+def resubmitLogName(value, procId, resubmitNo):
+    """Log file name of a resubmitted job; jobs resubmitted before keep their original ProcId."""
+    previous = re.search(r"(\d+)_\$\(Process\)_resubmit_\w+", value)
+    if previous:
+        return value.replace(previous.group(0), "%s_$(Process)_resubmit_%s" % (previous.group(1), resubmitNo))
+    return value.replace("$(Process)", "%d_$(Process)_resubmit_%s" % (procId, resubmitNo))
+
+
+def writeResubmitJdl(fileName, header, jobs, resubmitNo):
+    with open(fileName, "w") as out:
+        out.writelines(header)
+        for job in jobs:
+            for line, key, value in job["settings"]:
+                if key in LOG_SETTINGS:
+                    line = line.replace(value, resubmitLogName(value, job["procId"], resubmitNo))
+                out.write(line if line.endswith("\n") else line + "\n")
+            out.write("Queue \n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the failed jobs of a condor submission and write a jdl resubmitting them")
+    parser.add_argument("-j", "--jdl", default=condor_file_name + ".jdl", type=str, help="jdl on which the jobs were submitted")
+    parser.add_argument("-r", "--resubmit", default=Resubmit_no, type=str, help="Resubmission number, appended to the new jdl name")
+    parser.add_argument("-l", "--logDir", default=path, type=str, help="Log file directory (default: the one in the jdl)")
+    parser.add_argument("--classes", nargs="+", default=[], help="Failure classes to resubmit (default: all but no-log)")
+    parser.add_argument("--workers", default=8, type=int, help="Processes scanning the logs")
+    args = parser.parse_args()
+
+    t0 = time.time()
+    header, jobs = parseJdl(args.jdl)
+    t1 = time.time()
+    pool = Pool(max(1, args.workers))
+    try:
+        classes = pool.map(classify, [jobFiles(job, args.logDir) for job in jobs], chunksize=64)
+    finally:
+        pool.close()
+        pool.join()
+    t2 = time.time()
+
+    counts = {}
+    for job, jobClass in zip(jobs, classes):
+        job["class"] = jobClass
+        counts[jobClass] = counts.get(jobClass, 0) + 1
+    failed = [job for job in jobs if job["class"] != "ok" and
+              (job["class"] in args.classes if args.classes else job["class"] != "no-log")]
+    for job in failed:
+        settings = dict((key, value) for line, key, value in job["settings"])
+        print("==> ProcId %d: %s (%s)" % (job["procId"], job["class"], settings.get("arguments", "").split(" ")[0]))
+
+    print("\n%d job(s): %s" % (len(jobs), ", ".join("%s %d" % (name, counts[name]) for name in sorted(counts))))
+    print("jdl parsed in %.1f s, logs scanned in %.1f s, %d job(s) to resubmit" % (t1 - t0, t2 - t1, len(failed)))
+    if not failed:
+        print("===> nothing to resubmit, no jdl written")
+        return
+    baseName = re.sub(r"_resubmit_\w+$", "", os.path.splitext(args.jdl)[0])
+    outName = baseName + "_resubmit_" + args.resubmit + ".jdl"
+    writeResubmitJdl(outName, header, failed, args.resubmit)
+    print("===> condor_submit " + outName)
+
+
+if __name__ == "__main__":
+    main()
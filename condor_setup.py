@@ -1,10 +1,15 @@
 import subprocess
 import os
+import re
 import sys
 
 sys.path.append("Utils/python_utils/.")
 
 from color_style import style
+import fileListing
+import jobPlanner
+import eosStorage
+import condorDag
 
 # Variables to be changed by user
 #StringToChange = "Run2016_v6_15June2020_MatteoWJetBinned"
@@ -18,10 +23,23 @@ customEOS_cmd = 'eos root://cmseos.fnal.gov find -name "*.root" /store/group/lnu
 #InputFileFromWhereReadDASNames = 'sample_list_v7_2016_campaign.dat'
 #InputFileFromWhereReadDASNames = 'sample_list_v7_2017_eos_custom.dat'
 InputFileFromWhereReadDASNames = 'sample_list_v7_2017_campaign.dat'
+# Files are packed into jobs of about TargetJobHours, assuming EventsPerSecond
+# (measure it with "python post_proc.py --timing"); 0 hours for one job per file
+TargetJobHours = 3.
+EventsPerSecond = 100.
+# DAG mode: also write a DAGMan workflow (one compact submit file per sample),
+# retrying samples with transient failures up to DAGRetries times, with at most
+# MaxJobsPerSample jobs of a sample queued at once (0: no cap) and optionally a
+# node merging the outputs of each sample
+UseDAG = False
+MaxJobsPerSample = 500
+DAGRetries = 3
+MergeSampleOutputs = False
 
 Initial_path = '/eos/uscms/store/user/lnujj/VVjj_aQGC/nanoAOD_skim/'
 Initial_path += StringToChange
 condor_file_name = 'submit_condor_jobs_lnujj_'+StringToChange
+jobListDir = 'condor_job_lists/'+StringToChange
 
 # Create log files
 import infoCreaterGit
@@ -40,15 +58,14 @@ output_log_path = dirsToCreate.CreateLogDirWithDate()
 storeDir = dirsToCreate.CreateSotreArea(Initial_path)
 dirName = dirsToCreate.dirName
 
-# create tarball of present working CMSSW base directory
-os.system('rm -f CMSSW*.tgz')
-import makeTarFile
-makeTarFile.make_tarfile(cmsswDirPath, CMSSWRel+".tgz")
-print "copying the "+CMSSWRel+".tgz  file to eos path: "+storeDir+"\n"
-os.system('xrdcp -f ' + CMSSWRel+".tgz" + ' root://cmseos.fnal.gov/'+storeDir+'/' + CMSSWRel+".tgz")
+# tarball of present working CMSSW base directory, rebuilt and copied to eos
+# only when its content changed
+import tarballPackager
+tarballPackager.packageArea(cmsswDirPath, CMSSWRel+".tgz", storeDir)
 
 post_proc_to_run = "post_proc.py"
-command = "python "+post_proc_to_run
+# ${1}: file list of the job (transferred to the scratch directory)
+command = "python "+post_proc_to_run+" -i ${_CONDOR_SCRATCH_DIR}/${1} -n 0"
 
 Transfer_Input_Files = ("Cert_271036-284044_13TeV_PromptReco_Collisions16_JSON.txt, " +
                         "Cert_294927-306462_13TeV_PromptReco_Collisions17_JSON.txt, " +
@@ -57,18 +74,49 @@ Transfer_Input_Files = ("Cert_271036-284044_13TeV_PromptReco_Collisions16_JSON.t
 
 #with open('input_data_Files/sample_list_v6_2017_campaign.dat') as in_file:
 with open('input_data_Files/'+InputFileFromWhereReadDASNames) as in_file:
-  outjdl_file = open(condor_file_name+".jdl","w")
+  samples = [lines for lines in in_file if lines.strip() and lines[0] != "#"]
+
+# List the files of all samples at once (concurrent, cached in .das_cache/)
+lister = fileListing.FileLister()
+if customEOS:
+  xrd_redirector = 'root://cmseos.fnal.gov/'
+  listings = lister.eosFilesMany([customEOS_cmd + lines.strip() for lines in samples])
+else:
+  xrd_redirector = 'root://cms-xrd-global.cern.ch/'
+  listings = lister.datasetFilesMany([lines.strip() for lines in samples])
+print lister.report()
+
+# Jobs whose inputs and configuration did not change and whose output is valid
+# are not submitted again; the configuration is everything the job runs with
+import jobManifest
+configFiles = jobManifest.localImports(os.path.abspath(post_proc_to_run))
+configFiles |= set(f.strip() for f in Transfer_Input_Files.split(","))
+# scale factor configurations, tables and ROOT files the modules read from data/
+configFiles |= jobManifest.dataFiles("data")
+config = jobManifest.configHash(configFiles, command)
+manifest = jobManifest.JobManifest(jobListDir + "/manifest.json")
+
+# one recursive mkdir per sample
+storage = eosStorage.EOSStorage()
+
+dag = None
+if UseDAG:
+  dag = condorDag.CondorDag(condor_file_name+".dag", condor_file_name+".sh",
+                            Transfer_Input_Files + ",  " + post_proc_to_run, output_log_path, Initial_path,
+                            jobListDir + "/dag", maxJobsPerSample=MaxJobsPerSample, retries=DAGRetries,
+                            mergeExecutable=condor_file_name+"_merge.sh" if MergeSampleOutputs else None)
+
+with open(condor_file_name+".jdl","w") as outjdl_file:
   outjdl_file.write("Executable = "+condor_file_name+".sh\n")
   outjdl_file.write("Universe = vanilla\n")
   outjdl_file.write("Notification = ERROR\n")
   outjdl_file.write("Should_Transfer_Files = YES\n")
   outjdl_file.write("WhenToTransferOutput = ON_EXIT\n")
-  outjdl_file.write("Transfer_Input_Files = "+Transfer_Input_Files + ",  " + post_proc_to_run+"\n")
   outjdl_file.write("x509userproxy = $ENV(X509_USER_PROXY)\n")
   count = 0
   count_jobs = 0
-  for lines in in_file:
-     if lines[0] == "#": continue
+  all_jobs = []
+  for lines, (files, error) in zip(samples, listings):
      count = count +1
      #if count > 1: break
      print(style.RED +"="*51+style.RESET+"\n")
@@ -84,42 +132,57 @@ with open('input_data_Files/'+InputFileFromWhereReadDASNames) as in_file:
      ########################################
      if sample_name.find("SingleMuon") != -1 or sample_name.find("SingleElectron") != -1 or sample_name.find("EGamma") != -1 or sample_name.find("DoubleMuon") != -1 or sample_name.find("MuonEG") != -1 or sample_name.find("DoubleEG") != -1:
        output_string = sample_name + os.sep + campaign + os.sep + dirName
-       output_path = Initial_path + os.sep + output_string
-       os.system("xrdfs root://cmseos.fnal.gov/ mkdir "+Initial_path + os.sep + sample_name)
-       os.system("xrdfs root://cmseos.fnal.gov/ mkdir "+Initial_path + os.sep + sample_name + os.sep + campaign)
-       os.system("xrdfs root://cmseos.fnal.gov/ mkdir "+ Initial_path + os.sep + sample_name + os.sep + campaign + os.sep + dirName)
-       infoLogFiles.SendGitLogAndPatchToEos(Initial_path + os.sep + sample_name + os.sep + campaign + os.sep + dirName)
      else:
        output_string = sample_name+os.sep+dirName
-       output_path = Initial_path+ os.sep + output_string
-       os.system("xrdfs root://cmseos.fnal.gov/ mkdir "+Initial_path + os.sep + sample_name)
-       os.system("xrdfs root://cmseos.fnal.gov/ mkdir "+Initial_path + os.sep + sample_name+os.sep+dirName)
-       infoLogFiles.SendGitLogAndPatchToEos(Initial_path + os.sep + sample_name + os.sep + dirName)
+     # the directory of the first submission of the sample, where its earlier outputs are
+     output_path = manifest.outputDirectory(lines.strip(), Initial_path + os.sep + output_string)
+     storage.makedirs(output_path)
+     infoLogFiles.SendGitLogAndPatchToEos(output_path)
      print "==> output_path = ",output_path
 
-     ########################################
-     #print 'dasgoclient --query="file dataset='+lines.strip()+'"'
-     #print "..."
-     if customEOS:
-       xrd_redirector = 'root://cmseos.fnal.gov/'
-       output = os.popen(customEOS_cmd + lines.strip()).read()
-     else:
-       xrd_redirector = 'root://cms-xrd-global.cern.ch/'
-       output = os.popen('dasgoclient --query="file dataset='+lines.strip()+'"').read()
+     if error:
+       print(style.RED + "ERROR: listing failed, no jobs for this sample: " + error + style.RESET)
+       continue
 
-     count_root_files = 0
-     for root_file in output.split():
-       #print "=> ",root_file
-       count_root_files+=1
+     # the jobs of the last submission are kept, only the files not in them are packed
+     jobs = jobPlanner.planJobs(files, int(TargetJobHours * 3600 * EventsPerSecond), manifest.plannedInputs(lines.strip()))
+     keys = [jobManifest.jobKey([f["name"] for f in job], config) for job in jobs]
+     superseded = manifest.setPlanned(lines.strip(), keys)
+     if superseded:
+       # outputs of another configuration or of jobs whose files are gone: out of the sample directory
+       moved = storage.move(superseded, output_path + "/superseded")
+       print "==> %d superseded output(s) moved to %s/superseded" % (moved, output_path)
+     new_jobs = [(job, key) for job, key in zip(jobs, keys) if not manifest.isValid(key)]
+     # job lists (and outputs) named after the job keys: a redone job never
+     # overwrites the output of a job kept from an earlier submission
+     new_job_lists = jobPlanner.writeJobLists([job for job, key in new_jobs], jobListDir, sample_name + "_" + campaign,
+                                              xrd_redirector, names=[key[:12] for job, key in new_jobs])
+     for (job, key), jobList in zip(new_jobs, new_job_lists):
+       manifest.record(key, [f["name"] for f in job], output_path + "/" + eosStorage.outputName(jobList))
        count_jobs += 1
        outjdl_file.write("Output = "+output_log_path+"/"+sample_name+"_$(Process).stdout\n")
        outjdl_file.write("Error  = "+output_log_path+"/"+sample_name+"_$(Process).stdout\n")
        outjdl_file.write("Log  = "+output_log_path+"/"+sample_name+"_$(Process).log\n")
-       outjdl_file.write("Arguments = "+(xrd_redirector+root_file).replace('/','\/')+" "+output_path+"  "+Initial_path+"\n")
+       outjdl_file.write("Transfer_Input_Files = "+Transfer_Input_Files + ",  " + post_proc_to_run + ", " + jobList + "\n")
+       outjdl_file.write("Arguments = "+os.path.basename(jobList)+" "+output_path+"  "+Initial_path+"\n")
        outjdl_file.write("Queue \n")
-     print "Number of files: ",count_root_files
+     if dag and new_job_lists:
+       # the merge node merges the outputs of the planned jobs only
+       dag.addSample(re.sub(r"[^\w-]", "_", sample_name) + "_" + str(count), new_job_lists, output_path,
+                     [eosStorage.EOS_REDIRECTOR + "/" + manifest.jobs[key]["output"] for key in keys])
+     all_jobs.extend(jobs)
+     print "Number of files: ",len(files)," in ",len(jobs)," jobs (%.1f GB)" % sum(jobPlanner.jobSizeGB(job) for job in jobs)
+     jobPlanner.printJobLengthDistribution(jobs, EventsPerSecond)
      print "Number of jobs (till now): ",count_jobs
-  outjdl_file.close();
+
+manifest.save()
+if dag:
+  dag.write()
+
+print(style.RED +"="*51+style.RESET+"\n")
+print manifest.report()
+print "==> All samples:"
+jobPlanner.printJobLengthDistribution(all_jobs, EventsPerSecond)
 
 
 outScript = open(condor_file_name+".sh","w");
@@ -127,6 +190,19 @@ outScript.write('#!/bin/bash');
 outScript.write("\n"+'echo "Starting job on " `date`');
 outScript.write("\n"+'echo "Running on: `uname -a`"');
 outScript.write("\n"+'echo "System software: `cat /etc/redhat-release`"');
+outScript.write("\n"+'JOBNAME=$(basename ${1%.*})');
+# ${4}: retry number of the DAG node; a retry skips the jobs done by an earlier try.
+# The output is stored under its final name only once completely copied (see
+# below), and a file below MIN_OUTPUT_SIZE has no events: the job is done again
+outScript.write("\n"+'SIZE=""');
+outScript.write("\n"+'if [ -n "${4}" ] && [ "${4}" != "0" ]; then');
+outScript.write("\n"+'    SIZE=$(xrdfs root://cmseos.fnal.gov/ stat ${2}/${JOBNAME}_SkimHadd.root 2> /dev/null | awk \'/Size:/ {print $2}\')');
+outScript.write("\n"+'    echo "====> output of an earlier try: ${SIZE:-none} bytes"');
+outScript.write("\n"+'fi');
+outScript.write("\n"+'if [ -n "${SIZE}" ] && [ "${SIZE}" -ge %d ]; then' % eosStorage.MIN_OUTPUT_SIZE);
+outScript.write("\n"+'    echo "'+condorDag.ALREADY_DONE_SIGNATURE+'"');
+outScript.write("\n"+'    exit 0');
+outScript.write("\n"+'fi');
 outScript.write("\n"+'source /cvmfs/cms.cern.ch/cmsset_default.sh');
 outScript.write("\n"+'echo "copy cmssw tar file from store area"');
 outScript.write("\n"+'xrdcp -s root://cmseos.fnal.gov/${3}/'+CMSSWRel +'.tgz  .');
@@ -138,34 +214,67 @@ outScript.write("\n"+'cd ' + CMSSWRel + '/src/PhysicsTools/NanoAODTools/python/p
 outScript.write("\n"+'rm *.root');
 outScript.write("\n"+'scramv1 b ProjectRename');
 outScript.write("\n"+'eval `scram runtime -sh`');
-outScript.write("\n"+'sed -i "s/testfile = .*/testfile = \\"${1}\\"/g" '+post_proc_to_run);
 outScript.write("\n"+'echo "========================================="');
-outScript.write("\n"+'echo "cat post_proc.py"');
-outScript.write("\n"+'echo "..."');
-outScript.write("\n"+'cat post_proc.py');
-outScript.write("\n"+'echo "..."');
+outScript.write("\n"+'echo "cat ${1}"');
+outScript.write("\n"+'cat ${_CONDOR_SCRATCH_DIR}/${1}');
 outScript.write("\n"+'echo "========================================="');
 outScript.write("\n"+command);
+outScript.write("\n"+'status=$?');
 outScript.write("\n"+'echo "====> List root files : " ');
 outScript.write("\n"+'ls *.root');
-outScript.write("\n"+'echo "====> copying *.root file to stores area..." ');
-outScript.write("\n"+'if ls *Hadd.root 1> /dev/null 2>&1; then');
-outScript.write("\n"+'    echo "File *Hadd.root exists. Copy this."');
-outScript.write("\n"+'    echo "xrdcp -f *Hadd.root root://cmseos.fnal.gov/${2}"');
-outScript.write("\n"+'    xrdcp -f *Hadd.root root://cmseos.fnal.gov/${2}');
+# skimmed_nano.root for several input files, <input>_SkimHadd.root for one;
+# stored under the job name, so that the jobs of a sample do not overwrite each other
+outScript.write("\n"+'OUTPUT=$(ls skimmed_nano.root *Hadd.root 2> /dev/null | head -n 1)');
+outScript.write("\n"+'echo "====> copying ${OUTPUT} file to stores area as ${JOBNAME}_SkimHadd.root..." ');
+outScript.write("\n"+'if [ -n "${OUTPUT}" ]; then');
+# copied under a temporary name and renamed: an interrupted copy never leaves a
+# truncated file under the name the retries and the merge look for
+outScript.write("\n"+'    echo "xrdcp -f ${OUTPUT} root://cmseos.fnal.gov/${2}/${JOBNAME}_SkimHadd.root"');
+outScript.write("\n"+'    if xrdcp -f ${OUTPUT} root://cmseos.fnal.gov/${2}/${JOBNAME}_SkimHadd.root.tmp; then');
+outScript.write("\n"+'        xrdfs root://cmseos.fnal.gov/ rm ${2}/${JOBNAME}_SkimHadd.root > /dev/null 2>&1');
+outScript.write("\n"+'        xrdfs root://cmseos.fnal.gov/ mv ${2}/${JOBNAME}_SkimHadd.root.tmp ${2}/${JOBNAME}_SkimHadd.root || status=%d' % condorDag.TRANSIENT_EXIT_CODE);
+outScript.write("\n"+'    else');
+outScript.write("\n"+'        status=%d' % condorDag.TRANSIENT_EXIT_CODE);
+outScript.write("\n"+'    fi');
 outScript.write("\n"+'else');
-outScript.write("\n"+'    echo "file *Hadd.root does not exists, so copy *.root file."');
-outScript.write("\n"+'    echo "xrdcp -f *.root root://cmseos.fnal.gov/${2}"');
-outScript.write("\n"+'    xrdcp -f *.root root://cmseos.fnal.gov/${2}');
+outScript.write("\n"+'    echo "No output file found."');
+outScript.write("\n"+'    [ ${status} -eq 0 ] && status=1');
 outScript.write("\n"+'fi');
 outScript.write("\n"+'rm *.root');
 outScript.write("\n"+'cd ${_CONDOR_SCRATCH_DIR}');
 outScript.write("\n"+'rm -rf ' + CMSSWRel);
+outScript.write("\n"+'exit ${status}');
 outScript.write("\n");
 outScript.close();
 os.system("chmod 777 "+condor_file_name+".sh");
 
+if dag and MergeSampleOutputs:
+  # ${1}: output directory of the sample, ${2}: DAG node of the sample, ${3}: Initial_path,
+  # ${4}: list of the outputs to merge (those of the jobs planned for the sample)
+  mergeScript = open(condor_file_name+"_merge.sh","w");
+  mergeScript.write('#!/bin/bash');
+  mergeScript.write("\n"+'echo "Starting merge on " `date`');
+  mergeScript.write("\n"+'source /cvmfs/cms.cern.ch/cmsset_default.sh');
+  mergeScript.write("\n"+'xrdcp -s root://cmseos.fnal.gov/${3}/'+CMSSWRel +'.tgz  .');
+  mergeScript.write("\n"+'tar -xf '+ CMSSWRel +'.tgz' );
+  mergeScript.write("\n"+'rm '+ CMSSWRel +'.tgz' );
+  mergeScript.write("\n"+'cd ' + CMSSWRel + '/src/' );
+  mergeScript.write("\n"+'scramv1 b ProjectRename');
+  mergeScript.write("\n"+'eval `scram runtime -sh`');
+  mergeScript.write("\n"+'FILES=$(cat ${_CONDOR_SCRATCH_DIR}/${4})');
+  mergeScript.write("\n"+'echo "====> merging $(echo ${FILES} | wc -w) files into ${2}_merged.root"');
+  # haddnano.py fills the branches missing from some inputs (e.g. HLT bits of data)
+  mergeScript.write("\n"+'python PhysicsTools/NanoAODTools/scripts/haddnano.py ${2}_merged.root ${FILES} || exit 1');
+  mergeScript.write("\n"+'xrdcp -f ${2}_merged.root root://cmseos.fnal.gov/${1}/${2}_merged.root || exit %d' % condorDag.TRANSIENT_EXIT_CODE);
+  mergeScript.write("\n"+'cd ${_CONDOR_SCRATCH_DIR}');
+  mergeScript.write("\n"+'rm -rf ' + CMSSWRel);
+  mergeScript.write("\n");
+  mergeScript.close();
+  os.system("chmod 777 "+condor_file_name+"_merge.sh");
+
 print "===> Set Proxy Using:";
 print "\tvoms-proxy-init --voms cms --valid 168:00";
 print "\"condor_submit "+condor_file_name+".jdl\" to submit";
+if dag:
+  print "or \"condor_submit_dag "+condor_file_name+".dag\" to submit as a DAG (automatic retries, at most %d jobs per sample)" % MaxJobsPerSample;
 #os.system("condor_submit "+condor_file_name+".jdl")
@@ -0,0 +1,60 @@
+"""Entry-range parts of one input file and the checkpoint of the finished parts.
+
+A job processing entries [first, end) of a file runs the module chain on
+consecutive parts of `checkpointEvery` entries. After each part its output
+file and the new committed entry are written to the checkpoint (JSON,
+replaced atomically), so a restarted job with the same description skips
+the committed parts and continues from the last committed entry.
+"""
+import os
+import json
+
+
+def entryRangeParts(first, end, every):
+    """(firstEntry, nEntries) of the parts of [first, end), `every` entries each (0: one part)."""
+    if every <= 0:
+        return [(first, end - first)] if end > first else []
+    return [(start, min(every, end - start)) for start in range(first, end, every)]
+
+
+class Checkpoint(object):
+    def __init__(self, fileName, description):
+        """
+        Arguments:
+            fileName {str} -- checkpoint JSON file
+            description {dict} -- input file, entry range, part size and options of
+                                  the job; a checkpoint written for a different
+                                  description is ignored
+        """
+        self.fileName = fileName
+        self.description = description
+        self.parts = []
+        if os.path.isfile(fileName):
+            with open(fileName) as src:
+                state = json.load(src)
+            if state.get("description") == description:
+                # a part counts only if its output survived
+                for part in state.get("parts", []):
+                    if not os.path.isfile(part["file"]):
+                        break
+                    self.parts.append(part)
+
+    def committedEntry(self, default):
+        """First entry that is not committed yet."""
+        if not self.parts:
+            return default
+        return self.parts[-1]["firstEntry"] + self.parts[-1]["entries"]
+
+    def isDone(self, firstEntry):
+        return any(part["firstEntry"] == firstEntry for part in self.parts)
+
+    def commit(self, firstEntry, entries, outFileName):
+        self.parts.append({"firstEntry": firstEntry, "entries": entries, "file": outFileName})
+        tmpName = self.fileName + ".tmp"
+        with open(tmpName, "w") as out:
+            json.dump({"description": self.description, "parts": self.parts}, out, indent=2, sort_keys=True)
+        os.rename(tmpName, self.fileName)
+
+    def remove(self):
+        if os.path.isfile(self.fileName):
+            os.remove(self.fileName)
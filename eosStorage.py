@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+"""Batched operations on the EOS output area.
+
+`EOSStorage.makedirs` creates a whole directory tree with a single
+`xrdfs mkdir -p`, and `listSizes` gets the size of every file of a directory
+from a single `xrdfs ls -l`. `missingOutputs` uses one listing per output
+directory to find the jobs whose `_SkimHadd.root` is missing or too small.
+`move` puts the outputs of superseded jobs aside.
+`LocalStorage` does the same on a local directory tree, standing in for EOS.
+
+Used by condor_setup.py and get_resubmit_cmd.sh; from the shell:
+
+    python eosStorage.py submit_condor_jobs_lnujj_X.jdl --checkSize
+    python eosStorage.py submit_condor_jobs_lnujj_X.jdl --localRoot /tmp/fake_eos
+"""
+import os
+import re
+import argparse
+import subprocess
+
+EOS_REDIRECTOR = "root://cmseos.fnal.gov"
+MIN_OUTPUT_SIZE = 1001
+
+
+class EOSStorage(object):
+    def __init__(self, redirector=EOS_REDIRECTOR):
+        self.redirector = redirector
+        self.calls = 0
+
+    def _xrdfs(self, *args):
+        self.calls += 1
+        return subprocess.check_output(["xrdfs", self.redirector] + list(args)).decode("utf-8", "replace")
+
+    def makedirs(self, path):
+        """Create `path` and its missing parents, False if xrdfs failed."""
+        self.calls += 1
+        return subprocess.call(["xrdfs", self.redirector, "mkdir", "-p", path]) == 0
+
+    def listSizes(self, directory):
+        """{file name: size in bytes} of a directory, {} if it does not exist."""
+        try:
+            output = self._xrdfs("ls", "-l", directory)
+        except subprocess.CalledProcessError:
+            return {}
+        sizes = {}
+        for line in output.splitlines():
+            # -rw- 2020-06-26 00:50:56      123456 /eos/uscms/store/.../name.root
+            fields = line.split()
+            if len(fields) >= 5 and fields[-2].isdigit():
+                sizes[os.path.basename(fields[-1])] = int(fields[-2])
+        return sizes
+
+    def move(self, paths, directory):
+        """Move the files `paths` into `directory`; returns the number moved (missing files are skipped)."""
+        self.makedirs(directory)
+        moved = 0
+        with open(os.devnull, "w") as devnull:
+            for path in paths:
+                self.calls += 1
+                if subprocess.call(["xrdfs", self.redirector, "mv", path, directory + "/" + os.path.basename(path)],
+                                   stderr=devnull) == 0:
+                    moved += 1
+        return moved
+
+
+class LocalStorage(object):
+    """EOS paths mapped below `rootDir`."""
+    def __init__(self, rootDir):
+        self.rootDir = rootDir
+        self.calls = 0
+
+    def _path(self, path):
+        return os.path.join(self.rootDir, path.lstrip("/"))
+
+    def makedirs(self, path):
+        self.calls += 1
+        if not os.path.isdir(self._path(path)):
+            os.makedirs(self._path(path))
+        return True
+
+    def listSizes(self, directory):
+        self.calls += 1
+        directory = self._path(directory)
+        if not os.path.isdir(directory):
+            return {}
+        return dict((name, os.path.getsize(os.path.join(directory, name))) for name in os.listdir(directory)
+                    if os.path.isfile(os.path.join(directory, name)))
+
+    def move(self, paths, directory):
+        self.makedirs(directory)
+        moved = 0
+        for path in paths:
+            self.calls += 1
+            if os.path.isfile(self._path(path)):
+                os.rename(self._path(path), os.path.join(self._path(directory), os.path.basename(path)))
+                moved += 1
+        return moved
+
+
+def outputName(firstArgument):
+    """Output file stored by a job, from its first argument (input file or file list)."""
+    return os.path.splitext(os.path.basename(firstArgument))[0] + "_SkimHadd.root"
+
+
+def parseDryRun(fileName):
+    """[(ProcId, [arguments])] from the output of condor_submit --dry-run."""
+    jobs = []
+    procId = None
+    with open(fileName) as src:
+        for line in src:
+            line = line.strip()
+            match = re.match(r"ProcId\s*=\s*(\d+)", line)
+            if match:
+                procId = int(match.group(1))
+                continue
+            match = re.match(r'Args\s*=\s*"(.*)"', line)
+            if match and procId is not None:
+                jobs.append((procId, match.group(1).split()))
+                procId = None
+    return jobs
+
+
+def missingOutputs(jobs, storage, checkSize=False, minSize=MIN_OUTPUT_SIZE):
+    """Jobs whose output is missing (or smaller than minSize with checkSize).
+
+    Arguments:
+        jobs {list} -- (ProcId, output directory, output file name)
+
+    Returns:
+        list -- (ProcId, reason)
+    """
+    listings = {}
+    failed = []
+    for procId, directory, name in jobs:
+        if directory not in listings:
+            listings[directory] = storage.listSizes(directory)
+        size = listings[directory].get(name)
+        if size is None:
+            failed.append((procId, "file does not exist"))
+        elif checkSize and size < minSize:
+            failed.append((procId, "file exists, but small file size of %d" % size))
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ProcIds of the jobs of a condor submission to resubmit")
+    parser.add_argument("jdl", type=str, help="Submit file of the jobs")
+    parser.add_argument("--checkSize", default=False, action="store_true", help="Also resubmit jobs with outputs below %d bytes" % MIN_OUTPUT_SIZE)
+    parser.add_argument("--localRoot", default="", type=str, help="Check a local directory standing in for EOS")
+    parser.add_argument("--dryRunFile", default="test_condor", type=str, help="Temporary file of condor_submit --dry-run")
+    args = parser.parse_args()
+
+    print("\nJust doing the dry run in temp file \"%s\"\n" % args.dryRunFile)
+    subprocess.check_call(["condor_submit", args.jdl, "--dry-run", args.dryRunFile])
+    jobs = [(procId, arguments[1], outputName(arguments[0])) for procId, arguments in parseDryRun(args.dryRunFile)]
+    os.remove(args.dryRunFile)
+
+    storage = LocalStorage(args.localRoot) if args.localRoot else EOSStorage()
+    failed = missingOutputs(jobs, storage, checkSize=args.checkSize)
+    for procId, reason in failed:
+        print("procId: %d %s" % (procId, reason))
+    print("\n%d of %d job(s) to resubmit (%d listing call(s))" % (len(failed), len(jobs), storage.calls))
+    print("\nnow resubmit using\n")
+    resubmitList = ",".join(str(procId) for procId, reason in failed)
+    print("condor_submit %s noop_job=\\!stringListMember\\(\\\"\\$\\(ProcId\\)\\\",\\\"%s\\\"\\)" % (args.jdl, resubmitList))
+
+
+if __name__ == "__main__":
+    main()
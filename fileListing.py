@@ -0,0 +1,184 @@
+"""DAS and EOS listings of the input datasets, concurrent and cached on disk.
+
+`FileLister` runs dasgoclient (or `eos find`) queries in a bounded pool of
+threads and keeps every answer in `cacheDir` for `ttl` seconds, so that
+resubmissions and campaign re-checks only query what is new or expired:
+
+    lister = FileLister()
+    for dataset, (files, error) in zip(datasets, lister.datasetFilesMany(datasets)):
+        ...
+
+`datasetFiles` returns the files of a dataset with size and number of events
+(dasgoclient -json), `query` the plain output lines of any DAS query and
+`eosFiles` the files printed by an `eos find` command (size and event count
+None). `invalidate(key)` drops the cached answers of one dataset, query or
+command; from the shell:
+
+    python fileListing.py --invalidate /WWJJ.../NANOAODSIM
+    python fileListing.py --clear
+
+The dasgoclient executable can be replaced (argument or $DASGOCLIENT), e.g.
+by a script printing canned answers in tests.
+"""
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+import subprocess
+from multiprocessing.pool import ThreadPool
+
+LISTING_CACHE_DIR = ".das_cache"
+DEFAULT_TTL = 24 * 3600
+
+
+def parseDASFiles(output):
+    """[{"name", "size", "nevents"}] from the output of dasgoclient -json "file dataset=..."."""
+    files = {}
+    for record in json.loads(output):
+        for info in record.get("file", []):
+            if "name" not in info:
+                continue
+            entry = files.setdefault(info["name"], {"name": info["name"], "size": None, "nevents": None})
+            # DAS merges records of several services, not all of them have every field
+            if info.get("size") is not None:
+                entry["size"] = int(info["size"])
+            if info.get("nevents") is not None:
+                entry["nevents"] = int(info["nevents"])
+    return [files[name] for name in sorted(files)]
+
+
+class FileLister(object):
+    def __init__(self, cacheDir=LISTING_CACHE_DIR, ttl=DEFAULT_TTL, workers=8, executable=None):
+        """
+        Arguments:
+            cacheDir {str} -- directory of the cached answers
+            ttl {float} -- seconds a cached answer stays valid, 0 for no expiry
+            workers {int} -- queries run at the same time
+            executable {str} -- dasgoclient to run, default $DASGOCLIENT or "dasgoclient"
+        """
+        self.cacheDir = cacheDir
+        self.ttl = ttl
+        self.workers = max(1, workers)
+        self.executable = executable or os.environ.get("DASGOCLIENT", "dasgoclient")
+        self.stats = {"cached": 0, "queried": 0, "failed": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _cacheFile(self, kind, key):
+        return os.path.join(self.cacheDir, "%s_%s.json" % (kind, hashlib.sha1(key.encode("utf-8")).hexdigest()))
+
+    def _cached(self, kind, key, run):
+        """Answer of `run()` for (kind, key), from the cache while it is valid."""
+        cacheFile = self._cacheFile(kind, key)
+        if os.path.isfile(cacheFile):
+            try:
+                with open(cacheFile) as src:
+                    entry = json.load(src)
+                if self.ttl <= 0 or time.time() - entry["time"] < self.ttl:
+                    self._count("cached")
+                    return entry["result"]
+            except (IOError, ValueError, KeyError):
+                pass
+        result = run()
+        self._count("queried")
+        if not os.path.isdir(self.cacheDir):
+            try:
+                os.makedirs(self.cacheDir)
+            except OSError:
+                pass
+        # unique temporary name: several threads may write the same key
+        tmpName = "%s.tmp%d_%d" % (cacheFile, os.getpid(), threading.current_thread().ident)
+        with open(tmpName, "w") as out:
+            json.dump({"key": key, "time": time.time(), "result": result}, out)
+        os.rename(tmpName, cacheFile)
+        return result
+
+    def _das(self, query, asJSON=False):
+        command = [self.executable] + (["-json"] if asJSON else []) + ["-query", query]
+        return subprocess.check_output(command).decode("utf-8", "replace")
+
+    def query(self, query):
+        """Output lines of a DAS query, e.g. "dataset=/A/B*/NANOAODSIM"."""
+        return self._cached("query", query, lambda: self._das(query).split())
+
+    def datasetFiles(self, dataset):
+        """Files of a DAS dataset with "name", "size" and "nevents"."""
+        return self._cached("files", dataset, lambda: parseDASFiles(self._das("file dataset=%s" % dataset, asJSON=True)))
+
+    def eosFiles(self, command):
+        """Files printed by an `eos find` command."""
+        def run():
+            output = subprocess.check_output(command, shell=True).decode("utf-8", "replace")
+            return [{"name": name, "size": None, "nevents": None} for name in output.split()]
+        return self._cached("eos", command, run)
+
+    def _many(self, method, keys):
+        def call(key):
+            try:
+                return method(key), None
+            except (OSError, subprocess.CalledProcessError, ValueError) as err:
+                self._count("failed")
+                return None, "%s: %s" % (key, err)
+        pool = ThreadPool(min(self.workers, max(1, len(keys))))
+        try:
+            return pool.map(call, keys)
+        finally:
+            pool.close()
+            pool.join()
+
+    def queryMany(self, queries):
+        """[(lines or None, error or None)] for each query, in order, run concurrently."""
+        return self._many(self.query, list(queries))
+
+    def datasetFilesMany(self, datasets):
+        """[(files or None, error or None)] for each dataset, in order, run concurrently."""
+        return self._many(self.datasetFiles, list(datasets))
+
+    def eosFilesMany(self, commands):
+        """[(files or None, error or None)] for each eos command, in order, run concurrently."""
+        return self._many(self.eosFiles, list(commands))
+
+    def invalidate(self, key):
+        """Drop the cached answers for a dataset, a query or an eos command."""
+        removed = 0
+        for kind, cacheKey in (("files", key), ("query", key), ("query", "dataset=%s" % key),
+                               ("query", "file dataset=%s" % key), ("eos", key)):
+            cacheFile = self._cacheFile(kind, cacheKey)
+            if os.path.isfile(cacheFile):
+                os.remove(cacheFile)
+                removed += 1
+        return removed
+
+    def clear(self):
+        if not os.path.isdir(self.cacheDir):
+            return 0
+        names = [name for name in os.listdir(self.cacheDir) if name.endswith(".json")]
+        for name in names:
+            os.remove(os.path.join(self.cacheDir, name))
+        return len(names)
+
+    def report(self):
+        return "Listings: %d from cache, %d queried, %d failed" % (
+            self.stats["cached"], self.stats["queried"], self.stats["failed"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the cached DAS/EOS listings")
+    parser.add_argument("--cacheDir", default=LISTING_CACHE_DIR, type=str, help="Cache directory")
+    parser.add_argument("--invalidate", nargs="+", default=[], help="Datasets, queries or eos commands to drop")
+    parser.add_argument("--clear", default=False, action="store_true", help="Drop every cached listing")
+    args = parser.parse_args()
+    lister = FileLister(args.cacheDir)
+    if args.clear:
+        print("Removed %d cached listing(s)" % lister.clear())
+    for key in args.invalidate:
+        print("%s: removed %d cached listing(s)" % (key, lister.invalidate(key)))
+
+
+if __name__ == "__main__":
+    main()
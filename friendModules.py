@@ -0,0 +1,53 @@
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+from PhysicsTools.NanoAODTools.postprocessing.framework.eventloop import Module
+
+
+class friendIndexProducer(Module):
+    """First module of a friend-tree chain (PostProcessor(friend=True)).
+
+    In friend mode only branches created by modules are written, one entry per
+    input entry. This module copies run/luminosityBlock/event so the friend can
+    be checked against the original NanoAOD, and resets `skimPass`, which
+    `skimFlagProducer` sets again if the event passes the whole chain.
+    """
+    def beginFile(self, inputFile, outputFile, inputTree, wrappedOutputTree):
+        self.out = wrappedOutputTree
+        self.out.branch("run", "i")
+        self.out.branch("luminosityBlock", "i")
+        self.out.branch("event", "l")
+        self.out.branch("skimPass", "O")
+    def analyze(self, event):
+        self.out.fillBranch("run", event.run)
+        self.out.fillBranch("luminosityBlock", event.luminosityBlock)
+        self.out.fillBranch("event", event.event)
+        self.out.fillBranch("skimPass", False)
+        return True
+
+
+class skimFlagProducer(Module):
+    """Last module of a friend-tree chain: flags the entries that passed every
+    module and writes them as the `skimEntries` TEntryList into the friend file.
+
+    Branches of modules after a rejecting one keep the values of the previous
+    entry, so readers of the friend should select on `skimPass` (or use the
+    entry list).
+    """
+    def beginFile(self, inputFile, outputFile, inputTree, wrappedOutputTree):
+        self.out = wrappedOutputTree
+        self.outputFile = outputFile
+        self.entryList = ROOT.TEntryList("skimEntries", "entries passing the skim")
+        self.entryList.SetDirectory(0)
+        self.entryList.SetTree(inputTree)
+    def endFile(self, inputFile, outputFile, inputTree, wrappedOutputTree):
+        outputFile.cd()
+        self.entryList.Write()
+    def analyze(self, event):
+        self.out.fillBranch("skimPass", True)
+        self.entryList.Enter(event._tree.GetReadEntry())
+        return True
+
+
+friendIndexModule = lambda : friendIndexProducer()
+skimFlagModule = lambda : skimFlagProducer()
@@ -0,0 +1,204 @@
+"""Manifest of the submitted jobs, to submit only what is not done yet.
+
+Each job is identified by a key: the hash of its input files and of the
+configuration (`configHash`: post_proc.py and the local modules it imports,
+the keep/drop lists and JSONs transferred with the job, the scale factor
+configurations and tables of data/, and the command with its options). The manifest maps the key to the output the job writes, and,
+once the output has been validated, to its size and number of entries.
+
+A job is left out of a new submission when the manifest has its key and the
+output is valid: present in the listing of its directory (one listing per
+directory, see eosStorage) with the recorded size, or, for an output not
+validated yet, readable by ROOT with an `Events` tree (and above
+`eosStorage.MIN_OUTPUT_SIZE` when ROOT is not available). A configuration
+change changes every key, a change of the files of a sample only the keys
+of the jobs they are packed into. The output directory of a sample is the
+one of its first submission (`outputDirectory`), and the job lists (hence
+the outputs) are named after the job keys, so that redone jobs never
+overwrite the outputs of the jobs they are submitted with.
+
+The manifest also keeps the jobs planned for each sample at the last
+submission (`plannedInputs`), so that their packing is kept (see
+jobPlanner.planJobs), and `setPlanned` returns the outputs of the jobs no
+longer planned, which are moved out of the output directory: it only holds
+the outputs of the current jobs.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+
+import eosStorage
+
+
+# package of this directory in CMSSW, as in "from <package>.wvAnalysisModule import ..."
+ANALYSIS_PACKAGE = "PhysicsTools.NanoAODTools.postprocessing.analysis.nanoAOD_vvVBS"
+IMPORT = re.compile(r"(\s*)(?:from\s+([\w.]+)\s+import|import\s+([\w.]+(?:\s*,\s*[\w.]+)*))")
+
+
+def _importable(name):
+    try:
+        import importlib.util
+        return importlib.util.find_spec(name) is not None
+    except ImportError:
+        # python 2
+        import imp
+        try:
+            imp.find_module(name)
+            return True
+        except ImportError:
+            return False
+
+
+def localImports(fileName, seen=None):
+    """`fileName` and the python files of its directory it imports, recursively.
+
+    A module imported at the top level of a file that is neither in the
+    directory nor importable raises ImportError: its changes would go unnoticed.
+    """
+    seen = set() if seen is None else seen
+    if fileName in seen:
+        return seen
+    seen.add(fileName)
+    directory = os.path.dirname(fileName)
+    with open(fileName) as src:
+        for line in src:
+            match = IMPORT.match(line)
+            if not match:
+                continue
+            for name in (match.group(2) or match.group(3)).split(","):
+                name = name.strip()
+                if name.startswith(ANALYSIS_PACKAGE + "."):
+                    name = name[len(ANALYSIS_PACKAGE) + 1:]
+                local = os.path.join(directory, name.split(".")[0] + ".py")
+                if os.path.isfile(local):
+                    localImports(local, seen)
+                elif not match.group(1) and not _importable(name.split(".")[0]):
+                    # indented imports are optional (in functions, try blocks)
+                    raise ImportError("%s imports %s, which is neither in %s nor importable" % (
+                        fileName, name, directory or "."))
+    return seen
+
+
+def dataFiles(directory):
+    """All files below `directory` (scale factor tables, configurations, ...)."""
+    files = set()
+    for root, dirs, names in os.walk(directory):
+        files.update(os.path.join(root, name) for name in names if not name.endswith((".pyc", ".tmp")))
+    return files
+
+
+def configHash(files, options=""):
+    """sha1 of the names and contents of the configuration files and of `options`."""
+    digest = hashlib.sha1(options.encode("utf-8"))
+    for fileName in sorted(set(files)):
+        digest.update(("\0%s\0" % os.path.relpath(fileName)).encode("utf-8"))
+        with open(fileName, "rb") as src:
+            digest.update(src.read())
+    return digest.hexdigest()
+
+
+def jobKey(inputs, config):
+    return hashlib.sha1(("%s\n%s" % (config, "\n".join(sorted(inputs)))).encode("utf-8")).hexdigest()
+
+
+def countEntries(path, redirector=eosStorage.EOS_REDIRECTOR, treeName="Events"):
+    """Entries of the output tree, None if the file is unreadable; False without ROOT."""
+    try:
+        import ROOT
+    except ImportError:
+        return False
+    rootFile = ROOT.TFile.Open(redirector + "/" + path if redirector else path)
+    if not rootFile or rootFile.IsZombie() or rootFile.TestBit(ROOT.TFile.kRecovered):
+        return None
+    tree = rootFile.Get(treeName)
+    entries = int(tree.GetEntries()) if tree else None
+    rootFile.Close()
+    return entries
+
+
+class JobManifest(object):
+    def __init__(self, fileName, storage=None, redirector=eosStorage.EOS_REDIRECTOR):
+        """
+        Arguments:
+            fileName {str} -- manifest JSON file
+            storage -- eosStorage.EOSStorage (default) or LocalStorage, for the listings
+            redirector {str} -- prefix under which ROOT opens the outputs ("" for local files)
+        """
+        self.fileName = fileName
+        self.storage = storage if storage is not None else eosStorage.EOSStorage()
+        self.redirector = redirector
+        self.jobs = {}
+        self.directories = {}
+        self.samples = {}
+        if os.path.isfile(fileName):
+            with open(fileName) as src:
+                content = json.load(src)
+            self.jobs = content.get("jobs", {})
+            self.directories = content.get("directories", {})
+            self.samples = content.get("samples", {})
+        self._listings = {}
+        self.stats = {"valid": 0, "new": 0, "invalid": 0}
+
+    def _size(self, output):
+        directory, name = os.path.split(output)
+        if directory not in self._listings:
+            self._listings[directory] = self.storage.listSizes(directory)
+        return self._listings[directory].get(name)
+
+    def isValid(self, key):
+        """Whether the job `key` was done with a valid output; validates new outputs."""
+        job = self.jobs.get(key)
+        if job is None:
+            self.stats["new"] += 1
+            return False
+        size = self._size(job["output"])
+        if size is None:
+            valid = False
+        elif job.get("size") is not None:
+            valid = size == job["size"]
+        else:
+            entries = countEntries(job["output"], self.redirector)
+            valid = entries is not None and (entries is not False or size >= eosStorage.MIN_OUTPUT_SIZE)
+            if valid:
+                job["size"] = size
+                job["entries"] = entries if entries is not False else None
+                job["validated"] = time.time()
+        self.stats["valid" if valid else "invalid"] += 1
+        return valid
+
+    def outputDirectory(self, sample, default):
+        """Output directory of a sample: the one of its first submission, so that
+        the outputs of skipped and redone jobs stay together."""
+        return self.directories.setdefault(sample, default)
+
+    def plannedInputs(self, sample):
+        """Input files of each job planned for `sample` at the last submission."""
+        return [self.jobs[key]["inputs"] for key in self.samples.get(sample, []) if key in self.jobs]
+
+    def setPlanned(self, sample, keys):
+        """Make `keys` the jobs of `sample`; the jobs planned before and not
+        any more are dropped, and the outputs they wrote are returned."""
+        current = set(keys)
+        superseded = [key for key in self.samples.get(sample, []) if key not in current and key in self.jobs]
+        self.samples[sample] = list(keys)
+        return [self.jobs.pop(key)["output"] for key in superseded]
+
+    def record(self, key, inputs, output):
+        """Record a job (re)submitted for `key`, its output not validated yet."""
+        self.jobs[key] = {"inputs": sorted(inputs), "output": output, "size": None, "entries": None,
+                          "submitted": time.time()}
+
+    def save(self):
+        directory = os.path.dirname(self.fileName)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmpName = self.fileName + ".tmp"
+        with open(tmpName, "w") as out:
+            json.dump({"jobs": self.jobs, "directories": self.directories, "samples": self.samples}, out, indent=1, sort_keys=True)
+        os.rename(tmpName, self.fileName)
+
+    def report(self):
+        return "Manifest: %d job(s) already done, %d new, %d to redo (%d listing call(s))" % (
+            self.stats["valid"], self.stats["new"], self.stats["invalid"], self.storage.calls)
@@ -0,0 +1,114 @@
+"""Packing of input files into condor jobs of similar length.
+
+Each file costs its number of events. A file without an event count is
+estimated from its size (events per byte of the files of the sample with a
+count), else from the average of the sample; a sample without any event
+count gets one job per file. The files of a sample are spread over the
+smallest number of jobs that keeps the average job within the budget,
+largest file first onto the
+least loaded job, so that the jobs end up with about the same length. A
+file larger than the budget gets a job of its own.
+
+With the jobs of an earlier submission (`previous`), the jobs whose files are
+all still listed are kept as they were, and only the other files are packed:
+a file added to a sample, or a new budget, does not change the other jobs.
+"""
+import os
+import heapq
+
+
+def planJobs(files, budget, previous=None):
+    """Split `files` into jobs of about `budget` events each.
+
+    Arguments:
+        files {list} -- dicts with "name" and "nevents" (as from fileListing)
+        budget {int} -- events per job, 0 for one job per file
+        previous {list} -- file names of the jobs of an earlier submission, kept
+                           if all their files are in `files`
+
+    Returns:
+        list -- jobs, each a list of file dicts in listing order (kept jobs
+                first); files without an event count get an estimated one,
+                flagged "estimated"
+    """
+    if previous:
+        byName = dict((f["name"], f) for f in files)
+        kept = [[byName[name] for name in names] for names in previous
+                if names and all(name in byName for name in names)]
+        keptNames = set(f["name"] for job in kept for f in job)
+        order = dict((f["name"], n) for n, f in enumerate(files))
+        for job in kept:
+            job.sort(key=lambda f: order[f["name"]])
+        rest = [f for f in files if f["name"] not in keptNames]
+        return kept + (planJobs(rest, budget) if rest else [])
+    known = [f for f in files if f.get("nevents")]
+    if budget <= 0 or not known:
+        # nothing to pack by (e.g. eos listings): one job per file
+        return [[f] for f in files]
+    default = sum(f["nevents"] for f in known) // len(known)
+    sized = [f for f in known if f.get("size")]
+    eventsPerByte = float(sum(f["nevents"] for f in sized)) / sum(f["size"] for f in sized) if sized else None
+    files = [f if f.get("nevents") else
+             dict(f, nevents=max(1, int(f["size"] * eventsPerByte)) if f.get("size") and eventsPerByte else default,
+                  estimated=True)
+             for f in files]
+
+    big = [f for f in files if f["nevents"] >= budget]
+    small = [f for f in files if f["nevents"] < budget]
+    nJobs = -(-sum(f["nevents"] for f in small) // budget)
+    heap = [(0, i, []) for i in range(nJobs)]
+    for f in sorted(small, key=lambda f: -f["nevents"]):
+        load, i, job = heapq.heappop(heap)
+        job.append(f)
+        heapq.heappush(heap, (load + f["nevents"], i, job))
+    order = dict((f["name"], n) for n, f in enumerate(files))
+    jobs = [[f] for f in big] + [job for load, i, job in sorted(heap, key=lambda item: item[1]) if job]
+    for job in jobs:
+        job.sort(key=lambda f: order[f["name"]])
+    return sorted(jobs, key=lambda job: order[job[0]["name"]])
+
+
+def jobEvents(job):
+    return sum(f.get("nevents") or 0 for f in job)
+
+
+def jobSizeGB(job):
+    return sum(f.get("size") or 0 for f in job) / 1024.**3
+
+
+def printJobLengthDistribution(jobs, eventsPerSecond, nBins=10):
+    """Print the predicted job lengths (events / eventsPerSecond) as a text histogram."""
+    if not jobs:
+        print("No jobs")
+        return
+    if not any(jobEvents(job) for job in jobs):
+        print("No event counts, job lengths unknown for %d job(s)" % len(jobs))
+        return
+    hours = sorted(jobEvents(job) / float(eventsPerSecond) / 3600. for job in jobs)
+    n = len(hours)
+    print("Predicted job length for %d job(s) at %.0f events/s: min %.2f h, median %.2f h, 90%% %.2f h, max %.2f h, total %.1f h" % (
+        n, eventsPerSecond, hours[0], hours[n // 2], hours[min(n - 1, int(0.9 * n))], hours[-1], sum(hours)))
+    width = (hours[-1] - hours[0]) / nBins or (hours[-1] or 1.) / nBins
+    counts = [0] * nBins
+    for h in hours:
+        counts[min(nBins - 1, int((h - hours[0]) / width))] += 1
+    for i, count in enumerate(counts):
+        print("  %6.2f - %6.2f h | %5d %s" % (hours[0] + i * width, hours[0] + (i + 1) * width, count,
+                                           "#" * int(round(50. * count / max(counts)))))
+
+
+def writeJobLists(jobs, directory, prefix, redirector="", names=None):
+    """Write one file list per job (post_proc.py .txt input) and return their paths.
+
+    The lists are <prefix>_<i>.txt, or <prefix>_<names[i]>.txt if `names` are given.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    paths = []
+    for i, job in enumerate(jobs):
+        path = os.path.join(directory, "%s_%s.txt" % (prefix, names[i] if names else i))
+        with open(path, "w") as out:
+            for f in job:
+                out.write(redirector + f["name"] + "\n")
+        paths.append(path)
+    return paths
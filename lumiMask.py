@@ -0,0 +1,179 @@
+"""Golden-JSON lumi mask compiled to sorted interval arrays.
+
+A Cert_*_JSON.txt file ({"run": [[firstLumi, lastLumi], ...], ...}) is turned
+into two sorted int64 arrays holding the first and last (run, lumi) key of
+every certified interval, with key = run << 32 | lumi. A whole block of
+entries is then checked with one `searchsorted`. The compiled arrays are
+cached on disk, keyed by the SHA-1 of the JSON file, so jobs sharing a node
+or a working area parse each JSON only once.
+"""
+
+import os
+import json
+import hashlib
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = ".lumimask_cache"
+
+
+def lumiKey(run, lumi):
+    """Combine run and lumi numbers (scalars or arrays) into one sortable key."""
+    return (np.asarray(run, dtype=np.int64) << 32) | np.asarray(lumi, dtype=np.int64)
+
+
+def compileJSON(runsAndLumis):
+    """Sorted, merged interval keys from a {run: [[first, last], ...]} dict."""
+    intervals = sorted((int(run), int(first), int(last))
+                       for run, ranges in runsAndLumis.items()
+                       for first, last in ranges)
+    merged = []
+    for run, first, last in intervals:
+        if merged and merged[-1][0] == run and first <= merged[-1][2] + 1:
+            merged[-1][2] = max(merged[-1][2], last)
+        else:
+            merged.append([run, first, last])
+    runs = np.array([m[0] for m in merged], dtype=np.int64)
+    first = lumiKey(runs, [m[1] for m in merged])
+    last = lumiKey(runs, [m[2] for m in merged])
+    return first, last
+
+
+class LumiMask(object):
+    def __init__(self, jsonFile, cacheDir=DEFAULT_CACHE_DIR):
+        """
+        Arguments:
+            jsonFile {str} -- path of the golden JSON
+            cacheDir {str} -- directory for the compiled form, None to disable caching
+        """
+        self.jsonFile = jsonFile
+        with open(jsonFile, "rb") as src:
+            content = src.read()
+        self.digest = hashlib.sha1(content).hexdigest()
+
+        cacheFile = os.path.join(cacheDir, self.digest + ".npz") if cacheDir else None
+        if cacheFile and os.path.isfile(cacheFile):
+            with np.load(cacheFile) as cached:
+                self.first, self.last = cached["first"], cached["last"]
+        else:
+            self.first, self.last = compileJSON(json.loads(content.decode("utf-8")))
+            if cacheFile:
+                if not os.path.isdir(cacheDir):
+                    os.makedirs(cacheDir)
+                tmp = cacheFile + ".%d.tmp.npz" % os.getpid()
+                np.savez(tmp, first=self.first, last=self.last)
+                os.rename(tmp, cacheFile)
+
+        # run -> slice of its intervals, for O(1) rejection of runs absent from the JSON
+        runs = self.first >> 32
+        self.runs, starts, counts = np.unique(runs, return_index=True, return_counts=True)
+        self._runIntervals = dict((int(r), (int(s), int(s + c))) for r, s, c in zip(self.runs, starts, counts))
+
+    def hasRun(self, run):
+        return int(run) in self._runIntervals
+
+    def isCertified(self, run, lumi):
+        """Check a single (run, lumi) pair."""
+        interval = self._runIntervals.get(int(run))
+        if interval is None:
+            return False
+        start, stop = interval
+        i = int(np.searchsorted(self.first[start:stop], lumiKey(run, lumi), side="right")) - 1
+        return i >= 0 and lumiKey(run, lumi) <= self.last[start + i]
+
+    def mask(self, run, lumi):
+        """Vectorised check of whole blocks of entries.
+
+        Arguments:
+            run {array} -- run numbers
+            lumi {array} -- luminosity block numbers, same length as run
+
+        Returns:
+            numpy array -- True for certified (run, lumi) pairs
+        """
+        keys = lumiKey(run, lumi)
+        if len(self.first) == 0:
+            return np.zeros(keys.shape, dtype=bool)
+        i = np.searchsorted(self.first, keys, side="right") - 1
+        return (i >= 0) & (keys <= self.last[np.clip(i, 0, None)])
+
+    def runsAndLumis(self):
+        """The mask as a {"run": [[first, last], ...]} dict, usable as PostProcessor `jsonInput`."""
+        result = {}
+        mask32 = (1 << 32) - 1
+        for first, last in zip(self.first.tolist(), self.last.tolist()):
+            result.setdefault(str(first >> 32), []).append([first & mask32, last & mask32])
+        return result
+
+
+def lfnOf(fileName):
+    """Logical file name (/store/...) of a local path or xrootd URL, used as cache key;
+    the same for every redirector or mount point serving the file. Without /store/,
+    URLs are kept as they are and local paths made absolute."""
+    index = fileName.find("/store/")
+    if index != -1:
+        return fileName[index:]
+    return fileName if "://" in fileName else os.path.abspath(fileName)
+
+
+def readLumiSummary(fileName):
+    """(run, lumi) arrays from the small LuminosityBlocks tree of a NanoAOD file."""
+    import ROOT
+    from treeArrays import drawArrays
+    inFile = ROOT.TFile.Open(fileName)
+    if not inFile or inFile.IsZombie():
+        raise IOError("Could not open %s" % fileName)
+    try:
+        tree = inFile.Get("LuminosityBlocks")
+        if not tree:
+            raise IOError("No LuminosityBlocks tree in %s" % fileName)
+        n = tree.GetEntries()
+        run, lumi = drawArrays(tree, ["run", "luminosityBlock"], 0, n, [np.int64, np.int64], eventLoop=False)
+    finally:
+        inFile.Close()
+    return run, lumi
+
+
+def certifiedFiles(fileNames, lumiMask, cacheFile=os.path.join(DEFAULT_CACHE_DIR, "lumi_summary.json")):
+    """Split input files into those with at least one certified lumi and those without.
+
+    Only the LuminosityBlocks tree is read, and the (run, lumi) summary of every
+    file is cached by LFN, so resubmissions do not open the files again. Files
+    that cannot be summarised are kept, so that the real run reports the error.
+
+    Returns:
+        tuple -- (files to process, fully uncertified files)
+    """
+    cache = {}
+    if cacheFile and os.path.isfile(cacheFile):
+        with open(cacheFile) as src:
+            cache = json.load(src)
+
+    keep, skipped = [], []
+    updated = False
+    for fileName in fileNames:
+        lfn = lfnOf(fileName)
+        if lfn not in cache:
+            try:
+                run, lumi = readLumiSummary(fileName)
+            except IOError as err:
+                print("WARNING: lumi pre-filter could not read %s (%s), keeping it" % (fileName, err))
+                keep.append(fileName)
+                continue
+            cache[lfn] = [run.tolist(), lumi.tolist()]
+            updated = True
+        run, lumi = cache[lfn]
+        if lumiMask.mask(run, lumi).any():
+            keep.append(fileName)
+        else:
+            skipped.append(fileName)
+
+    if cacheFile and updated:
+        cacheDir = os.path.dirname(cacheFile)
+        if cacheDir and not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+        tmp = cacheFile + ".%d.tmp" % os.getpid()
+        with open(tmp, "w") as out:
+            json.dump(cache, out)
+        os.rename(tmp, cacheFile)
+    return keep, skipped
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""Convert the jet PUID scale factor maps into the binary table read by JetSFMaker.
+
+JetSFMaker memory-maps the table instead of opening the ROOT file. The table
+records the sha1 of the ROOT file and the maps it holds: JetSFMaker falls back
+to the ROOT file (with a message to rerun the conversion) when the ROOT file
+changed or data/JetPUID_cfg.py asks for a map the table lacks. Paths are relative to $CMSSW_BASE/src, as in JetSFMaker.
+
+    python make_puid_sf_table.py                 # all years in jet_puid_sf
+    python make_puid_sf_table.py -y 2017 2018
+"""
+import os
+import argparse
+
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+from JetSFMaker import PUIDSFMap, load_puid_sf_config, default_puid_sf_table, write_puid_sf_table, file_sha1
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--config", default="PhysicsTools/NanoAODTools/python/postprocessing/analysis/nanoAOD_vvVBS/data/JetPUID_cfg.py", type=str, help="PUID scale factor configuration")
+    parser.add_argument("-y", "--years", nargs="+", default=None, help="Years to convert (default: all)")
+    parser.add_argument("-o", "--output", default=None, type=str, help="Output table (default: next to the source ROOT file)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    cmssw_base = os.getenv('CMSSW_BASE')
+    jet_puid_sf = load_puid_sf_config(args.config)
+    years = args.years if args.years else sorted(jet_puid_sf)
+
+    # One table per source ROOT file, holding the maps of all requested years
+    by_source = {}
+    for year in years:
+        cfg = jet_puid_sf[year]
+        names = by_source.setdefault(cfg['source'], set())
+        names.update(value for key, value in cfg.items() if key != 'source')
+
+    if args.output and len(by_source) > 1:
+        print("ERROR: --output given but the years use %d different source files" % len(by_source))
+        exit(1)
+
+    for source_name, names in sorted(by_source.items()):
+        source = ROOT.TFile.Open(cmssw_base + '/src/' + source_name)
+        maps = {}
+        for name in sorted(names):
+            hist = source.Get(name)
+            if not hist:
+                print("ERROR: %s not found in %s" % (name, source_name))
+                exit(1)
+            maps[name] = PUIDSFMap.fromTH2(hist)
+        source.Close()
+
+        table = args.output if args.output else cmssw_base + '/src/' + default_puid_sf_table(source_name)
+        write_puid_sf_table(table, maps, file_sha1(cmssw_base + '/src/' + source_name))
+        print("Wrote %d maps to %s (%d bytes)" % (len(maps), table, os.path.getsize(table)))
+
+
+if __name__ == "__main__":
+    main()
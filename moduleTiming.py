@@ -0,0 +1,128 @@
+"""Wall/CPU time and accept/reject counts per module of a PostProcessor chain.
+
+Wrap the modules with `TimedModule` before handing them to the PostProcessor;
+the wrapper forwards every call and attribute to the module it wraps.
+`timingReport` summarises a wrapped chain, `combineTimingReports` adds up the
+reports of several files (or worker processes) and `writeTimingReport` writes
+the JSON report next to the output file.
+"""
+import json
+import math
+import time
+
+cpuTime = getattr(time, "process_time", None) or time.clock
+
+# per-event analyze() wall time histogram: log10 bins from 1 us to 10 s
+HISTOGRAM_LOG10_MIN = -6.
+HISTOGRAM_LOG10_MAX = 1.
+HISTOGRAM_BINS_PER_DECADE = 5
+HISTOGRAM_NBINS = int((HISTOGRAM_LOG10_MAX - HISTOGRAM_LOG10_MIN) * HISTOGRAM_BINS_PER_DECADE)
+
+
+def _emptyCounter():
+    return {"calls": 0, "wall": 0., "cpu": 0.}
+
+
+class TimedModule(object):
+    def __init__(self, module, sampleEvery=10):
+        """
+        Arguments:
+            module {Module} -- module to instrument
+            sampleEvery {int} -- fill the per-event time histogram every N events
+        """
+        self.__dict__["_module"] = module
+        self.__dict__["_sampleEvery"] = max(1, sampleEvery)
+        self.__dict__["_timing"] = {
+            "module": module.__class__.__name__,
+            "beginJob": _emptyCounter(), "beginFile": _emptyCounter(),
+            "analyze": _emptyCounter(), "endFile": _emptyCounter(), "endJob": _emptyCounter(),
+            "accepted": 0, "rejected": 0,
+            "analyzeHistogram": {"log10Min": HISTOGRAM_LOG10_MIN, "log10Max": HISTOGRAM_LOG10_MAX,
+                                 "counts": [0] * (HISTOGRAM_NBINS + 2)},
+        }
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._module, name, value)
+
+    def _timed(self, step, method, *args, **kwargs):
+        wall0, cpu0 = time.time(), cpuTime()
+        result = method(*args, **kwargs)
+        counter = self._timing[step]
+        counter["calls"] += 1
+        counter["wall"] += time.time() - wall0
+        counter["cpu"] += cpuTime() - cpu0
+        return result
+
+    def beginJob(self, *args, **kwargs):
+        return self._timed("beginJob", self._module.beginJob, *args, **kwargs)
+
+    def endJob(self, *args, **kwargs):
+        return self._timed("endJob", self._module.endJob, *args, **kwargs)
+
+    def beginFile(self, *args, **kwargs):
+        return self._timed("beginFile", self._module.beginFile, *args, **kwargs)
+
+    def endFile(self, *args, **kwargs):
+        return self._timed("endFile", self._module.endFile, *args, **kwargs)
+
+    def analyze(self, event):
+        timing = self._timing
+        counter = timing["analyze"]
+        wall0, cpu0 = time.time(), cpuTime()
+        result = self._module.analyze(event)
+        wall = time.time() - wall0
+        counter["cpu"] += cpuTime() - cpu0
+        counter["wall"] += wall
+        counter["calls"] += 1
+        if result:
+            timing["accepted"] += 1
+        else:
+            timing["rejected"] += 1
+        if counter["calls"] % self._sampleEvery == 0:
+            counts = timing["analyzeHistogram"]["counts"]
+            if wall <= 0.:
+                counts[0] += 1
+            else:
+                ibin = int(math.floor((math.log10(wall) - HISTOGRAM_LOG10_MIN) * HISTOGRAM_BINS_PER_DECADE)) + 1
+                counts[min(max(ibin, 0), HISTOGRAM_NBINS + 1)] += 1
+        return result
+
+
+def timingReport(modules):
+    """Timing summary of a chain of TimedModule, in chain order."""
+    return [dict(m._timing, position=i) for i, m in enumerate(modules) if isinstance(m, TimedModule)]
+
+
+def combineTimingReports(reports):
+    """Add up reports of the same module chain, e.g. one per input file."""
+    reports = [r for r in reports if r]
+    if not reports:
+        return []
+    combined = json.loads(json.dumps(reports[0]))
+    for report in reports[1:]:
+        for total, entry in zip(combined, report):
+            for step in ("beginJob", "beginFile", "analyze", "endFile", "endJob"):
+                for key in ("calls", "wall", "cpu"):
+                    total[step][key] += entry[step][key]
+            total["accepted"] += entry["accepted"]
+            total["rejected"] += entry["rejected"]
+            total["analyzeHistogram"]["counts"] = [a + b for a, b in zip(total["analyzeHistogram"]["counts"],
+                                                                          entry["analyzeHistogram"]["counts"])]
+    return combined
+
+
+def writeTimingReport(report, fileName):
+    """Write the report as JSON and print a one-line summary per module."""
+    for entry in report:
+        analyze = entry["analyze"]
+        rate = analyze["calls"] / analyze["wall"] if analyze["wall"] > 0 else 0.
+        entry["analyzeEventsPerSecond"] = rate
+        print(("TIMING: {:2d} {:<30s} analyze {:8.2f} s wall {:8.2f} s cpu {:10.0f} ev/s  accepted {} rejected {}"
+               .format(entry["position"], entry["module"], analyze["wall"], analyze["cpu"], rate,
+                       entry["accepted"], entry["rejected"])))
+    with open(fileName, "w") as out:
+        json.dump({"modules": report}, out, indent=2)
+    print(("TIMING: report written to {}".format(fileName)))
@@ -0,0 +1,144 @@
+"""Threads, compression and basket layout of the skim output, and the I/O report.
+
+`enableImplicitMT` turns on ROOT implicit multithreading, which decompresses
+the input baskets of an entry and compresses the output baskets in parallel.
+`outputLayoutProducer` must be the last module of the chain: in beginFile all
+output branches exist, so it can set their basket size and the auto-flush
+interval of the output tree. It also times the Fill (which compresses the full
+baskets) and the Write of the output tree, and counts the bytes they wrote
+(`writeStats`; the final Close of the file, which only writes the keys, is not
+timed). `writeIOReport` records the settings next to the size and compression
+of the output file, the output MB per second of write time and the output MB
+per second of job wall time (processing and merging).
+"""
+import os
+import json
+import time
+
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+from PhysicsTools.NanoAODTools.postprocessing.framework.eventloop import Module
+
+COMPRESSION_ALGORITHMS = ["ZLIB", "LZMA", "LZ4", "ZSTD"]
+
+
+def compressionSetting(value):
+    """Check an "ALGO:LEVEL" compression setting (as accepted by PostProcessor)."""
+    algo, sep, level = value.partition(":")
+    if algo.upper() not in COMPRESSION_ALGORITHMS or not sep or not level.isdigit() or int(level) > 9:
+        raise ValueError("compression must be ALGO:LEVEL with ALGO in %s and LEVEL in 0-9, got %r" % (
+            "/".join(COMPRESSION_ALGORITHMS), value))
+    return "%s:%s" % (algo.upper(), level)
+
+
+def enableImplicitMT(threads):
+    """Enable ROOT implicit multithreading with `threads` threads (0 or 1: off)."""
+    if threads > 1:
+        ROOT.ROOT.EnableImplicitMT(threads)
+
+
+class outputLayoutProducer(Module):
+    def __init__(self, basketSize=0, autoFlush=0):
+        """
+        Arguments:
+            basketSize {int} -- basket size in bytes of every output branch, 0 to keep ROOT's
+            autoFlush {int} -- TTree::SetAutoFlush value (> 0 entries, < 0 bytes), 0 to keep ROOT's
+        """
+        self.basketSize = basketSize
+        self.autoFlush = autoFlush
+        self.writeStats = _emptyWriteStats()
+    def beginFile(self, inputFile, outputFile, inputTree, wrappedOutputTree):
+        if wrappedOutputTree is None:
+            return
+        tree = wrappedOutputTree._tree
+        if self.autoFlush:
+            tree.SetAutoFlush(self.autoFlush)
+        if self.basketSize > 0:
+            tree.SetBasketSize("*", self.basketSize)
+        self._timeWrites(wrappedOutputTree, tree)
+    def _timeWrites(self, wrappedOutputTree, tree):
+        fill, write = wrappedOutputTree.fill, wrappedOutputTree.write
+        stats = self.writeStats
+        def timedFill(*args, **kwargs):
+            t0 = time.time()
+            result = fill(*args, **kwargs)
+            stats["writeTime"] += time.time() - t0
+            return result
+        def timedWrite(*args, **kwargs):
+            t0 = time.time()
+            result = write(*args, **kwargs)
+            stats["writeTime"] += time.time() - t0
+            stats["entries"] += tree.GetEntries()
+            stats["compressedBytes"] += tree.GetZipBytes()
+            stats["uncompressedBytes"] += tree.GetTotBytes()
+            return result
+        wrappedOutputTree.fill = timedFill
+        wrappedOutputTree.write = timedWrite
+    def analyze(self, event):
+        return True
+
+
+def _emptyWriteStats():
+    return {"writeTime": 0., "entries": 0, "compressedBytes": 0, "uncompressedBytes": 0}
+
+
+def chainWriteStats(modules):
+    """Write statistics of the outputLayoutProducer of a chain (possibly wrapped), None if it has none."""
+    for module in modules:
+        if isinstance(getattr(module, "_module", module), outputLayoutProducer):
+            return dict(module.writeStats)
+    return None
+
+
+def combineWriteStats(stats):
+    """Add up the write statistics of several chains (e.g. one per input file), None if there are none."""
+    stats = [s for s in stats if s]
+    if not stats:
+        return None
+    combined = _emptyWriteStats()
+    for entry in stats:
+        for key in combined:
+            combined[key] += entry[key]
+    return combined
+
+
+def ioReportName(outFileName):
+    return os.path.splitext(outFileName)[0] + "_io.json"
+
+
+def writeIOReport(outFileName, settings, wallTime, writeStats=None):
+    """Write the I/O settings, output size and output rates into <output>_io.json.
+
+    Arguments:
+        outFileName {str} -- final output file of the job
+        settings {dict} -- threads, compression, basketSize, autoFlush
+        wallTime {float} -- time spent on processing and merging, in seconds
+        writeStats {dict} -- Fill/Write time and bytes of the output trees (chainWriteStats), None if unknown
+    """
+    report = dict(settings, outputFile=outFileName, wallTime=wallTime)
+    if writeStats and writeStats["writeTime"] > 0:
+        report["writeTime"] = writeStats["writeTime"]
+        report["writeMBPerSecond"] = writeStats["compressedBytes"] / 1048576. / writeStats["writeTime"]
+        report["uncompressedWriteMBPerSecond"] = writeStats["uncompressedBytes"] / 1048576. / writeStats["writeTime"]
+    if os.path.isfile(outFileName):
+        report["fileSizeBytes"] = os.path.getsize(outFileName)
+        report["outputMBPerJobSecond"] = report["fileSizeBytes"] / 1048576. / max(wallTime, 1e-6)
+        outFile = ROOT.TFile.Open(outFileName)
+        tree = outFile.Get("Events") if outFile else None
+        if tree:
+            report["entries"] = tree.GetEntries()
+            report["uncompressedBytes"] = tree.GetTotBytes()
+            report["compressedBytes"] = tree.GetZipBytes()
+            report["compressionFactor"] = tree.GetTotBytes() / float(max(tree.GetZipBytes(), 1))
+            report["uncompressedMBPerJobSecond"] = tree.GetTotBytes() / 1048576. / max(wallTime, 1e-6)
+        if outFile:
+            outFile.Close()
+        print(("IO: {} {:.1f} MB in {:.1f} s of job ({:.1f} MB/s of job), written at {:.1f} MB/s "
+               "({:.1f} s of Fill/Write), compression factor {:.2f}".format(
+            outFileName, report["fileSizeBytes"] / 1048576., wallTime, report["outputMBPerJobSecond"],
+            report.get("writeMBPerSecond", 0.), report.get("writeTime", 0.), report.get("compressionFactor", 0.))))
+    else:
+        print(("IO: output file {} not found".format(outFileName)))
+    with open(ioReportName(outFileName), "w") as out:
+        json.dump(report, out, indent=2, sort_keys=True)
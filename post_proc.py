@@ -1,201 +1,522 @@
-<<<<<<< HEAD
-#!/usr/bin/env python
-import os,sys
+#!/usr/bin/env python3
+import os
+import sys
+import inspect
+import time
+import json
+import shutil
+import hashlib
+import argparse
+import traceback
+import multiprocessing
+
+import ROOT
 
 from PhysicsTools.NanoAODTools.postprocessing.framework.postprocessor import PostProcessor
-from wvAnalysisModule import *
-from PhysicsTools.NanoAODTools.postprocessing.modules.jme.jetmetHelperRun2 import *
-from PhysicsTools.NanoAODTools.postprocessing.modules.btv.btagSFProducer import *
+from PhysicsTools.NanoAODTools.postprocessing.modules.common.muonScaleResProducer import *
+from PhysicsTools.NanoAODTools.postprocessing.modules.jme.jetmetHelperRun2 import createJMECorrector
+from PhysicsTools.NanoAODTools.postprocessing.modules.btv.btagSFProducer import btagSFProducer
+from PhysicsTools.NanoAODTools.postprocessing.modules.common.puWeightProducer import *
+
+# Custom module imports
+from H4Lmodule import *
+from H4LCppModule import *
 from JetSFMaker import *
+from friendModules import friendIndexModule, skimFlagModule
+from moduleTiming import TimedModule, timingReport, combineTimingReports, writeTimingReport
+from lumiMask import LumiMask, certifiedFiles
+from prefetcher import Prefetcher, fileSize, copyFile
+from streamMerge import StreamingMerger
+from collectionCache import shareCollections
+from branchPruning import inputBranchSelection
+from blockCache import BlockCache, LocalSource
+from entryRanges import entryRangeParts, Checkpoint
+from outputSettings import compressionSetting, enableImplicitMT, outputLayoutProducer, writeIOReport, chainWriteStats, combineWriteStats
+
+# per-file outputs of the multi-file modes, one sub-directory per input file
+PER_FILE_OUTPUT_DIR = "per_file_output"
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--inputFile", default="", type=str, help="Input file name")
+    parser.add_argument("-n", "--entriesToRun", default=100, type=int, help="Set  to 0 if need to run over all entries else put number of entries to run")
+    parser.add_argument("-d", "--DownloadFileToLocalThenRun", default=True, type=bool, help="Download file to local then run")
+    parser.add_argument("--NOsyst", default=False, action="store_true", help="Do not run systematics")
+    parser.add_argument("--workers", default=1, type=int, help="Number of processes; with more than one, the input files are processed in parallel and merged")
+    parser.add_argument("--prefetchAhead", default=0, type=int, help="Download this many files ahead in the background while the current one is processed")
+    parser.add_argument("--scratchDir", default="prefetch_scratch", type=str, help="Local directory for the --prefetchAhead copies")
+    parser.add_argument("--scratchLimitGB", default=20., type=float, help="Limit on the disk used by the --prefetchAhead copies, 0 for no limit")
+    parser.add_argument("--friend", default=False, action="store_true", help="MC: write only the new branches (plus run/lumi/event and the skim flag) as a friend tree aligned to the input")
+    parser.add_argument("--timing", default=False, action="store_true", help="Record wall/CPU time and accepted/rejected events per module into <output>_timing.json")
+    parser.add_argument("--noLumiPrefilter", default=False, action="store_true", help="Data: do not skip input files without any certified lumi")
+    parser.add_argument("--cut", default=None, type=str, help="Preselection (TTreeFormula) evaluated before the module chain, e.g. 'nMuon + nElectron >= 2'")
+    parser.add_argument("--pruneInputBranches", default=False, action="store_true", help="Disable the input branches not read by the modules (traced on a calibration pass, cached)")
+    parser.add_argument("--calibrationEntries", default=2000, type=int, help="Entries of the --pruneInputBranches calibration pass")
+    parser.add_argument("--keepInputBranches", nargs="+", default=[], help="Extra input branch patterns for --pruneInputBranches, for reads that cannot be traced")
+    parser.add_argument("--shareCollections", default=False, action="store_true", help="Let the JME correctors and btag SF producer use the per-event collection cache")
+    parser.add_argument("--threads", default=1, type=int, help="ROOT implicit multithreading threads (basket decompression/compression) per process")
+    parser.add_argument("--compression", default="LZMA:9", type=compressionSetting, help="Output compression ALGO:LEVEL, ALGO in ZLIB/LZMA/LZ4/ZSTD")
+    parser.add_argument("--basketSize", default=0, type=int, help="Basket size in bytes of the output branches, 0 for the ROOT default")
+    parser.add_argument("--autoFlush", default=0, type=int, help="Auto-flush of the output tree (> 0 entries, < 0 bytes), 0 for the ROOT default")
+    parser.add_argument("--firstEntry", default=0, type=int, help="Single input file: first entry to process; -n gives the number of entries (0: to the end)")
+    parser.add_argument("--checkpointEvery", default=0, type=int, help="Single input file: commit the output every N entries, a rerun resumes after the last commit")
+    parser.add_argument("--checkpointDir", default="checkpoint", type=str, help="Directory of the checkpoint, the committed parts and the local input copy")
+    parser.add_argument("--blockCache", default="", type=str, help="Node-local block cache directory for the remote inputs, shared by the jobs of the node")
+    parser.add_argument("--blockCacheGB", default=50., type=float, help="Size limit of the --blockCache directory")
+    parser.add_argument("--blockCacheSource", default="", type=str, help="Serve root:// inputs of the block cache from this local directory instead of xrootd (tests)")
+    return parser.parse_args()
+
+
+def getListFromFile(filename):
+    """Read file list from a text file. LFNs (/store/...) are read through the
+    global redirector, full URLs and local paths are kept as they are."""
+    files = []
+    with open(filename, "r") as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            files.append("root://cms-xrd-global.cern.ch/" + line if line.startswith("/store/") else line)
+    return files
+
+
+def jobSettings(first_file):
+    """Determine the year and type (MC or Data) of input ROOT file:
+    For data the string "/data/" is always there. So, we take this
+    as handle to decide if the root file is MC or data.
+    """
+    settings = {"isMC": "/data/" not in first_file, "isFSR": False, "year": None,
+                "cfgFile": None, "jsonFileName": None, "sfFileName": None}
+
+    if "Summer22" in first_file or "Run2022" in first_file:
+        """Summer22 and Run2022 for identification of 2022 MC and data respectiverly
+        """
+        settings.update(year = 2022, cfgFile = "Input_2022.yml",
+                        jsonFileName = "golden_Json/Cert_Collisions2022_355100_362760_Golden.json",
+                        sfFileName = "DeepCSV_102XSF_V2.csv") # FIXME: Update for year 2022
+    if "UL18" in first_file or "UL2018" in first_file:
+        """UL2018 for identification of 2018 UL data and UL18 for identification of 2018 UL MC
+        """
+        settings.update(year = 2018, cfgFile = "Input_2018.yml",
+                        jsonFileName = "golden_Json/Cert_314472-325175_13TeV_Legacy2018_Collisions18_JSON.txt",
+                        sfFileName = "DeepCSV_102XSF_V2.csv")
+    if "UL17" in first_file or "UL2017" in first_file:
+        settings.update(year = 2017, cfgFile = "Input_2017.yml",
+                        jsonFileName = "golden_Json/Cert_294927-306462_13TeV_UL2017_Collisions17_GoldenJSON.txt",
+                        sfFileName = "DeepCSV_102XSF_V2.csv")
+    if "UL16" in first_file or "UL2016" in first_file:
+        settings.update(year = 2016,
+                        jsonFileName = "golden_Json/Cert_271036-284044_13TeV_Legacy2016_Collisions16_JSON.txt",
+                        sfFileName = "DeepCSV_102XSF_V2.csv")
+    return settings
+
+
+def buildModules(settings, args):
+    """Module chain for the given job settings.
+
+    Called once per process, so that worker processes build their own modules.
+    """
+    modulesToRun = []
+    year = settings["year"]
+    isMC = settings["isMC"]
+
+    #if year == 2022: modulesToRun.extend([lambda: muonScaleResProducer('','', 2022)]) # FIXME: Update for year 2022
+    if year == 2018: modulesToRun.extend([muonScaleRes2018()])
+    if year == 2017: modulesToRun.extend([muonScaleRes2017()])
+    if year == 2016: modulesToRun.extend([muonScaleRes2016()])
+
+    H4LCppModule = lambda: HZZAnalysisCppProducer(year, settings["cfgFile"], isMC, settings["isFSR"])
+    modulesToRun.extend([H4LCppModule()])
+
+    if isMC:
+        if (not args.NOsyst):
+            # FIXME: JES not used properly
+            #jetmetCorrector = createJMECorrector(isMC=isMC, dataYear=year, jesUncert="All", jetType = "AK4PFchs")
+            #fatJetCorrector = createJMECorrector(isMC=isMC, dataYear=year, jesUncert="All", jetType = "AK8PFPuppi")
+            # btagSF = lambda: btagSFProducer("UL"+str(year), algo="deepjet",selectedWPs=['L','M','T','shape_corr'], sfFileName=sfFileName)
+            btagSF = lambda: btagSFProducer(era = "UL"+str(year), algo = "deepcsv")
+            puidSF = lambda: JetSFMaker("%s" % year)
+            #modulesToRun.extend([jetmetCorrector(), fatJetCorrector()])#, puidSF()
+            # # modulesToRun.extend([jetmetCorrector(), fatJetCorrector(), btagSF(), puidSF()])
+
+        # FIXME: No PU weight for 2022
+        if year == 2018: modulesToRun.extend([puAutoWeight_2018()])
+        if year == 2017: modulesToRun.extend([puAutoWeight_2017()])
+        if year == 2016: modulesToRun.extend([puAutoWeight_2016()])
+    #else:
+        #if (not args.NOsyst):
+            # FIXME: JES not used properly
+            #jetmetCorrector = createJMECorrector(isMC=isMC, dataYear=year, jesUncert="All", jetType = "AK4PFchs")
+            #fatJetCorrector = createJMECorrector(isMC=isMC, dataYear=year, jesUncert="All", jetType = "AK8PFPuppi")
+            #modulesToRun.extend([jetmetCorrector(), fatJetCorrector()])
+
+    # last, so that the branches of all modules exist when it runs; it also times the output writes
+    modulesToRun.append(outputLayoutProducer(args.basketSize, args.autoFlush))
+    if args.shareCollections:
+        print("Collections shared with: %s" % ", ".join(shareCollections()))
+    if args.friend:
+        modulesToRun = [friendIndexModule()] + modulesToRun + [skimFlagModule()]
+    if args.timing:
+        modulesToRun = [TimedModule(m) for m in modulesToRun]
+    return modulesToRun
+
+
+def makeBlockCache(args):
+    """BlockCache of --blockCache, None if it is not used."""
+    if not args.blockCache:
+        return None
+    source = LocalSource(args.blockCacheSource) if args.blockCacheSource else None
+    return BlockCache(args.blockCache, int(args.blockCacheGB * 1024**3), source=source)
+
+
+def singleOutputName(testfilelist, options):
+    """Merged output of a single PostProcessor run (named after the last input by the patched hadd step)."""
+    postfix = "_Friend" if options.get("friend") else "_Skim"
+    return os.path.basename(testfilelist[-1]).replace(".root", postfix + "Hadd.root")
+
+
+def timingReportName(haddFileName):
+    return os.path.splitext(haddFileName)[0] + "_timing.json"
+
+
+def runChain(fname, outputDir, settings, options, args):
+    """Run the module chain over a single input file, writing into `outputDir`.
+
+    Returns:
+        tuple -- (output file or None, error message or None, timing report of the modules or None,
+                  write statistics of the output or None)
+    """
+    try:
+        if not os.path.isdir(outputDir):
+            os.makedirs(outputDir)
+        fileOptions = dict(options, haddFileName=None, fwkJobReport=False)
+        modules = buildModules(settings, args)
+        p = PostProcessor(outputDir, [fname], modules = modules, **fileOptions)
+        p.run()
+        timing = timingReport(modules) if args.timing else None
+        writeStats = chainWriteStats(modules)
+        postfix = "_Friend" if options.get("friend") else "_Skim"
+        outFileName = os.path.join(outputDir, os.path.basename(fname).replace(".root", postfix + ".root"))
+        if not os.path.isfile(outFileName):
+            return None, "no output file {}".format(outFileName), timing, writeStats
+        return outFileName, None, timing, writeStats
+    except Exception:
+        return None, traceback.format_exc(), None, None
+
+
+def processFile(task):
+    """Run the module chain over a single input file (worker process of --workers).
+
+    Returns:
+        tuple -- (index, input file, output file or None, error message or None,
+                  timing report of the modules or None, write statistics of the output or None)
+    """
+    index, fname, settings, options, args = task
+    outputDir = os.path.join(PER_FILE_OUTPUT_DIR, "%04d" % index)
+    blockCache = makeBlockCache(args)
+    if blockCache is None or not fname.startswith("root://"):
+        outFileName, error, timing, writeStats = runChain(fname, outputDir, settings, options, args)
+        return index, fname, outFileName, error, timing, writeStats
+    # the local copy keeps the base name, the output name is derived from it
+    localPath = os.path.join(outputDir, "input", os.path.basename(fname))
+    try:
+        if not os.path.isdir(os.path.dirname(localPath)):
+            os.makedirs(os.path.dirname(localPath))
+        blockCache.materialize(fname, localPath)
+    except (IOError, OSError):
+        return index, fname, None, traceback.format_exc(), None, None
+    print(blockCache.report())
+    outFileName, error, timing, writeStats = runChain(localPath, outputDir, settings, dict(options, prefetch=False), args)
+    shutil.rmtree(os.path.dirname(localPath), ignore_errors=True)
+    return index, fname, outFileName, error, timing, writeStats
+
+
+def runWorkers(testfilelist, settings, options, args):
+    """Process the input files in a pool of `args.workers` processes. Each
+    per-file output is appended to options["haddFileName"], in input order,
+    as soon as it is available.
+
+    Returns:
+        tuple -- (exit code, write statistics of the per-file outputs or None)
+    """
+    tasks = [(index, fname, settings, options, args) for index, fname in enumerate(testfilelist)]
+    merger = StreamingMerger(options["haddFileName"], removeInputs=True, compression=options["compression"])
+    # one process per file, so that no ROOT or module state leaks between files
+    pool = multiprocessing.Pool(args.workers, maxtasksperchild=1, initializer=enableImplicitMT, initargs=(args.threads,))
+    failed = []
+    timings = []
+    writes = []
+    try:
+        for index, fname, outFileName, error, timing, writeStats in pool.imap(processFile, tasks):
+            timings.append(timing)
+            writes.append(writeStats)
+            if error:
+                print(("ERROR: Processing of {} failed:\n{}".format(fname, error)))
+                failed.append(fname)
+            else:
+                print(("INFO: Finished {} -> {}".format(fname, outFileName)))
+                merger.add(outFileName)
+    finally:
+        pool.close()
+        pool.join()
+    return finishMerge(merger, failed, len(testfilelist), timings, args), combineWriteStats(writes)
+
+
+def runSequential(testfilelist, settings, options, args):
+    """Process the input files one after the other, merging each output while
+    the next file is processed. With `args.prefetchAhead` > 0 the next files
+    are downloaded in the background, and each local copy is deleted as soon
+    as the output of that file is closed.
+
+    Returns:
+        tuple -- (exit code, write statistics of the per-file outputs or None)
+    """
+    prefetcher = None
+    blockCache = makeBlockCache(args)
+    if args.prefetchAhead > 0 or blockCache:
+        prefetcher = Prefetcher(testfilelist, args.scratchDir, ahead=args.prefetchAhead,
+                                maxScratchBytes=int(args.scratchLimitGB * 1024**3),
+                                copy=blockCache.copy if blockCache else copyFile)
+        inputs = prefetcher
+        fileOptions = dict(options, prefetch=False)
+    else:
+        inputs = ((fname, fname, None) for fname in testfilelist)
+        fileOptions = options
+    merger = StreamingMerger(options["haddFileName"], removeInputs=True, compression=options["compression"])
+    # after the merger process is forked: a running thread pool must not be forked
+    enableImplicitMT(args.threads)
+    failed = []
+    timings = []
+    writes = []
+    try:
+        for index, (fname, localPath, error) in enumerate(inputs):
+            if error:
+                print(("ERROR: Download of {} failed: {}".format(fname, error)))
+                failed.append(fname)
+                continue
+            index, localPath, outFileName, error, timing, writeStats = processFile((index, localPath, settings, fileOptions, args))
+            timings.append(timing)
+            writes.append(writeStats)
+            if prefetcher:
+                prefetcher.release(localPath)
+            if error:
+                print(("ERROR: Processing of {} failed:\n{}".format(fname, error)))
+                failed.append(fname)
+            else:
+                merger.add(outFileName)
+    finally:
+        if prefetcher:
+            prefetcher.close()
+        if blockCache:
+            print(blockCache.report())
+    return finishMerge(merger, failed, len(testfilelist), timings, args), combineWriteStats(writes)
+
+
+def runEntryRange(fname, settings, options, args):
+    """Process entries [args.firstEntry, args.firstEntry + args.entriesToRun) of a
+    single file, in parts of args.checkpointEvery entries. Each finished part is
+    committed to the checkpoint in args.checkpointDir; a rerun of the same job
+    skips the committed parts. The parts are merged into options["haddFileName"]
+    at the end.
+
+    Returns:
+        tuple -- (exit code, non-zero if a part failed (rerun to resume),
+                  write statistics of the parts run by this job or None)
+    """
+    if not os.path.isdir(args.checkpointDir):
+        os.makedirs(args.checkpointDir)
+    localPath = fname
+    if options.get("prefetch") and fname.startswith("root://"):
+        # one local copy for all parts, reused by a restarted job
+        localPath = os.path.join(args.checkpointDir, os.path.basename(fname))
+        size = fileSize(fname)
+        if not (os.path.isfile(localPath) and size and os.path.getsize(localPath) == size):
+            blockCache = makeBlockCache(args)
+            if blockCache:
+                blockCache.materialize(fname, localPath)
+                print(blockCache.report())
+            else:
+                copyFile(fname, localPath)
+    inFile = ROOT.TFile.Open(localPath)
+    if not inFile or inFile.IsZombie():
+        print(("ERROR: Cannot open {}".format(localPath)))
+        return 1, None
+    totalEntries = inFile.Get("Events").GetEntries()
+    inFile.Close()
+    endEntry = totalEntries if args.entriesToRun <= 0 else min(totalEntries, args.firstEntry + args.entriesToRun)
+
+    configuration = hashlib.sha1(json.dumps(dict(options, args=vars(args)), sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    checkpoint = Checkpoint(os.path.join(args.checkpointDir, "checkpoint.json"),
+                            dict(inputFile=fname, firstEntry=args.firstEntry, endEntry=endEntry,
+                                 checkpointEvery=args.checkpointEvery, configuration=configuration))
+    # Runs and LuminosityBlocks describe the whole file: kept once, and only by
+    # the range starting at entry 0, so that the ranges of a file can be hadd-ed
+    perFileTrees = ["Runs", "LuminosityBlocks"]
+    if args.firstEntry == 0:
+        merger = StreamingMerger(options["haddFileName"], removeInputs=True, firstOnly=perFileTrees,
+                                 compression=options["compression"])
+    else:
+        merger = StreamingMerger(options["haddFileName"], removeInputs=True, skip=perFileTrees,
+                                 compression=options["compression"])
+    # after the merger process is forked: a running thread pool must not be forked
+    enableImplicitMT(args.threads)
+
+    if checkpoint.parts:
+        print(("INFO: Resuming {} from entry {} (checkpoint {})".format(fname, checkpoint.committedEntry(args.firstEntry), checkpoint.fileName)))
+    partOptions = dict(options, prefetch=False)
+    timings = []
+    writes = []
+    for firstEntry, entries in entryRangeParts(args.firstEntry, endEntry, args.checkpointEvery):
+        if checkpoint.isDone(firstEntry):
+            continue
+        outputDir = os.path.join(args.checkpointDir, "part_%012d" % firstEntry)
+        outFileName, error, timing, writeStats = runChain(localPath, outputDir, settings,
+                                                          dict(partOptions, firstEntry=firstEntry, maxEntries=entries), args)
+        writes.append(writeStats)
+        if error:
+            print(("ERROR: Entries {}-{} of {} failed:\n{}".format(firstEntry, firstEntry + entries, fname, error)))
+            print(("INFO: Entries up to {} are committed; rerun the job to resume".format(checkpoint.committedEntry(args.firstEntry))))
+            # nothing was added: drop the empty merged file
+            merger.close()
+            if os.path.exists(merger.outFileName):
+                os.remove(merger.outFileName)
+            return 1, combineWriteStats(writes)
+        checkpoint.commit(firstEntry, entries, outFileName)
+        timings.append(timing)
+        print(("INFO: Committed entries up to {} of {}".format(firstEntry + entries, endEntry)))
+
+    for part in checkpoint.parts:
+        merger.add(part["file"])
+    status = finishMerge(merger, [], len(checkpoint.parts), timings, args)
+    if status == 0:
+        checkpoint.remove()
+        shutil.rmtree(args.checkpointDir, ignore_errors=True)
+    return status, combineWriteStats(writes)
+
+
+def finishMerge(merger, failed, nFiles, timings, args):
+    """Wait for the merge, report it, the failed files and, with --timing,
+    the module timing summed over all files.
+
+    Returns:
+        int -- exit code, non-zero if any file failed
+    """
+    stats = merger.close()
+    print(("INFO: {} into {}".format(StreamingMerger.report(stats), merger.outFileName)))
+    for error in stats["errors"]:
+        print(("ERROR: Merge: {}".format(error)))
+    print(("INFO: {} of {} file(s) processed successfully".format(nFiles - len(failed), nFiles)))
+    for fname in failed:
+        print(("ERROR: Failed file: {}".format(fname)))
+    if args.timing:
+        writeTimingReport(combineTimingReports(timings), timingReportName(merger.outFileName))
+    return 1 if failed or stats["errors"] else 0
+
+
+def main():
+    args = parse_arguments()
+
+    # Initial setup
+    testfilelist = []
+
+    entriesToRun = int(args.entriesToRun)
+    DownloadFileToLocalThenRun = args.DownloadFileToLocalThenRun
+
+    # Determine list of files to process
+    if args.inputFile.endswith(".txt"):
+        testfilelist = getListFromFile(args.inputFile)
+    elif args.inputFile.endswith(".root"):
+        testfilelist.append(args.inputFile)
+    else:
+        print("INFO: No input file specified. Using default file list.")
+        testfilelist = getListFromFile("ExampleInputFileList.txt")
+    print(("DEBUG: Input file list: {}".format(testfilelist)))
+    if len(testfilelist) == 0:
+        print("ERROR: No input files found. Exiting.")
+        exit(1)
+
+    settings = jobSettings(testfilelist[0])
+    isMC = settings["isMC"]
+    jsonFileName = settings["jsonFileName"]
+
+    print(("Input json file: {}".format(jsonFileName)))
+    print(("Input cfg file: {}".format(settings["cfgFile"])))
+    print(("isMC: {}".format(isMC)))
+    print(("isFSR: {}".format(settings["isFSR"])))
+
+    # INFO: Keep the `fwkJobReport=False` to trigger `haddnano.py`
+    #            otherwise the output file will have larger size then expected. Reference: https://github.com/cms-nanoAOD/nanoAOD-tools/issues/249
+    options = dict(provenance=True, fwkJobReport=True, haddFileName="skimmed_nano.root", maxEntries=entriesToRun, prefetch=DownloadFileToLocalThenRun,
+                   compression=args.compression)
+    ioSettings = dict(threads=args.threads, workers=args.workers, compression=args.compression,
+                      basketSize=args.basketSize, autoFlush=args.autoFlush)
+    if args.cut:
+        if args.friend:
+            print("ERROR: --cut cannot be used with --friend (the friend tree must keep every input entry). Exiting.")
+            exit(1)
+        # Evaluated by the PostProcessor pre-skim into an entry list: rejected
+        # entries never reach the Python modules.
+        options.update(cut=args.cut)
+    if isMC and args.friend:
+        # Only the branches created by the modules are written, for every input
+        # entry; the keep/drop list does not apply.
+        options.update(friend=True, haddFileName="skimmed_nano_Friend.root")
+    elif isMC:
+        options.update(outputbranchsel="keep_and_drop.txt")
+    elif args.friend:
+        print("ERROR: --friend is only supported for MC (no JSON selection in friend mode). Exiting.")
+        exit(1)
+    else:
+        # Compiled (and cached) golden JSON; the PostProcessor pre-skim drops
+        # uncertified lumis before any module runs.
+        lumiMask = LumiMask(jsonFileName)
+        if not args.noLumiPrefilter:
+            # Read only the LuminosityBlocks tree, so that fully uncertified
+            # files are neither downloaded nor opened by the PostProcessor.
+            testfilelist, skippedFiles = certifiedFiles(testfilelist, lumiMask)
+            for skippedFile in skippedFiles:
+                print(("INFO: Skipping file without certified lumis: {}".format(skippedFile)))
+            print(("INFO: {} file(s) skipped by the lumi pre-filter, {} left".format(len(skippedFiles), len(testfilelist))))
+            if len(testfilelist) == 0:
+                print("INFO: No certified lumis in the input files. Nothing to do.")
+                exit(0)
+        options.update(jsonInput=lumiMask.runsAndLumis(), outputbranchsel="keep_and_drop_data.txt")
+
+    if args.pruneInputBranches:
+        # the chain is fully determined by the job settings, the flags and buildModules itself
+        configuration = dict(settings, NOsyst=args.NOsyst, friend=args.friend, shareCollections=args.shareCollections,
+                             buildModules=inspect.getsource(buildModules))
+        options.update(branchsel=inputBranchSelection(testfilelist[0], lambda: buildModules(settings, args), configuration,
+                                                      options, nEntries=args.calibrationEntries,
+                                                      extraKeep=args.keepInputBranches))
+
+    startTime = time.time()
+    if args.firstEntry > 0 or args.checkpointEvery > 0:
+        if len(testfilelist) != 1:
+            print("ERROR: --firstEntry and --checkpointEvery need a single input file. Exiting.")
+            exit(1)
+        status, writeStats = runEntryRange(testfilelist[0], settings, options, args)
+        writeIOReport(options["haddFileName"], ioSettings, time.time() - startTime, writeStats)
+        exit(status)
+    if args.workers > 1 and len(testfilelist) > 1:
+        status, writeStats = runWorkers(testfilelist, settings, options, args)
+        writeIOReport(options["haddFileName"], ioSettings, time.time() - startTime, writeStats)
+        exit(status)
+    if args.prefetchAhead > 0 or len(testfilelist) > 1 or args.blockCache:
+        status, writeStats = runSequential(testfilelist, settings, options, args)
+        writeIOReport(options["haddFileName"], ioSettings, time.time() - startTime, writeStats)
+        exit(status)
+
+    modulesToRun = buildModules(settings, args)
+    enableImplicitMT(args.threads)
+    p=PostProcessor(".",testfilelist, modules = modulesToRun, **options)
+    p.run()
+    outFileName = singleOutputName(testfilelist, options)
+    writeIOReport(outFileName, ioSettings, time.time() - startTime, chainWriteStats(modulesToRun))
+    if args.timing:
+        writeTimingReport(timingReport(modulesToRun), timingReportName(outFileName))
+
 
-testfile = "root://cms-xrd-global.cern.ch//store/data/Run2018A/SingleMuon/NANOAOD/Nano25Oct2019-v1/20000/D03C6AE0-73AD-A940-B8CA-779A621D4853.root"
-
-
-entriesToRun = 0  # 0 if need to run over all entries else put number of entries to run
-isMCTrueFalse = True
-Year = 2016
-# Keep DownloadFileToLocalThenRun=True this should reduce the file read error from eos.
-DownloadFileToLocalThenRun=True
-
-if testfile.find("SingleMuon") != -1 or testfile.find("EGamma") != -1 or testfile.find("SingleElectron") != -1 or testfile.find("DoubleMuon") != -1 or testfile.find("MuonEG") != -1 or testfile.find("DoubleEG") != -1:
-  isMCTrueFalse=False
-  if testfile.find("Run2016") != -1:
-    Year=2016
-    jsonFileName="Cert_271036-284044_13TeV_ReReco_07Aug2017_Collisions16_JSON.txt"
-  if testfile.find("Run2017") != -1:
-    Year=2017
-    jsonFileName="Cert_294927-306462_13TeV_EOY2017ReReco_Collisions17_JSON.txt"
-  if testfile.find("Run2018") != -1:
-    Year=2018
-    jsonFileName="Cert_314472-325175_13TeV_17SeptEarlyReReco2018ABC_PromptEraD_Collisions18_JSON.txt"
-  print "\n===> Running over ",Year," data...\n"
-  print "===> JSON File: ",jsonFileName
-  jetmetCorrector = createJMECorrector(isMC=isMCTrueFalse, dataYear=Year, jesUncert="Merged", jetType = "AK4PFchs")
-  fatJetCorrector = createJMECorrector(isMC=isMCTrueFalse, dataYear=Year, jesUncert="Merged", jetType = "AK8PFPuppi")
-  p=PostProcessor(".",[testfile],None,None,[wvAnalysisModule(),jetmetCorrector(),fatJetCorrector()],provenance=False,fwkJobReport=False,jsonInput=jsonFileName,maxEntries=entriesToRun,haddFileName="nano.root",prefetch=DownloadFileToLocalThenRun)
-else:
-  print "==> Processing a MC file..."
-  isMCTrueFalse=True
-  if testfile.find("RunIIAutumn18NanoAODv") != -1: year = 2018
-  if testfile.find("VVjj_2018v") != -1: year = 2018
-  if testfile.find("RunIIFall17NanoAODv") != -1: year = 2017
-  if testfile.find("VVjj_2017v") != -1: year = 2017
-  if testfile.find("RunIISummer16NanoAODv") != -1: year = 2016
-  if testfile.find("VVjj_2016v") != -1: year = 2016
-  jetmetCorrector = createJMECorrector(isMC=isMCTrueFalse, dataYear=year, jesUncert="Merged", jetType = "AK4PFchs")
-  fatJetCorrector = createJMECorrector(isMC=isMCTrueFalse, dataYear=year, jesUncert="Merged", jetType = "AK8PFPuppi")
-  if year == 2016:
-    era="Legacy2016"
-    sfFileName="DeepCSV_2016LegacySF_V1.csv"
-  if year == 2017:
-    era="2017"
-    sfFileName="DeepCSV_94XSF_V5_B_F.csv"
-  if year == 2018:
-    era="2018"
-    sfFileName="DeepCSV_102XSF_V2.csv"
-  btagSF = lambda: btagSFProducer(era,algo="deepcsv",selectedWPs=['L','M','T','shape_corr'],sfFileName=sfFileName)
-  puidSF = lambda: JetSFMaker("%s" % year)
-  p=PostProcessor(".",[testfile],"",None,[wvAnalysisModule(),jetmetCorrector(),fatJetCorrector(),btagSF(),puidSF()],provenance=True,fwkJobReport=False,maxEntries=entriesToRun,haddFileName="nano.root",prefetch=DownloadFileToLocalThenRun)
-
-p.run()
-print "DONE"
-#os.system("ls -lR")
-=======
-#!/usr/bin/env python3
-import os
-import sys
-import argparse
-
-from PhysicsTools.NanoAODTools.postprocessing.framework.postprocessor import PostProcessor
-from PhysicsTools.NanoAODTools.postprocessing.modules.common.muonScaleResProducer import *
-from PhysicsTools.NanoAODTools.postprocessing.modules.jme.jetmetHelperRun2 import createJMECorrector
-from PhysicsTools.NanoAODTools.postprocessing.modules.btv.btagSFProducer import btagSFProducer
-from PhysicsTools.NanoAODTools.postprocessing.modules.common.puWeightProducer import *
-
-# Custom module imports
-from H4Lmodule import *
-from H4LCppModule import *
-from JetSFMaker import *
-
-def parse_arguments():
-    """Parse command line arguments."""
-    parser = argparse.ArgumentParser()
-    parser.add_argument("-i", "--inputFile", default="", type=str, help="Input file name")
-    parser.add_argument("-n", "--entriesToRun", default=100, type=int, help="Set  to 0 if need to run over all entries else put number of entries to run")
-    parser.add_argument("-d", "--DownloadFileToLocalThenRun", default=True, type=bool, help="Download file to local then run")
-    parser.add_argument("--NOsyst", default=False, action="store_true", help="Do not run systematics")
-    return parser.parse_args()
-
-
-def getListFromFile(filename):
-    """Read file list from a text file."""
-    with open(filename, "r") as file:
-        return ["root://cms-xrd-global.cern.ch/" + line.strip() for line in file]
-
-
-def main():
-    args = parse_arguments()
-
-    # Initial setup
-    testfilelist = []
-    modulesToRun = []
-    isMC = True
-    isFSR = False
-    year = None
-    cfgFile = None
-    jsonFileName = None
-    sfFileName = None
-
-    entriesToRun = int(args.entriesToRun)
-    DownloadFileToLocalThenRun = args.DownloadFileToLocalThenRun
-
-    # Determine list of files to process
-    if args.inputFile.endswith(".txt"):
-        testfilelist = getListFromFile(args.inputFile)
-    elif args.inputFile.endswith(".root"):
-        testfilelist.append(args.inputFile)
-    else:
-        print("INFO: No input file specified. Using default file list.")
-        testfilelist = getListFromFile("ExampleInputFileList.txt")
-    print(("DEBUG: Input file list: {}".format(testfilelist)))
-    if len(testfilelist) == 0:
-        print("ERROR: No input files found. Exiting.")
-        exit(1)
-
-    """Determine the year and type (MC or Data) of input ROOT file:
-    For data the string "/data/" is always there. So, we take this
-    as handle to decide if the root file is MC or data.
-    """
-    first_file = testfilelist[0]
-    isMC = "/data/" not in first_file
-
-    if "Summer22" in first_file or "Run2022" in first_file:
-        """Summer22 and Run2022 for identification of 2022 MC and data respectiverly
-        """
-        year = 2022
-        cfgFile = "Input_2022.yml"
-        jsonFileName = "golden_Json/Cert_Collisions2022_355100_362760_Golden.json"
-        sfFileName = "DeepCSV_102XSF_V2.csv" # FIXME: Update for year 2022
-        #modulesToRun.extend([lambda: muonScaleResProducer('','', 2022)]) # FIXME: Update for year 2022
-    if "UL18" in first_file or "UL2018" in first_file:
-        """UL2018 for identification of 2018 UL data and UL18 for identification of 2018 UL MC
-        """
-        year = 2018
-        cfgFile = "Input_2018.yml"
-        jsonFileName = "golden_Json/Cert_314472-325175_13TeV_Legacy2018_Collisions18_JSON.txt"
-        sfFileName = "DeepCSV_102XSF_V2.csv"
-        modulesToRun.extend([muonScaleRes2018()])
-    if "UL17" in first_file or "UL2017" in first_file:
-        year = 2017
-        cfgFile = "Input_2017.yml"
-        jsonFileName="golden_Json/Cert_294927-306462_13TeV_UL2017_Collisions17_GoldenJSON.txt"
-        sfFileName = "DeepCSV_102XSF_V2.csv"
-        modulesToRun.extend([muonScaleRes2017()])
-    if "UL16" in first_file or "UL2016" in first_file:
-        year = 2016
-        jsonFileName = "golden_Json/Cert_271036-284044_13TeV_Legacy2016_Collisions16_JSON.txt"
-        sfFileName = "DeepCSV_102XSF_V2.csv"
-        modulesToRun.extend([muonScaleRes2016()])
-
-    H4LCppModule = lambda: HZZAnalysisCppProducer(year,cfgFile, isMC, isFSR)
-    modulesToRun.extend([H4LCppModule()])
-
-    print(("Input json file: {}".format(jsonFileName)))
-    print(("Input cfg file: {}".format(cfgFile)))
-    print(("isMC: {}".format(isMC)))
-    print(("isFSR: {}".format(isFSR)))
-
-    if isMC:
-        if (not args.NOsyst):
-            # FIXME: JES not used properly
-            #jetmetCorrector = createJMECorrector(isMC=isMC, dataYear=year, jesUncert="All", jetType = "AK4PFchs")
-            #fatJetCorrector = createJMECorrector(isMC=isMC, dataYear=year, jesUncert="All", jetType = "AK8PFPuppi")
-            # btagSF = lambda: btagSFProducer("UL"+str(year), algo="deepjet",selectedWPs=['L','M','T','shape_corr'], sfFileName=sfFileName)
-            btagSF = lambda: btagSFProducer(era = "UL"+str(year), algo = "deepcsv")
-            puidSF = lambda: JetSFMaker("%s" % year)
-            #modulesToRun.extend([jetmetCorrector(), fatJetCorrector()])#, puidSF()
-            # # modulesToRun.extend([jetmetCorrector(), fatJetCorrector(), btagSF(), puidSF()])
-
-        # FIXME: No PU weight for 2022
-        if year == 2018: modulesToRun.extend([puAutoWeight_2018()])
-        if year == 2017: modulesToRun.extend([puAutoWeight_2017()])
-        if year == 2016: modulesToRun.extend([puAutoWeight_2016()])
-
-        # INFO: Keep the `fwkJobReport=False` to trigger `haddnano.py`
-        #            otherwise the output file will have larger size then expected. Reference: https://github.com/cms-nanoAOD/nanoAOD-tools/issues/249
-        p=PostProcessor(".",testfilelist, None, None,modules = modulesToRun, provenance=True,fwkJobReport=True,haddFileName="skimmed_nano.root", maxEntries=entriesToRun, prefetch=DownloadFileToLocalThenRun, outputbranchsel="keep_and_drop.txt")
-    else:
-        #if (not args.NOsyst):
-            # FIXME: JES not used properly
-            #jetmetCorrector = createJMECorrector(isMC=isMC, dataYear=year, jesUncert="All", jetType = "AK4PFchs")
-            #fatJetCorrector = createJMECorrector(isMC=isMC, dataYear=year, jesUncert="All", jetType = "AK8PFPuppi")
-            #modulesToRun.extend([jetmetCorrector(), fatJetCorrector()])
-
-        p=PostProcessor(".",testfilelist, None, None, modules = modulesToRun, provenance=True, fwkJobReport=True,haddFileName="skimmed_nano.root", jsonInput=jsonFileName, maxEntries=entriesToRun, prefetch=DownloadFileToLocalThenRun, outputbranchsel="keep_and_drop_data.txt")
-
-    p.run()
-
-
-if __name__ == "__main__":
-    main()
->>>>>>> parent of ab45a38 (JERJEC and 2023)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Background download of the next input files while the current one is processed.
+
+`Prefetcher` copies up to `ahead` files into a local scratch directory in a
+background thread, never letting the local copies (downloaded or in flight)
+exceed `maxScratchBytes`. Iterating over it yields the files in input order as
+soon as each copy is complete; the caller hands the local copy back with
+`release()` once the output of that file is closed, which deletes it and lets
+the next download start.
+
+Remote files (root://...) are copied with xrdcp, anything else with a plain
+file copy, so a local directory can stand in for the remote server. Another
+copy function (e.g. `BlockCache.materialize`) can be given instead.
+"""
+import os
+import re
+import shutil
+import threading
+import subprocess
+
+
+def fileSize(fname):
+    """Size in bytes of a local path or xrootd URL, 0 if it cannot be determined."""
+    if not fname.startswith("root://"):
+        return os.path.getsize(fname) if os.path.isfile(fname) else 0
+    match = re.match(r"(root://[^/]+)/(/.*)", fname)
+    if not match:
+        return 0
+    try:
+        output = subprocess.check_output(["xrdfs", match.group(1), "stat", match.group(2)]).decode("utf-8", "replace")
+    except (OSError, subprocess.CalledProcessError):
+        return 0
+    size = re.search(r"Size:\s*(\d+)", output)
+    return int(size.group(1)) if size else 0
+
+
+def copyFile(fname, localPath):
+    if fname.startswith("root://"):
+        if subprocess.call(["xrdcp", "-f", "--nopbar", fname, localPath]) != 0:
+            raise IOError("xrdcp of %s failed" % fname)
+    else:
+        shutil.copyfile(fname, localPath)
+
+
+class Prefetcher(object):
+    def __init__(self, files, scratchDir, ahead=2, maxScratchBytes=0, copy=copyFile):
+        """
+        Arguments:
+            files {list} -- input files, in processing order
+            scratchDir {str} -- directory for the local copies
+            ahead {int} -- number of files fetched ahead of the one being processed
+            maxScratchBytes {int} -- limit on the local copies, 0 for no limit;
+                                     a single file larger than the limit is still
+                                     fetched once nothing else is held
+            copy {function} -- copy(input file, local path), raising IOError on failure
+        """
+        self.files = list(files)
+        self.scratchDir = scratchDir
+        self.ahead = max(1, ahead)
+        self.maxScratchBytes = maxScratchBytes
+        self.copy = copy
+        self._cond = threading.Condition()
+        self._held = {}          # local path -> bytes reserved
+        self._done = {}          # index -> (local path or None, error or None)
+        self._stop = False
+        if not os.path.isdir(scratchDir):
+            os.makedirs(scratchDir)
+        self._thread = threading.Thread(target=self._download)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _localPath(self, index, fname):
+        # keep the base name, the PostProcessor output name is derived from it
+        directory = os.path.join(self.scratchDir, "%04d" % index)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        return os.path.join(directory, os.path.basename(fname))
+
+    def _download(self):
+        for index, fname in enumerate(self.files):
+            size = fileSize(fname)
+            with self._cond:
+                while not self._stop and self._held and (
+                        len(self._held) > self.ahead or
+                        (self.maxScratchBytes > 0 and sum(self._held.values()) + size > self.maxScratchBytes)):
+                    self._cond.wait()
+                if self._stop:
+                    return
+                localPath = self._localPath(index, fname)
+                self._held[localPath] = size
+            try:
+                self.copy(fname, localPath)
+                result = (localPath, None)
+            except (IOError, OSError) as err:
+                self.release(localPath)
+                result = (None, str(err))
+            with self._cond:
+                if result[0] and localPath in self._held:
+                    # the real size, in case xrdfs stat did not give one
+                    self._held[localPath] = os.path.getsize(localPath)
+                self._done[index] = result
+                self._cond.notify_all()
+
+    def __iter__(self):
+        """Yield (input file, local copy or None, error or None) in input order."""
+        for index, fname in enumerate(self.files):
+            with self._cond:
+                while index not in self._done:
+                    self._cond.wait()
+                localPath, error = self._done.pop(index)
+            yield fname, localPath, error
+
+    def release(self, localPath):
+        """Delete a local copy and free its share of the scratch budget."""
+        if os.path.isfile(localPath):
+            os.remove(localPath)
+        directory = os.path.dirname(localPath)
+        if os.path.isdir(directory) and not os.listdir(directory):
+            os.rmdir(directory)
+        with self._cond:
+            self._held.pop(localPath, None)
+            self._cond.notify_all()
+
+    def close(self):
+        """Stop downloading and remove whatever is still held locally."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join()
+        for localPath in list(self._held):
+            self.release(localPath)
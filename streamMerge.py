@@ -0,0 +1,217 @@
+"""Incremental merge of per-file PostProcessor outputs.
+
+`StreamingMerger` appends each finished output file to the merged file while
+the next input is still being processed. The merge runs in its own process,
+so that its ROOT state (gDirectory, open files) never interferes with the
+PostProcessor in the main process. Every TTree of the inputs (Events, Runs,
+LuminosityBlocks, ...) is appended with a fast basket copy, histograms and
+entry lists are summed and other objects are taken from the first file. Only one input file
+is open at a time, so memory stays bounded by the output baskets.
+
+When the inputs are entry ranges of the same file, the per-file trees (Runs,
+LuminosityBlocks) are repeated in every part: `firstOnly` keeps them from the
+first part only, `skip` leaves them out.
+
+As in haddnano.py, trees whose branch sets differ (e.g. HLT bits of data
+files of different run ranges) are merged by adding the missing branches,
+filled with zeros, to the input or to the merged tree; such trees are then
+copied entry by entry instead of basket by basket. The merged file has the
+compression of `compression` ("ALGO:LEVEL"), else the one of the first input.
+
+A file that fails to merge is reported in the "errors" of the statistics and
+kept; if the merge process dies, `close` reports it instead of waiting forever.
+"""
+import os
+import time
+import traceback
+import numpy as np
+import multiprocessing
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
+
+# seconds between two checks that the merge process is still alive in close()
+POLL_SECONDS = 10.
+
+
+# ROOT compression algorithm codes (ROOT::RCompressionSetting::EAlgorithm)
+COMPRESSION_ALGORITHMS = {"ZLIB": 1, "LZMA": 2, "LZ4": 4, "ZSTD": 5}
+# leaf type: (numpy dtype, leaf list code) of the branches that can be filled with zeros
+ZERO_FILL_TYPES = {"Bool_t": ("?", "O"), "Char_t": ("i1", "B"), "UChar_t": ("u1", "b"), "Short_t": ("i2", "S"),
+                   "UShort_t": ("u2", "s"), "Int_t": ("i4", "I"), "UInt_t": ("u4", "i"), "Long64_t": ("i8", "L"),
+                   "ULong64_t": ("u8", "l"), "Float_t": ("f4", "F"), "Double_t": ("f8", "D")}
+
+
+def compressionSettings(value):
+    """ROOT compression settings (algorithm * 100 + level) of an "ALGO:LEVEL" setting."""
+    algo, level = value.split(":")
+    return COMPRESSION_ALGORITHMS[algo.upper()] * 100 + int(level)
+
+
+def _zeroFill(tree, leaf, inMemory):
+    """Add the branch of `leaf` (of another tree) to `tree`, zero for all its entries."""
+    name = leaf.GetBranch().GetName()
+    if leaf.GetLeafCount() or leaf.GetLenStatic() != 1 or leaf.GetTypeName() not in ZERO_FILL_TYPES:
+        raise IOError("cannot fill the missing branch %s (%s) of %s" % (name, leaf.GetTypeName(), tree.GetName()))
+    dtype, code = ZERO_FILL_TYPES[leaf.GetTypeName()]
+    buf = np.zeros(1, dtype=np.dtype(dtype))
+    branch = tree.Branch(name, buf, "%s/%s" % (name, code))
+    if inMemory:
+        # the tree of an input file opened read-only: its baskets must never be flushed
+        branch.SetBasketSize(max(tree.GetEntries() * buf.itemsize * 2, 16000))
+    for i in range(tree.GetEntries()):
+        branch.Fill()
+    branch.ResetAddress()
+
+
+def _alignBranches(merged, tree):
+    """Give `merged` and the input `tree` the same branches; True if some were missing."""
+    mergedBranches = dict((b.GetName(), b) for b in merged.GetListOfBranches())
+    treeBranches = dict((b.GetName(), b) for b in tree.GetListOfBranches())
+    for name in sorted(set(mergedBranches) - set(treeBranches)):
+        _zeroFill(tree, mergedBranches[name].GetLeaf(name), True)
+    for name in sorted(set(treeBranches) - set(mergedBranches)):
+        _zeroFill(merged, treeBranches[name].GetLeaf(name), False)
+    return set(mergedBranches) != set(treeBranches)
+
+
+def _emptyStats():
+    return {"files": 0, "entries": 0, "bytesRead": 0, "mergeTime": 0., "errors": []}
+
+
+def _mergeFile(ROOT, fileName, outFile, trees, objects, stats, firstOnly, skip, slowTrees, inheritCompression):
+    inFile = ROOT.TFile.Open(fileName)
+    if not inFile or inFile.IsZombie():
+        raise IOError("could not open")
+    if inheritCompression and not trees and not objects:
+        outFile.SetCompressionSettings(inFile.GetCompressionSettings())
+    try:
+        seen = set()
+        for key in inFile.GetListOfKeys():
+            name = key.GetName()
+            # keys can repeat with several cycles, the first one is the latest
+            if name in seen:
+                continue
+            seen.add(name)
+            if name in skip or (name in firstOnly and name in trees):
+                continue
+            obj = key.ReadObj()
+            if obj.InheritsFrom("TTree"):
+                outFile.cd()
+                if name not in trees:
+                    trees[name] = obj.CloneTree(0)
+                elif _alignBranches(trees[name], obj):
+                    slowTrees.add(name)
+                if trees[name].CopyEntries(obj, -1, "" if name in slowTrees else "fast") < 0:
+                    raise IOError("could not copy " + name)
+                if name == "Events":
+                    stats["entries"] += obj.GetEntries()
+            elif name not in objects:
+                if obj.InheritsFrom("TH1") or obj.InheritsFrom("TEntryList"):
+                    obj.SetDirectory(0)
+                objects[name] = obj
+            elif obj.InheritsFrom("TH1") or obj.InheritsFrom("TEntryList"):
+                objects[name].Add(obj)
+    finally:
+        inFile.Close()
+
+
+def _mergeLoop(outFileName, queue, results, removeInputs, firstOnly, skip, compression):
+    stats = _emptyStats()
+    try:
+        import ROOT
+        ROOT.PyConfig.IgnoreCommandLineOptions = True
+        ROOT.gROOT.SetBatch(True)
+
+        outFile = ROOT.TFile.Open(outFileName, "RECREATE")
+        if not outFile or outFile.IsZombie():
+            raise IOError("could not create %s" % outFileName)
+        if compression:
+            outFile.SetCompressionSettings(compressionSettings(compression))
+        trees = {}
+        objects = {}
+        # trees merged entry by entry, since their inputs had different branches
+        slowTrees = set()
+        while True:
+            fileName = queue.get()
+            if fileName is None:
+                break
+            t0 = time.time()
+            try:
+                _mergeFile(ROOT, fileName, outFile, trees, objects, stats, firstOnly, skip, slowTrees,
+                           not compression)
+            except Exception as err:
+                # the file is kept, the job fails on the error
+                stats["errors"].append("%s: %s" % (fileName, err))
+                continue
+            finally:
+                stats["mergeTime"] += time.time() - t0
+            stats["files"] += 1
+            stats["bytesRead"] += os.path.getsize(fileName)
+            if removeInputs:
+                os.remove(fileName)
+
+        t0 = time.time()
+        outFile.cd()
+        for tree in trees.values():
+            tree.Write("", ROOT.TObject.kOverwrite)
+        for name, obj in objects.items():
+            obj.Write(name, ROOT.TObject.kOverwrite)
+        outFile.Close()
+        stats["mergeTime"] += time.time() - t0
+        stats["bytesWritten"] = os.path.getsize(outFileName)
+    except Exception:
+        stats["errors"].append("merge of %s failed:\n%s" % (outFileName, traceback.format_exc()))
+    results.put(stats)
+
+
+class StreamingMerger(object):
+    def __init__(self, outFileName, removeInputs=False, firstOnly=(), skip=(), compression=None):
+        """
+        Arguments:
+            outFileName {str} -- merged output file
+            removeInputs {bool} -- delete each input file once it is merged
+            firstOnly {list} -- trees copied from the first input only
+            skip {list} -- objects not copied at all
+            compression {str} -- "ALGO:LEVEL" of the merged file, None for the one of the inputs
+        """
+        self.outFileName = outFileName
+        self._queue = multiprocessing.Queue()
+        self._results = multiprocessing.Queue()
+        self._process = multiprocessing.Process(target=_mergeLoop, args=(outFileName, self._queue, self._results, removeInputs,
+                                                                          set(firstOnly), set(skip), compression))
+        self._process.start()
+
+    def add(self, fileName):
+        """Queue a finished output file; files are merged in the order they are added."""
+        self._queue.put(fileName)
+
+    def close(self):
+        """Wait for the pending merges and return the merge statistics."""
+        self._queue.put(None)
+        while True:
+            try:
+                stats = self._results.get(timeout=POLL_SECONDS)
+                break
+            except Empty:
+                if self._process.is_alive():
+                    continue
+            # died: its statistics may still be in the pipe
+            try:
+                stats = self._results.get(timeout=1.)
+            except Empty:
+                stats = _emptyStats()
+                stats["errors"].append("merge process died (exit code %s)" % self._process.exitcode)
+            break
+        self._process.join()
+        return stats
+
+    @staticmethod
+    def report(stats):
+        MB = 1024. * 1024.
+        throughput = stats["bytesRead"] / MB / stats["mergeTime"] if stats["mergeTime"] > 0 else 0.
+        return ("Merged {} file(s), {} Events entries: {:.1f} MB read, {:.1f} MB written "
+                "in {:.1f} s of merge time ({:.1f} MB/s)").format(
+                    stats["files"], stats["entries"], stats["bytesRead"] / MB,
+                    stats.get("bytesWritten", 0) / MB, stats["mergeTime"], throughput)
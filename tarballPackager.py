@@ -0,0 +1,224 @@
+"""Content-addressed tarball of the CMSSW area for the condor jobs.
+
+The files of the area (minus `EXCLUDE_DIRS` and `EXCLUDE_PATTERNS`: build
+intermediates and logs, and `OUTPUT_PATTERNS` outside data directories) are
+checked to include the `REQUIRED_FILES` the modules open, and hashed into one
+content hash. The hash of a file is taken again only if its size or mtime
+changed (`HASH_CACHE`). The
+tarball is rebuilt only when the content hash differs from the one of the
+existing tarball (`<tarball>.sha1`), and uploaded only when it differs from
+the one stored next to the uploaded tarball. The tarball is compressed with
+pigz (parallel gzip) when it is available.
+
+    python tarballPackager.py $CMSSW_BASE CMSSW_10_6_14.tgz --storeDir /eos/uscms/store/user/...
+"""
+import os
+import json
+import time
+import glob
+import fnmatch
+import hashlib
+import tarfile
+import argparse
+import subprocess
+
+from eosStorage import EOS_REDIRECTOR
+
+EXCLUDE_DIRS = ("tmp", ".git", ".SCRAM/.glimpse_full", "condor_logs", "condor_job_lists", ".das_cache",
+                ".branch_pruning_cache", "checkpoint", "prefetch_scratch")
+HASH_CACHE = ".tarball_hash_cache.json"
+# logs and files rewritten by every submission (they would change the hash each time)
+EXCLUDE_PATTERNS = ("*.tgz.*", "*.pyc", "*.tmp", "*.stdout", "*.log", HASH_CACHE + "*",
+                    "submit_condor_jobs_*", "summary.dat", "test_condor", "condor_monitor_state.json*")
+# outputs, excluded only outside data directories: the modules read their inputs
+# (scale factor and pileup ROOT files, JME .tgz archives) from */data/*
+OUTPUT_PATTERNS = ("*.root", "*.tgz")
+DATA_DIRS = ("data",)
+# files the modules open on the worker (relative to $CMSSW_BASE, globs)
+REQUIRED_FILES = ("src/PhysicsTools/NanoAODTools/python/postprocessing/analysis/nanoAOD_vvVBS/data/*",
+                  "src/PhysicsTools/NanoAODTools/python/postprocessing/data/pileup/*",
+                  "src/PhysicsTools/NanoAODTools/data/jme/*")
+
+
+def _excluded(relPath, patterns):
+    name = os.path.basename(relPath)
+    if any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+        return True
+    inData = any(part in DATA_DIRS for part in relPath.split(os.sep)[:-1])
+    return not inData and any(fnmatch.fnmatch(name, pattern) for pattern in OUTPUT_PATTERNS)
+
+
+def missingRequired(areaDir, entries, requiredFiles=REQUIRED_FILES):
+    """Files of the area matching `requiredFiles` that are not in `entries`."""
+    packed = set(entries)
+    missing = []
+    for pattern in requiredFiles:
+        for path in glob.glob(os.path.join(areaDir, pattern)):
+            relPath = os.path.relpath(path, areaDir)
+            if os.path.isfile(path) and relPath not in packed:
+                missing.append(relPath)
+    return sorted(missing)
+
+
+def listArea(areaDir, excludeDirs=EXCLUDE_DIRS, excludePatterns=EXCLUDE_PATTERNS):
+    """Sorted paths (relative to areaDir) of the directories, files and links to pack."""
+    entries = []
+    for root, dirs, files in os.walk(areaDir):
+        relRoot = os.path.relpath(root, areaDir)
+        relRoot = "" if relRoot == "." else relRoot
+        # os.walk does not descend into symlinked directories, they are packed as links
+        kept = []
+        for name in sorted(dirs):
+            relPath = os.path.join(relRoot, name)
+            if name in excludeDirs or relPath in excludeDirs:
+                continue
+            entries.append(relPath)
+            if not os.path.islink(os.path.join(root, name)):
+                kept.append(name)
+        dirs[:] = kept
+        for name in sorted(files):
+            relPath = os.path.join(relRoot, name)
+            if not _excluded(relPath, excludePatterns):
+                entries.append(relPath)
+    return sorted(entries)
+
+
+def contentHash(areaDir, entries, cacheFile=HASH_CACHE):
+    """sha1 of the paths, modes and contents of `entries`; file hashes cached by (size, mtime)."""
+    cache = {}
+    if os.path.isfile(cacheFile):
+        try:
+            with open(cacheFile) as src:
+                cache = json.load(src)
+        except ValueError:
+            cache = {}
+    newCache = {}
+    total = hashlib.sha1()
+    for relPath in entries:
+        path = os.path.join(areaDir, relPath)
+        info = os.lstat(path)
+        if os.path.islink(path):
+            digest = "link:" + os.readlink(path)
+        elif os.path.isdir(path):
+            digest = "dir"
+        else:
+            key = "%d:%d" % (info.st_size, int(info.st_mtime * 1e6))
+            cached = cache.get(path)
+            if cached and cached[0] == key:
+                digest = cached[1]
+            else:
+                fileHash = hashlib.sha1()
+                with open(path, "rb") as src:
+                    for chunk in iter(lambda: src.read(1 << 20), b""):
+                        fileHash.update(chunk)
+                digest = fileHash.hexdigest()
+            newCache[path] = [key, digest]
+        total.update(("%s\0%o\0%s\n" % (relPath, info.st_mode & 0o111, digest)).encode("utf-8"))
+    tmpName = cacheFile + ".tmp"
+    with open(tmpName, "w") as out:
+        json.dump(newCache, out)
+    os.rename(tmpName, cacheFile)
+    return total.hexdigest()
+
+
+def _pigz():
+    for directory in os.environ.get("PATH", "").split(os.pathsep):
+        if os.access(os.path.join(directory, "pigz"), os.X_OK):
+            return os.path.join(directory, "pigz")
+    return None
+
+
+def buildTarball(areaDir, entries, tarballName, threads=0):
+    """Write `entries` under the area's directory name, gzipped by pigz if available."""
+    top = os.path.basename(os.path.normpath(areaDir))
+    tmpName = tarballName + ".tmp"
+    pigz = _pigz()
+    if pigz:
+        with open(tmpName, "wb") as out:
+            process = subprocess.Popen([pigz, "-p", str(threads or os.sysconf("SC_NPROCESSORS_ONLN"))],
+                                       stdin=subprocess.PIPE, stdout=out)
+            tar = tarfile.open(fileobj=process.stdin, mode="w|")
+            for relPath in entries:
+                tar.add(os.path.join(areaDir, relPath), arcname=os.path.join(top, relPath), recursive=False)
+            tar.close()
+            process.stdin.close()
+            if process.wait() != 0:
+                raise RuntimeError("pigz failed for " + tarballName)
+    else:
+        tar = tarfile.open(tmpName, "w:gz")
+        for relPath in entries:
+            tar.add(os.path.join(areaDir, relPath), arcname=os.path.join(top, relPath), recursive=False)
+        tar.close()
+    os.rename(tmpName, tarballName)
+    return "pigz" if pigz else "gzip"
+
+
+def _remoteHash(remotePath, redirector):
+    try:
+        output = subprocess.check_output(["xrdfs", redirector, "cat", remotePath + ".sha1"], stderr=subprocess.STDOUT)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode("utf-8", "replace").strip()
+
+
+def packageArea(areaDir, tarballName, storeDir=None, redirector=EOS_REDIRECTOR, threads=0,
+                excludeDirs=EXCLUDE_DIRS, excludePatterns=EXCLUDE_PATTERNS, requiredFiles=REQUIRED_FILES):
+    """Build (if changed) and upload (if changed) the tarball of `areaDir`.
+
+    Returns:
+        dict -- "hash", "rebuilt", "uploaded", "size" and the "timing" of each step
+    """
+    timing = {}
+    t0 = time.time()
+    entries = listArea(areaDir, excludeDirs, excludePatterns)
+    missing = missingRequired(areaDir, entries, requiredFiles)
+    if missing:
+        raise RuntimeError("files needed by the jobs are excluded from the tarball: " + ", ".join(missing))
+    digest = contentHash(areaDir, entries)
+    timing["hash"] = time.time() - t0
+
+    hashFile = tarballName + ".sha1"
+    previous = None
+    if os.path.isfile(tarballName) and os.path.isfile(hashFile):
+        with open(hashFile) as src:
+            previous = src.read().strip()
+    rebuilt = previous != digest
+    t0 = time.time()
+    if rebuilt:
+        compressor = buildTarball(areaDir, entries, tarballName, threads)
+        with open(hashFile, "w") as out:
+            out.write(digest + "\n")
+        timing["pack (%s)" % compressor] = time.time() - t0
+
+    uploaded = False
+    if storeDir:
+        t0 = time.time()
+        remotePath = storeDir.rstrip("/") + "/" + os.path.basename(tarballName)
+        if _remoteHash(remotePath, redirector) != digest:
+            for localName, remoteName in ((tarballName, remotePath), (hashFile, remotePath + ".sha1")):
+                subprocess.check_call(["xrdcp", "-f", "-s", localName, "%s/%s" % (redirector, remoteName)])
+            uploaded = True
+        timing["upload" if uploaded else "remote check"] = time.time() - t0
+
+    result = {"hash": digest, "rebuilt": rebuilt, "uploaded": uploaded, "files": len(entries),
+              "size": os.path.getsize(tarballName), "timing": timing}
+    print("Tarball %s: %d entries, %.1f MB, content %s, %s, %s" % (
+        tarballName, len(entries), result["size"] / 1024. / 1024., digest[:12],
+        "rebuilt" if rebuilt else "unchanged",
+        "uploaded to " + storeDir if uploaded else ("already up to date at " + storeDir if storeDir else "not uploaded")))
+    print("  " + ", ".join("%s %.1f s" % (step, seconds) for step, seconds in sorted(timing.items())))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and upload the CMSSW tarball of the condor jobs if its content changed")
+    parser.add_argument("areaDir", type=str, help="CMSSW area ($CMSSW_BASE)")
+    parser.add_argument("tarball", type=str, help="Tarball name")
+    parser.add_argument("--storeDir", default="", type=str, help="EOS directory to upload to")
+    parser.add_argument("--threads", default=0, type=int, help="pigz threads, 0 for all cores")
+    args = parser.parse_args()
+    packageArea(args.areaDir, args.tarball, args.storeDir or None, threads=args.threads)
+
+
+if __name__ == "__main__":
+    main()
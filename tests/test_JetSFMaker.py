@@ -0,0 +1,74 @@
+import sys
+import types
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def jetSFMaker(monkeypatch):
+    """The JetSFMaker module, imported with stubs of ROOT and the NanoAODTools framework."""
+    stubs = {"ROOT": {"PyConfig": types.SimpleNamespace()}, "PhysicsTools": {}, "PhysicsTools.NanoAODTools": {},
+             "PhysicsTools.NanoAODTools.postprocessing": {},
+             "PhysicsTools.NanoAODTools.postprocessing.framework": {},
+             "PhysicsTools.NanoAODTools.postprocessing.framework.eventloop": {"Module": object},
+             "PhysicsTools.NanoAODTools.postprocessing.framework.datamodel": {"Collection": object}}
+    for name, attributes in stubs.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attributes)
+        monkeypatch.setitem(sys.modules, name, module)
+    for name in ("JetSFMaker", "treeArrays", "collectionCache"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    import JetSFMaker
+    for name in ("JetSFMaker", "treeArrays", "collectionCache"):
+        monkeypatch.setitem(sys.modules, name, sys.modules[name])
+    return JetSFMaker
+
+
+class Output(object):
+    def __init__(self):
+        self.branches = {}
+
+    def fillBranch(self, name, values):
+        self.branches[name] = list(values)
+
+
+def makeMaker(jetSFMaker, eff):
+    """JetSFMaker with SF 0.9 +- 0.05 (syst 0.02) and the MC efficiencies `eff` in eta bins of [-5, 5]."""
+    maker = jetSFMaker.JetSFMaker.__new__(jetSFMaker.JetSFMaker)
+    xaxis, yaxis = (1, 30., 50., None), (len(eff), -5., 5., None)
+    shape = (3, len(eff) + 2)
+    mapOf = lambda value, error=0.: jetSFMaker.PUIDSFMap(xaxis, yaxis, np.full(shape, value), np.full(shape, error))
+    maker.sf_maps, maker.sf_uncty_maps, maker.eff_maps = {}, {}, {}
+    for jtype in ("real", "pu"):
+        for wp in ("loose", "medium", "tight"):
+            maker.sf_maps["%s_%s" % (jtype, wp)] = mapOf(0.9, 0.05)
+            maker.sf_uncty_maps["%s_%s_uncty" % (jtype, wp)] = mapOf(0.02)
+            effMap = mapOf(0.)
+            effMap.contents[1, 1:-1] = eff
+            maker.eff_maps["%s_mc_%s" % (jtype, wp)] = effMap
+    maker.sf_arrays, maker.sf_uncty_arrays, maker.eff_arrays = maker.sf_maps, maker.sf_uncty_maps, maker.eff_maps
+    maker.batchSize = 0
+    maker.out = Output()
+    return maker
+
+
+def test_batched_weights_match_per_jet_on_edge_bins(jetSFMaker, monkeypatch):
+    # efficiencies 0, 0.5 and 1 (where the inefficiency weight is undefined)
+    maker = makeMaker(jetSFMaker, [0., 0.5, 1.])
+    pt = np.array([35., 35., 35., 35., 35., 35., 60.])
+    eta = np.array([-4., 0., 4., 4., 0., 4., 4.])
+    genJetIdx = np.array([0, 0, 0, -1, -1, -1, 0])
+    puId = np.array([0, 0, 0, 0, 7, 7, 0])
+    jets = [types.SimpleNamespace(pt=p, eta=e, genJetIdx=g, puId=i) for p, e, g, i in zip(pt, eta, genJetIdx, puId)]
+    monkeypatch.setattr(jetSFMaker, "cachedCollection", lambda event, name: jets)
+
+    maker.analyze(None)
+    batched = maker.get_weights(pt, eta, genJetIdx, puId)
+
+    assert sorted(batched) == sorted(maker.out.branches)
+    for name, weights in batched.items():
+        assert np.all(np.isfinite(weights)), name
+        np.testing.assert_allclose(weights, maker.out.branches[name], err_msg=name)
+    # failing jets: (1 - sf*eff)/(1 - eff), and 1 where eff is 1
+    np.testing.assert_allclose(batched["Jet_PUIDSF_loose"][:3], [1., (1. - 0.9 * 0.5) / 0.5, 1.])
@@ -0,0 +1,34 @@
+import os
+import json
+
+from blockCache import BlockCache, LocalSource
+from lumiMask import lfnOf
+
+URL = "root://cmseos.fnal.gov//store/user/me/a.root"
+
+
+def test_read_evict_and_locks(tmpdir):
+    data = os.urandom(10 * 1000)
+    tmpdir.mkdir("server").mkdir("store").mkdir("user").mkdir("me").join("a.root").write(data, mode="wb")
+    cacheDir = tmpdir.join("cache")
+    cache = BlockCache(str(cacheDir), maxBytes=4000, source=LocalSource(str(tmpdir.join("server"))), blockSize=1000)
+
+    assert cache.read(URL, 1500, 2000) == data[1500:3500]
+    assert cache.read(URL, 2000, 500) == data[2000:2500]
+    assert cache.stats["misses"] == 3 and cache.stats["hits"] == 1
+    # the lock of a block is removed once it is fetched
+    assert cacheDir.join("locks").listdir() == [cacheDir.join("locks", "cache.lock")]
+
+    cache.materialize(URL, str(tmpdir.join("a.root")))
+    assert tmpdir.join("a.root").read(mode="rb") == data
+    # evicted down to 90% of maxBytes once above it
+    stored = sum(f.size() for f in cacheDir.join("blocks").visit(lambda f: f.isfile()))
+    assert stored <= 4000 and cache.stats["evictedBlocks"] > 0
+    assert json.loads(cacheDir.join("usage.json").read())["bytes"] == stored
+
+
+def test_lfn_of():
+    assert lfnOf(URL) == "/store/user/me/a.root"
+    assert lfnOf("root://cms-xrd-global.cern.ch//eos/uscms/store/user/me/a.root") == "/store/user/me/a.root"
+    assert lfnOf("root://server//data/a.root") == "root://server//data/a.root"
+    assert lfnOf("a.root") == os.path.abspath("a.root")
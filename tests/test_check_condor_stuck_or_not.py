@@ -0,0 +1,50 @@
+import os
+import sys
+import json
+import subprocess
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JOBS = ["schedd1.fnal.gov#1234.0#1596000000", "schedd2.fnal.gov#1234.0#1596000100"]
+# condor_q, condor_tail and condor_rm stubs; condor_tail prints tails/<schedd>_<job id>
+CONDOR_Q = "import sys\nprint('\\n'.join(%r))\n" % JOBS
+CONDOR_TAIL = ("import sys, os\n"
+               "args = sys.argv[1:]\n"
+               "sys.stdout.write(open(os.path.join('tails', args[args.index('-name') + 1] + '_' + args[2])).read())\n")
+CONDOR_RM = "import sys\nopen('removed.txt', 'a').write(' '.join(sys.argv[1:]) + '\\n')\n"
+
+
+def stub(tmpdir, name, code):
+    script = tmpdir.join(name)
+    script.write("#!%s\n%s" % (sys.executable, code))
+    script.chmod(0o755)
+    return str(script)
+
+
+def monitor(tmpdir):
+    subprocess.check_call([sys.executable, os.path.join(REPO, "check_condor_stuck_or_not.py"), "-u", "me", "--workers", "2",
+                           "--condorQ", stub(tmpdir, "condor_q", CONDOR_Q),
+                           "--condorTail", stub(tmpdir, "condor_tail", CONDOR_TAIL),
+                           "--condorRm", stub(tmpdir, "condor_rm", CONDOR_RM)], cwd=str(tmpdir))
+    with open(str(tmpdir.join("condor_monitor_state.json"))) as src:
+        return json.load(src)
+
+
+def test_sweeps(tmpdir):
+    tmpdir.mkdir("Utils").mkdir("python_utils").join("color_style.py").write(
+        "class style(object):\n    RED = GREEN = RESET = ''\n")
+    tails = tmpdir.mkdir("tails")
+    tails.join("schedd1.fnal.gov_1234.0").write("Processed 5000/10000 entries\n")
+    tails.join("schedd2.fnal.gov_1234.0").write("Processed 100/200 entries\n")
+    states = monitor(tmpdir)
+    assert sorted(states) == sorted(JOBS)
+    assert states[JOBS[0]]["events"] == 5000 and states[JOBS[1]]["events"] == 100
+
+    # the first job went on with its second input file, the second one hit a read error
+    tails.join("schedd1.fnal.gov_1234.0").write("Processed 5000/10000 entries\nProcessed 10000/10000 entries\n"
+                                                "Processed 2000/8000 entries\n")
+    tails.join("schedd2.fnal.gov_1234.0").write("Processed 100/200 entries\nError in <TNetXNGFile::ReadBuffer>: x\n")
+    states = monitor(tmpdir)
+    assert states[JOBS[0]]["events"] == 12000 and states[JOBS[0]]["files"] == 2
+    assert states[JOBS[0]]["rate"] > 0
+    assert JOBS[1] not in states
+    assert tmpdir.join("removed.txt").read() == "1234.0 -name schedd2.fnal.gov\n"
@@ -0,0 +1,19 @@
+import os
+
+import condorDag
+
+
+def test_merge_node_lists_only_given_outputs(tmpdir):
+    submitDir = str(tmpdir.join("submit"))
+    dag = condorDag.CondorDag(str(tmpdir.join("jobs.dag")), "run.sh", "tarball.tgz", str(tmpdir), "/store/user/x",
+                              submitDir, mergeExecutable="run_merge.sh")
+    outputs = ["root://cmseos.fnal.gov//store/user/x/out/a_SkimHadd.root",
+               "root://cmseos.fnal.gov//store/user/x/out/b_SkimHadd.root"]
+    dag.addSample("DY_0", ["a.txt", "b.txt"], "/store/user/x/out", outputs)
+    with open(os.path.join(submitDir, "DY_0_merge.txt")) as src:
+        assert src.read().split() == outputs
+    with open(os.path.join(submitDir, "DY_0_merge.sub")) as src:
+        submit = src.read()
+    assert "Transfer_Input_Files = %s\n" % os.path.join(submitDir, "DY_0_merge.txt") in submit
+    assert "Arguments = /store/user/x/out DY_0 /store/user/x DY_0_merge.txt\n" in submit
+    assert "PARENT DY_0 CHILD DY_0_merge" in dag.lines
@@ -0,0 +1,68 @@
+import os
+import sys
+import subprocess
+
+import condor_resubmit
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEADER = "Executable = sub.sh\nUniverse = vanilla\nx509userproxy = $ENV(X509_USER_PROXY)\n"
+JOB = ("Output = logs/S_$(Process).stdout\nError  = logs/S_$(Process).stdout\nLog  = logs/S_$(Process).log\n"
+       "Transfer_Input_Files = a.txt, lists/S_%d.txt\nArguments = S_%d.txt /eos/out  /eos\nQueue \n")
+OK = "Processed 100 preselected entries from root://x\n"
+
+
+def resubmit(tmpdir, jdl, number):
+    return subprocess.check_output([sys.executable, os.path.join(REPO, "condor_resubmit.py"), "-j", jdl, "-r", number,
+                                    "--workers", "1"], cwd=str(tmpdir)).decode()
+
+
+def test_parse_jdl(tmpdir):
+    tmpdir.join("sub.jdl").write(HEADER + JOB % (0, 0) + JOB % (1, 1))
+    header, jobs = condor_resubmit.parseJdl(str(tmpdir.join("sub.jdl")))
+    assert "".join(header) == HEADER
+    assert [job["procId"] for job in jobs] == [0, 1]
+    assert condor_resubmit.jobFiles(jobs[1]) == ["logs/S_1.stdout", "logs/S_1.log"]
+
+
+def test_single_job_jdl_keeps_job_settings(tmpdir):
+    tmpdir.join("one.jdl").write(HEADER + JOB % (5, 5))
+    header, jobs = condor_resubmit.parseJdl(str(tmpdir.join("one.jdl")))
+    assert "".join(header) == HEADER
+    assert len(jobs) == 1 and condor_resubmit.jobFiles(jobs[0])[0] == "logs/S_0.stdout"
+
+
+def test_resubmit_chain(tmpdir):
+    tmpdir.mkdir("logs")
+    tmpdir.join("sub.jdl").write(HEADER + JOB % (0, 0) + JOB % (1, 1))
+    tmpdir.join("logs", "S_0.stdout").write(OK)
+    tmpdir.join("logs", "S_1.stdout").write("Error in <TNetXNGFile::Open>: [ERROR] Server responded with an error\n")
+    resubmit(tmpdir, "sub.jdl", "2")
+    second = tmpdir.join("sub_resubmit_2.jdl").read()
+    assert second.count("Queue") == 1 and "S_1.txt" in second and "S_0.txt" not in second
+    assert "logs/S_1_$(Process)_resubmit_2.stdout" in second
+
+    # the resubmitted job fails again: it is found from the single-job jdl
+    tmpdir.join("logs", "S_1_0_resubmit_2.stdout").write("Traceback\n")
+    tmpdir.join("logs", "S_1_0_resubmit_2.log").write("005 Job terminated.\n\t(1) Normal termination (return value 1)\n")
+    output = resubmit(tmpdir, "sub_resubmit_2.jdl", "3")
+    assert "ProcId 0: exit-1" in output
+    third = tmpdir.join("sub_resubmit_3.jdl").read()
+    assert third.count("Queue") == 1 and "logs/S_1_$(Process)_resubmit_3.stdout" in third
+
+    # and succeeds: no jdl is written
+    tmpdir.join("logs", "S_1_0_resubmit_3.stdout").write(OK)
+    output = resubmit(tmpdir, "sub_resubmit_3.jdl", "4")
+    assert "nothing to resubmit" in output and not tmpdir.join("sub_resubmit_4.jdl").exists()
+
+
+def test_classify_last_submission(tmpdir):
+    aborted = ("000 (12.000.000) 10/18 10:00:00 Job submitted from host: <1.2.3.4>\n...\n"
+               "009 (12.000.000) 10/18 10:05:00 Job was aborted.\n...\n")
+    retried = ("000 (13.000.000) 10/18 11:00:00 Job submitted from host: <1.2.3.4>\n...\n"
+               "005 (13.000.000) 10/18 11:30:00 Job terminated.\n\t(1) Normal termination (return value 0)\n...\n")
+    tmpdir.join("S_0.stdout").write(OK)
+    tmpdir.join("S_0.log").write(aborted + retried)
+    files = [str(tmpdir.join("S_0.stdout")), str(tmpdir.join("S_0.log"))]
+    assert condor_resubmit.classify(files) == "ok"
+    tmpdir.join("S_0.log").write(retried + aborted)
+    assert condor_resubmit.classify(files) == "aborted"
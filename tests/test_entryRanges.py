@@ -0,0 +1,24 @@
+from entryRanges import Checkpoint, entryRangeParts
+
+
+def test_entry_range_parts():
+    assert entryRangeParts(10, 35, 10) == [(10, 10), (20, 10), (30, 5)]
+    assert entryRangeParts(10, 35, 0) == [(10, 25)]
+    assert entryRangeParts(10, 10, 0) == []
+
+
+def test_checkpoint_resume(tmpdir):
+    description = {"input": "in.root", "first": 0, "end": 30, "every": 10}
+    fileName = str(tmpdir.join("checkpoint.json"))
+    checkpoint = Checkpoint(fileName, description)
+    assert checkpoint.committedEntry(0) == 0
+    for first in (0, 10):
+        tmpdir.join("part_%d.root" % first).write("x")
+        checkpoint.commit(first, 10, str(tmpdir.join("part_%d.root" % first)))
+
+    resumed = Checkpoint(fileName, description)
+    assert resumed.committedEntry(0) == 20 and resumed.isDone(10) and not resumed.isDone(20)
+    # another job description, or a lost part, ignores what follows
+    assert Checkpoint(fileName, dict(description, every=5)).parts == []
+    tmpdir.join("part_10.root").remove()
+    assert Checkpoint(fileName, description).committedEntry(0) == 10
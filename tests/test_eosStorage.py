@@ -0,0 +1,29 @@
+import eosStorage
+
+DRY_RUN = """
+ProcId=0
+Args = "WWJJ_0.txt /store/user/me/WWJJ/out  /store/user/me"
+ProcId=1
+Args = "WWJJ_1.txt /store/user/me/WWJJ/out  /store/user/me"
+ProcId=2
+Args = "WWJJ_2.txt /store/user/me/WWJJ/out  /store/user/me"
+ProcId=3
+Args = "ZZ_0.txt /store/user/me/ZZ/out  /store/user/me"
+"""
+
+
+def test_missing_outputs(tmpdir):
+    tmpdir.join("test_condor").write(DRY_RUN)
+    jobs = [(procId, arguments[1], eosStorage.outputName(arguments[0]))
+            for procId, arguments in eosStorage.parseDryRun(str(tmpdir.join("test_condor")))]
+    assert jobs[0] == (0, "/store/user/me/WWJJ/out", "WWJJ_0_SkimHadd.root")
+
+    # the fake EOS tree: job 0 done, job 1 with an empty output, jobs 2 and 3 without output
+    out = tmpdir.mkdir("eos").mkdir("store").mkdir("user").mkdir("me").mkdir("WWJJ").mkdir("out")
+    out.join("WWJJ_0_SkimHadd.root").write("x" * eosStorage.MIN_OUTPUT_SIZE)
+    out.join("WWJJ_1_SkimHadd.root").write("x")
+    storage = eosStorage.LocalStorage(str(tmpdir.join("eos")))
+    assert [procId for procId, reason in eosStorage.missingOutputs(jobs, storage)] == [2, 3]
+    assert [procId for procId, reason in eosStorage.missingOutputs(jobs, storage, checkSize=True)] == [1, 2, 3]
+    # one listing per output directory
+    assert storage.calls == 4
@@ -0,0 +1,34 @@
+import sys
+import json
+
+from fileListing import FileLister
+
+FILES = [{"file": [{"name": "/store/a.root", "size": 100, "nevents": 10}]},
+         {"file": [{"name": "/store/a.root", "nevents": None}, {"name": "/store/b.root", "size": 200}]}]
+# canned dasgoclient: the answer for /A/B/NANOAODSIM, a failure for anything else; counts its calls
+DASGOCLIENT = """import sys
+open("calls.txt", "a").write("x")
+if sys.argv[-1] != "file dataset=/A/B/NANOAODSIM":
+    sys.exit(1)
+print(%r)
+""" % json.dumps(FILES)
+
+
+def test_dataset_files(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    script = tmpdir.join("dasgoclient")
+    script.write("#!%s\n%s" % (sys.executable, DASGOCLIENT))
+    script.chmod(0o755)
+    lister = FileLister(cacheDir=str(tmpdir.join("cache")), executable=str(script))
+    (files, error), (missing, missingError) = lister.datasetFilesMany(["/A/B/NANOAODSIM", "/C/D/NANOAODSIM"])
+    assert error is None and files == [{"name": "/store/a.root", "size": 100, "nevents": 10},
+                                       {"name": "/store/b.root", "size": 200, "nevents": None}]
+    assert missing is None and missingError.startswith("/C/D/NANOAODSIM")
+
+    # from the cache, until invalidated
+    assert lister.datasetFiles("/A/B/NANOAODSIM") == files
+    assert tmpdir.join("calls.txt").read() == "xx"
+    assert lister.invalidate("/A/B/NANOAODSIM") == 1
+    lister.datasetFiles("/A/B/NANOAODSIM")
+    assert tmpdir.join("calls.txt").read() == "xxx"
+    assert lister.report() == "Listings: 1 from cache, 2 queried, 1 failed"
@@ -0,0 +1,72 @@
+import pytest
+
+import eosStorage
+import jobManifest
+
+
+def test_local_imports(tmpdir):
+    tmpdir.join("post_proc.py").write(
+        "import os, sys\n"
+        "from %s.H4Lmodule import H4L\n"
+        "from helper import f\n"
+        "def main():\n"
+        "    import notInstalledOptional\n" % jobManifest.ANALYSIS_PACKAGE)
+    tmpdir.join("H4Lmodule.py").write("import H4LCppModule\n")
+    tmpdir.join("H4LCppModule.py").write("")
+    tmpdir.join("helper.py").write("")
+    files = jobManifest.localImports(str(tmpdir.join("post_proc.py")))
+    assert sorted(f.split("/")[-1] for f in files) == ["H4LCppModule.py", "H4Lmodule.py", "helper.py", "post_proc.py"]
+
+
+def test_local_imports_missing_module(tmpdir):
+    tmpdir.join("post_proc.py").write("from %s.H4Lmodule import H4L\n" % jobManifest.ANALYSIS_PACKAGE)
+    with pytest.raises(ImportError):
+        jobManifest.localImports(str(tmpdir.join("post_proc.py")))
+
+
+def test_config_hash_data_files(tmpdir):
+    tmpdir.mkdir("data").join("JetPUID_cfg.py").write("a = 1\n")
+    files = jobManifest.dataFiles(str(tmpdir.join("data")))
+    before = jobManifest.configHash(files, "-y 2018")
+    tmpdir.join("data", "JetPUID_cfg.py").write("a = 2\n")
+    assert jobManifest.configHash(files, "-y 2018") != before
+
+
+def test_manifest(tmpdir):
+    storage = eosStorage.LocalStorage(str(tmpdir.join("eos")))
+    manifest = jobManifest.JobManifest(str(tmpdir.join("manifest.json")), storage, redirector="")
+    outputDir = manifest.outputDirectory("/A/B/NANOAODSIM", "/store/A/200101_000000")
+    key = jobManifest.jobKey(["/store/f1.root"], "config")
+    assert not manifest.isValid(key)
+    manifest.record(key, ["/store/f1.root"], outputDir + "/A_0_SkimHadd.root")
+    storage.makedirs(outputDir)
+    tmpdir.join("eos", outputDir, "A_0_SkimHadd.root").write("x" * eosStorage.MIN_OUTPUT_SIZE, ensure=True)
+    manifest.save()
+
+    manifest = jobManifest.JobManifest(str(tmpdir.join("manifest.json")), storage, redirector="")
+    assert manifest.outputDirectory("/A/B/NANOAODSIM", "/store/A/200202_000000") == outputDir
+    assert manifest.isValid(key)
+    assert not manifest.isValid(jobManifest.jobKey(["/store/f1.root"], "other config"))
+
+
+def test_superseded_outputs(tmpdir):
+    storage = eosStorage.LocalStorage(str(tmpdir.join("eos")))
+    manifest = jobManifest.JobManifest(str(tmpdir.join("manifest.json")), storage, redirector="")
+    outputDir = "/store/A/200101_000000"
+    storage.makedirs(outputDir)
+    keys = []
+    for inputs in (["/store/f1.root"], ["/store/f2.root", "/store/f3.root"]):
+        key = jobManifest.jobKey(inputs, "config")
+        manifest.record(key, inputs, "%s/%s_SkimHadd.root" % (outputDir, key[:12]))
+        tmpdir.join("eos", outputDir, "%s_SkimHadd.root" % key[:12]).write("x")
+        keys.append(key)
+    assert manifest.setPlanned("/A/B/NANOAODSIM", keys) == []
+    manifest.save()
+
+    manifest = jobManifest.JobManifest(str(tmpdir.join("manifest.json")), storage, redirector="")
+    assert manifest.plannedInputs("/A/B/NANOAODSIM") == [["/store/f1.root"], ["/store/f2.root", "/store/f3.root"]]
+    # f3 is gone: its job is superseded, its output moved aside
+    superseded = manifest.setPlanned("/A/B/NANOAODSIM", keys[:1] + [jobManifest.jobKey(["/store/f2.root"], "config")])
+    assert superseded == ["%s/%s_SkimHadd.root" % (outputDir, keys[1][:12])]
+    assert storage.move(superseded, outputDir + "/superseded") == 1
+    assert sorted(storage.listSizes(outputDir)) == ["%s_SkimHadd.root" % keys[0][:12]]
@@ -0,0 +1,61 @@
+import os
+
+import jobPlanner
+
+
+def files(counts, sizes=None):
+    sizes = sizes or [None] * len(counts)
+    return [{"name": "/store/f%d.root" % i, "nevents": n, "size": s} for i, (n, s) in enumerate(zip(counts, sizes))]
+
+
+def test_packs_into_budget():
+    jobs = jobPlanner.planJobs(files([400, 300, 300, 200, 100, 100]), 700)
+    assert sorted(f["name"] for job in jobs for f in job) == sorted(f["name"] for f in files([0] * 6))
+    assert len(jobs) == 2
+    assert all(jobPlanner.jobEvents(job) <= 700 for job in jobs)
+
+
+def test_big_file_gets_own_job():
+    jobs = jobPlanner.planJobs(files([5000, 10, 10]), 1000)
+    assert [jobPlanner.jobEvents(job) for job in jobs] == [5000, 20]
+
+
+def test_no_counts_one_job_per_file():
+    # eos listings have no event counts: never pack them together
+    jobs = jobPlanner.planJobs(files([None] * 5), 1000)
+    assert len(jobs) == 5
+
+
+def test_unknown_count_estimated_from_size():
+    jobs = jobPlanner.planJobs(files([100, None], [1000, 50000]), 1000)
+    estimated = [f for job in jobs for f in job if f.get("estimated")]
+    assert estimated[0]["nevents"] == 5000
+    assert len(jobs) == 2
+
+
+def test_zero_budget_one_job_per_file():
+    assert len(jobPlanner.planJobs(files([10, 20, 30]), 0)) == 3
+
+
+def test_write_job_lists(tmpdir):
+    jobs = jobPlanner.planJobs(files([10, 20]), 100)
+    paths = jobPlanner.writeJobLists(jobs, str(tmpdir), "S", "root://xrd/")
+    assert [os.path.basename(p) for p in paths] == ["S_0.txt"]
+    with open(paths[0]) as src:
+        assert src.read().split() == ["root://xrd//store/f0.root", "root://xrd//store/f1.root"]
+
+
+def test_previous_jobs_kept():
+    listing = files([300] * 20)
+    jobs = jobPlanner.planJobs(listing, 1000)
+    previous = [[f["name"] for f in job] for job in jobs]
+    added = listing + [{"name": "/store/new.root", "nevents": 300, "size": None}]
+    # a new file, or another budget, leaves the earlier jobs as they are
+    for budget in (1000, 2000):
+        again = jobPlanner.planJobs(added, budget, previous)
+        assert [[f["name"] for f in job] for job in again[:len(jobs)]] == previous
+        assert [[f["name"] for f in job] for job in again[len(jobs):]] == [["/store/new.root"]]
+    # the jobs of a file gone from the listing are packed again
+    again = jobPlanner.planJobs(listing[1:], 1000, previous)
+    assert [[f["name"] for f in job] for job in again[:len(jobs) - 1]] == previous[1:]
+    assert sorted(f["name"] for job in again for f in job) == sorted(f["name"] for f in listing[1:])
@@ -0,0 +1,23 @@
+import json
+
+import numpy as np
+
+from lumiMask import LumiMask
+
+GOLDEN = {"297050": [[12, 137], [193, 776]], "297056": [[12, 203]], "297057": [[1, 4], [5, 10]]}
+
+
+def test_lumi_mask(tmpdir):
+    tmpdir.join("golden.json").write(json.dumps(GOLDEN))
+    cacheDir = str(tmpdir.join("cache"))
+    for cached in (False, True):
+        mask = LumiMask(str(tmpdir.join("golden.json")), cacheDir)
+        assert len(tmpdir.join("cache").listdir()) == 1
+        run = np.array([297050, 297050, 297050, 297056, 297057, 297057, 1])
+        lumi = np.array([12, 150, 776, 204, 5, 11, 1])
+        expected = [True, False, True, False, True, False, False]
+        assert mask.mask(run, lumi).tolist() == expected
+        assert [mask.isCertified(r, l) for r, l in zip(run, lumi)] == expected
+    # adjacent intervals are merged
+    assert mask.runsAndLumis()["297057"] == [[1, 10]]
+    assert mask.hasRun(297056) and not mask.hasRun(297058)
@@ -0,0 +1,24 @@
+import streamMerge
+
+
+def test_close_reports_dead_merge_process(tmpdir, monkeypatch):
+    monkeypatch.setattr(streamMerge, "POLL_SECONDS", 0.1)
+    merger = streamMerge.StreamingMerger(str(tmpdir.join("merged.root")))
+    merger._process.terminate()
+    merger._process.join()
+    stats = merger.close()
+    assert stats["files"] == 0
+    assert stats["errors"] and stats["errors"][0].startswith("merge process died")
+
+
+def test_close_reports_merge_errors(tmpdir):
+    merger = streamMerge.StreamingMerger(str(tmpdir.join("merged.root")))
+    merger.add(str(tmpdir.join("missing.root")))
+    stats = merger.close()
+    assert stats["errors"]
+    assert streamMerge.StreamingMerger.report(stats).startswith("Merged 0 file(s)")
+
+
+def test_compression_settings():
+    assert streamMerge.compressionSettings("LZMA:9") == 209
+    assert streamMerge.compressionSettings("zstd:4") == 504
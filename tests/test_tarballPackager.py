@@ -0,0 +1,50 @@
+import os
+import tarfile
+
+import pytest
+
+import tarballPackager
+
+ANALYSIS = "src/PhysicsTools/NanoAODTools/python/postprocessing/analysis/nanoAOD_vvVBS"
+INPUTS = [ANALYSIS + "/data/PUID_80XTraining_EffSFandUncties.root",
+          ANALYSIS + "/data/JetPUID_cfg.py",
+          "src/PhysicsTools/NanoAODTools/python/postprocessing/data/pileup/PileupData_GoldenJSON_Full2016.root",
+          "src/PhysicsTools/NanoAODTools/data/jme/Summer16_07Aug2017_V11_MC.tgz",
+          ANALYSIS + "/post_proc.py"]
+OUTPUTS = [ANALYSIS + "/skimmed_nano.root", ANALYSIS + "/CMSSW_10_6_14.tgz", "tmp/slc7/obj.o",
+           ANALYSIS + "/condor_logs/x.stdout"]
+
+
+@pytest.fixture
+def area(tmpdir):
+    top = tmpdir.join("CMSSW_10_6_14")
+    for relPath in INPUTS + OUTPUTS:
+        top.join(relPath).write("x", ensure=True)
+    return str(top)
+
+
+def test_data_inputs_packed_outputs_excluded(area, tmpdir):
+    entries = tarballPackager.listArea(area)
+    assert all(relPath in entries for relPath in INPUTS)
+    assert not any(relPath in entries for relPath in OUTPUTS)
+    assert tarballPackager.missingRequired(area, entries) == []
+
+    tarballName = str(tmpdir.join("CMSSW_10_6_14.tgz"))
+    tarballPackager.buildTarball(area, entries, tarballName)
+    with tarfile.open(tarballName) as tar:
+        names = tar.getnames()
+    assert all("CMSSW_10_6_14/" + relPath in names for relPath in INPUTS)
+
+
+def test_excluded_required_file_fails(area, tmpdir):
+    with pytest.raises(RuntimeError):
+        tarballPackager.packageArea(area, str(tmpdir.join("t.tgz")), excludePatterns=("*.root",))
+
+
+def test_unchanged_area_not_rebuilt(area, tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    assert tarballPackager.packageArea(area, "t.tgz")["rebuilt"]
+    assert not tarballPackager.packageArea(area, "t.tgz")["rebuilt"]
+    with open(os.path.join(area, INPUTS[1]), "a") as out:
+        out.write("changed")
+    assert tarballPackager.packageArea(area, "t.tgz")["rebuilt"]
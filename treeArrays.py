@@ -0,0 +1,137 @@
+"""Read blocks of TTree entries as NumPy arrays.
+
+The values are extracted with `TTree::Draw(..., "goff")`, so no Python code
+runs per event. Jagged branches are returned flat, together with the
+per-event counter (`nJet`, `nMuon`, ...) that is used to build the offsets.
+
+For a tree read by the event loop (`eventLoop=True`), the Draw runs on a
+second handle of the tree, opened from its file: drawing on the tree of the
+event loop would move its read entry and overwrite the branch buffers of the
+event being processed. Modules close that handle in endFile
+(`closeDrawTree`). Trees no event loop reads (e.g. the LuminosityBlocks tree
+of the lumi pre-filter) are drawn on directly, without opening the file again.
+"""
+import numpy as np
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+
+def _bufferToNumpy(buf, size, dtype):
+    """Copy the first `size` values of a `TTree::GetV*` buffer."""
+    if size == 0:
+        return np.zeros(0, dtype=dtype)
+    try:
+        buf.SetSize(size)           # PyROOT buffer
+    except AttributeError:
+        buf.reshape((size,))        # cppyy LowLevelView
+    return np.frombuffer(buf, dtype=np.float64, count=size).astype(dtype)
+
+
+# (file name, tree path, TFile, TTree) of the second handle; one file open at a time
+_drawHandle = [None, None, None, None]
+
+
+def _drawTree(tree):
+    """`tree` opened again from its file, or None for a tree not read from a file."""
+    rootFile = tree.GetCurrentFile()
+    if not rootFile or tree.InheritsFrom("TChain"):
+        return None
+    directory = tree.GetDirectory().GetPath().split(":", 1)[-1].strip("/")
+    path = directory + "/" + tree.GetName() if directory else tree.GetName()
+    if _drawHandle[:2] != [rootFile.GetName(), path]:
+        if _drawHandle[2]:
+            _drawHandle[2].Close()
+        drawFile = ROOT.TFile.Open(rootFile.GetName())
+        drawTree = drawFile.Get(path) if drawFile and not drawFile.IsZombie() else None
+        if not drawTree:
+            raise RuntimeError("Cannot open %s of %s again" % (path, rootFile.GetName()))
+        _drawHandle[:] = [rootFile.GetName(), path, drawFile, drawTree]
+    return _drawHandle[3]
+
+
+def closeDrawTree():
+    """Close the second handle opened for the event loop tree, if any."""
+    if _drawHandle[2]:
+        _drawHandle[2].Close()
+    _drawHandle[:] = [None, None, None, None]
+
+
+def drawArrays(tree, expressions, first, nEntries, dtypes=None, maxRows=None, eventLoop=True):
+    """Evaluate up to four expressions sharing the same dimension.
+
+    Arguments:
+        tree {TTree} -- input tree
+        expressions {list} -- branch names or formulas, e.g. ['Jet_pt', 'Jet_eta']
+        first {int} -- first entry of the block
+        nEntries {int} -- number of entries in the block
+        maxRows {int} -- upper bound on the number of values (objects) drawn
+        eventLoop {bool} -- whether the event loop reads `tree` (draw on a second handle)
+
+    Returns:
+        list -- one flat numpy array per expression
+    """
+    if len(expressions) > 4:
+        raise ValueError("TTree::Draw can evaluate at most four expressions at once")
+    if dtypes is None:
+        dtypes = [np.float64] * len(expressions)
+
+    drawTree = _drawTree(tree) if eventLoop else None
+    readEntry = tree.GetReadEntry()
+    if drawTree is not None:
+        tree = drawTree
+    # Draw must see raw tree entries, not the positions inside a skim entry list
+    entryList = tree.GetEntryList()
+    if entryList:
+        tree.SetEntryList(ROOT.MakeNullPointer(ROOT.TEntryList))
+    estimate = tree.GetEstimate()
+    tree.SetEstimate((maxRows if maxRows is not None else nEntries) + 1)
+    try:
+        rows = tree.Draw(":".join(expressions), "", "goff", nEntries, first)
+        if rows < 0:
+            raise RuntimeError("TTree::Draw failed for %s" % ":".join(expressions))
+        getters = [tree.GetV1, tree.GetV2, tree.GetV3, tree.GetV4]
+        arrays = [_bufferToNumpy(getters[i](), rows, dtypes[i]) for i in range(len(expressions))]
+    finally:
+        tree.SetEstimate(estimate)
+        if entryList:
+            tree.SetEntryList(entryList)
+        if eventLoop and drawTree is None and readEntry >= 0:
+            # drawn on the tree of the event loop: read its current entry again
+            tree.GetEntry(readEntry)
+    return arrays
+
+
+def readCounts(tree, counter, first, nEntries):
+    """Per-event multiplicities of a collection, e.g. `nJet`."""
+    return drawArrays(tree, [counter], first, nEntries, [np.int64])[0]
+
+
+def readCollection(tree, prefix, fields, first, nEntries, dtypes=None):
+    """Read `<prefix>_<field>` for a block of entries.
+
+    Returns:
+        tuple -- (counts, {field: flat array}); entries without objects
+                 contribute nothing to the flat arrays.
+    """
+    counts = readCounts(tree, 'n' + prefix, first, nEntries)
+    if dtypes is None:
+        dtypes = [np.float64] * len(fields)
+    values = {}
+    nObjects = int(counts.sum())
+    for i in range(0, len(fields), 4):
+        chunk = fields[i:i + 4]
+        if nObjects == 0:
+            arrays = [np.zeros(0, dtype=dt) for dt in dtypes[i:i + 4]]
+        else:
+            arrays = drawArrays(tree, ['%s_%s' % (prefix, f) for f in chunk], first, nEntries, dtypes[i:i + 4], nObjects)
+        for field, array in zip(chunk, arrays):
+            if len(array) != nObjects:
+                raise RuntimeError("Read %d values for %s_%s, expected %d" % (len(array), prefix, field, nObjects))
+            values[field] = array
+    return counts, values
+
+
+def countPerEvent(counts, passed):
+    """Number of objects per event that satisfy the per-object mask `passed`."""
+    eventIndex = np.repeat(np.arange(len(counts)), counts)
+    return np.bincount(eventIndex, weights=passed, minlength=len(counts)).astype(np.int64)
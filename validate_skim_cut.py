@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""Check that the compiled skim preselection selects the same events as the Python module.
+
+The entry list built from the TTreeFormula (`wvSkimCut`) is compared entry by
+entry with `wvAnalysisProducer.analyze`, which is the reference. Run it after
+changing either of the two:
+
+    python validate_skim_cut.py -i input_nano.root -n 100000
+
+With --batchSize, the columnar skim (`wvAnalysisProducer(batchSize)`) is also
+compared with the per-event one, both run on the same events in one loop, so
+that the block reads of the batched module are checked not to change the
+event the per-event module reads.
+"""
+import argparse
+
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+from PhysicsTools.NanoAODTools.postprocessing.framework.datamodel import Event
+from PhysicsTools.NanoAODTools.postprocessing.framework.treeReaderArrayTools import InputTree
+
+from wvAnalysisModule import wvAnalysisProducer, wvSkimCut
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--inputFile", required=True, type=str, help="NanoAOD file")
+    parser.add_argument("-n", "--entries", default=0, type=int, help="Entries to check, 0 for all")
+    parser.add_argument("--first", default=0, type=int, help="First entry to check")
+    parser.add_argument("--cut", default=wvSkimCut, type=str, help="Selection to validate")
+    parser.add_argument("--batchSize", default=0, type=int, help="Also compare the batched module, with blocks of this size")
+    return parser.parse_args()
+
+
+def cutEntries(tree, cut, first, nEntries):
+    """Set of the entries in [first, first + nEntries) passing `cut`."""
+    tree.Draw(">>skimCutEntries", cut, "entrylist", nEntries, first)
+    entryList = ROOT.gDirectory.Get("skimCutEntries")
+    return set(entryList.GetEntry(i) for i in range(entryList.GetN()))
+
+
+def moduleEntries(tree, first, nEntries):
+    """Set of the entries in [first, first + nEntries) accepted by wvAnalysisProducer."""
+    module = wvAnalysisProducer()
+    inputTree = InputTree(tree)
+    return set(entry for entry in range(first, first + nEntries) if module.analyze(Event(inputTree, entry)))
+
+
+def batchMismatches(tree, first, nEntries, batchSize):
+    """Entries in [first, first + nEntries) where the batched and the per-event module disagree."""
+    reference = wvAnalysisProducer()
+    batched = wvAnalysisProducer(batchSize=batchSize)
+    inputTree = InputTree(tree)
+    batched.beginFile(None, None, inputTree, None)
+    mismatches = []
+    for entry in range(first, first + nEntries):
+        event = Event(inputTree, entry)
+        # the batched module first: a block read must leave the event unchanged for the next one
+        if bool(batched.analyze(event)) != bool(reference.analyze(event)):
+            mismatches.append(entry)
+    batched.endFile(None, None, inputTree, None)
+    return mismatches
+
+
+def main():
+    args = parse_arguments()
+    inFile = ROOT.TFile.Open(args.inputFile)
+    tree = inFile.Get("Events")
+    nEntries = tree.GetEntries() - args.first
+    if args.entries > 0:
+        nEntries = min(nEntries, args.entries)
+
+    fromCut = cutEntries(tree, args.cut, args.first, nEntries)
+    fromModule = moduleEntries(tree, args.first, nEntries)
+    onlyCut = sorted(fromCut - fromModule)
+    onlyModule = sorted(fromModule - fromCut)
+    print("Checked %d entries: %d pass the module, %d pass the cut" % (nEntries, len(fromModule), len(fromCut)))
+    if onlyCut or onlyModule:
+        print("MISMATCH: %d entries pass only the cut (first: %s), %d only the module (first: %s)" % (
+            len(onlyCut), onlyCut[:10], len(onlyModule), onlyModule[:10]))
+        exit(1)
+    print("The cut and the module agree.")
+    if args.batchSize > 0:
+        mismatches = batchMismatches(tree, args.first, nEntries, args.batchSize)
+        if mismatches:
+            print("MISMATCH: the batched module differs for %d entries (first: %s)" % (len(mismatches), mismatches[:10]))
+            exit(1)
+        print("The batched and the per-event module agree.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,87 @@
+import numpy as np
 import ROOT
 ROOT.PyConfig.IgnoreCommandLineOptions = True
 
 from PhysicsTools.NanoAODTools.postprocessing.framework.datamodel import Collection 
 from PhysicsTools.NanoAODTools.postprocessing.framework.eventloop import Module
 
+from treeArrays import readCollection, countPerEvent, closeDrawTree
+from collectionCache import cachedCollection
+
+
+def wvSkimMask(muons, electrons, jets, fatJets):
+    """Columnar version of the `wvAnalysisProducer.analyze` selection.
+
+    Each argument is a (counts, fields) pair as returned by
+    `treeArrays.readCollection`, covering the same block of entries.
+
+    Returns:
+        numpy array -- one boolean per entry, True if the event passes
+    """
+    nMuon, mu = muons
+    nElectron, ele = electrons
+    nJet, jet = jets
+    nFatJet, fatjet = fatJets
+
+    eventMuons = countPerEvent(nMuon, (mu['tightId'] != 0) & (mu['pt'] > 10))
+    eventElectrons = countPerEvent(nElectron, (ele['cutBased'] >= 2) & (ele['pt'] > 10))
+    eventJets = countPerEvent(nJet, jet['pt'] > 20)
+    eventFatJets = countPerEvent(nFatJet, fatjet['pt'] > 20)
+
+    return (((eventElectrons >= 1) | (eventMuons >= 1)) &
+            (((eventJets >= 2) & (eventFatJets >= 1)) | ((eventJets >= 4) & (eventFatJets == 0))))
+
+
+# The same selection as a TTreeFormula, for PostProcessor(cut=wvSkimCut): the
+# entry list is then built in C++ before the Python modules run. Keep it in
+# sync with `analyze`, which stays the reference (see validate_skim_cut.py).
+wvSkimCut = ("(Sum$(Muon_tightId && Muon_pt > 10) >= 1 || Sum$(Electron_cutBased >= 2 && Electron_pt > 10) >= 1)"
+             " && ((Sum$(Jet_pt > 20) >= 2 && Sum$(FatJet_pt > 20) >= 1)"
+             " || (Sum$(Jet_pt > 20) >= 4 && Sum$(FatJet_pt > 20) == 0))")
+
+
 class wvAnalysisProducer(Module):
-    def __init__(self):
-        pass
+    def __init__(self, batchSize=0):
+        """
+        Arguments:
+            batchSize {int} -- if > 0, evaluate the skim for blocks of
+                               `batchSize` entries at once with NumPy instead
+                               of looping over the objects of each event.
+        """
+        self.batchSize = batchSize
     def beginJob(self):
         pass
     def endJob(self):
         pass
     def beginFile(self, inputFile, outputFile, inputTree, wrappedOutputTree):
         self.out = wrappedOutputTree
+        self.inputTree = inputTree
+        self._blockFirst = 0
+        self._blockMask = np.zeros(0, dtype=bool)
         #self.out.branch("EventMass",  "F");
         """process event, return True (go to next module) or False (fail, go to next event)"""
         #pass
     def endFile(self, inputFile, outputFile, inputTree, wrappedOutputTree):
-        pass
+        self.inputTree = None
+        self._blockMask = np.zeros(0, dtype=bool)
+        closeDrawTree()
+    def skimBlock(self, first, nEntries):
+        """Evaluate the skim for entries [first, first + nEntries) of the input tree."""
+        tree = self.inputTree
+        return wvSkimMask(readCollection(tree, "Muon", ["tightId", "pt"], first, nEntries),
+                          readCollection(tree, "Electron", ["cutBased", "pt"], first, nEntries),
+                          readCollection(tree, "Jet", ["pt"], first, nEntries),
+                          readCollection(tree, "FatJet", ["pt"], first, nEntries))
+    def analyzeBatch(self, event):
+        """Look up the decision for this event in the mask of the current block,
+        computing the next block when the event falls outside of it."""
+        # the tree entry, independent of any preselection entry list
+        entry = event._tree.GetReadEntry()
+        if not (self._blockFirst <= entry < self._blockFirst + len(self._blockMask)):
+            nEntries = min(self.batchSize, self.inputTree.GetEntries() - entry)
+            self._blockFirst = entry
+            self._blockMask = self.skimBlock(entry, nEntries)
+        return bool(self._blockMask[entry - self._blockFirst])
     def analyze(self, event):
         """nanoAOD skimming is done considering the final events selection
         for the vv semileptonic final state.
@@ -34,10 +98,13 @@ class wvAnalysisProducer(Module):
                        go to the next module else returns false and go to 
                        the next event.
         """
-        electrons = Collection(event, "Electron")
-        muons = Collection(event, "Muon")
-        jets = Collection(event, "Jet")
-        fatJets = Collection(event, "FatJet")
+        if self.batchSize > 0:
+            return self.analyzeBatch(event)
+
+        electrons = cachedCollection(event, "Electron")
+        muons = cachedCollection(event, "Muon")
+        jets = cachedCollection(event, "Jet")
+        fatJets = cachedCollection(event, "FatJet")
         keepIt = True
         eventElectrons = 0
         eventMuons = 0
@@ -65,4 +132,5 @@ class wvAnalysisProducer(Module):
 
 # define modules using the syntax 'name = lambda : constructor' to avoid having them loaded when not needed
 wvAnalysisModule = lambda : wvAnalysisProducer() #(jetSelection= lambda j : j.pt > 30) 
+wvAnalysisModuleBatch = lambda : wvAnalysisProducer(batchSize=10000)
  